@@ -117,6 +117,7 @@ export class ChatStack extends NestedStack implements ChatStackOutputs {
           "mkdir -p /tmp/online_lambda_function_codes",
           `cp -r ${join(__dirname, "../../../lambda/online/*")} /tmp/online_lambda_function_codes`,
           `cp ${join(__dirname, "../../../lambda/job/dep/llm_bot_dep/sm_utils.py")} /tmp/online_lambda_function_codes/`,
+          `cp ${join(__dirname, "../../../lambda/job/dep/llm_bot_dep/sm_invoker.py")} /tmp/online_lambda_function_codes/`,
         ].join(' && ')
         ]
       ),
@@ -23,6 +23,7 @@ export class ChatTablesConstruct extends Construct {
 
   public readonly byUserIdIndex: string = "byUserId";
   public readonly bySessionIdIndex: string = "bySessionId";
+  public readonly bySessionIdCreateTimestampIndex: string = "bySessionIdCreateTimestamp";
   public readonly byTimestampIndex: string = "byTimestamp";
 
   constructor(scope: Construct, id: string) {
@@ -75,6 +76,13 @@ export class ChatTablesConstruct extends Construct {
       indexName: this.bySessionIdIndex,
       partitionKey: { name: "sessionId", type: dynamodb.AttributeType.STRING },
     });
+    // Used to load the latest rounds of a session without reading all of it
+    messagesTable.addGlobalSecondaryIndex({
+      indexName: this.bySessionIdCreateTimestampIndex,
+      partitionKey: { name: "sessionId", type: dynamodb.AttributeType.STRING },
+      sortKey: timestampAttr,
+      projectionType: dynamodb.ProjectionType.ALL,
+    });
 
     const promptTable = new DynamoDBTable(this, "Prompt", groupNameAttr2, sortKeyAttr).table;
     const intentionTable = new DynamoDBTable(this, "Intention", groupNameAttr, intentionIdAttr).table;
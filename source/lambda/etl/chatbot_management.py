@@ -11,7 +11,8 @@ from constant import IndexType, EmbeddingModelType
 from utils.ddb_utils import (
     initiate_chatbot,
     initiate_index,
-    initiate_model
+    initiate_model,
+    touch_chatbot
 )
 
 logger = logging.getLogger()
@@ -359,6 +360,8 @@ def __edit_chatbot(event, group_name):
                 index.get(index_type,{}).get(index_id),
                 update_time
             )
+    # invalidate the chatbot configuration cached by online lambdas
+    touch_chatbot(chatbot_table, group_name, chatbot_id)
 
     # 3.更新index表
     return {
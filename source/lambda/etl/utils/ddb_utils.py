@@ -155,6 +155,20 @@ def initiate_chatbot(
         )
 
 
+def touch_chatbot(chatbot_table, group_name, chatbot_id):
+    """Bump updateTime of the chatbot so that online lambdas drop their cached
+    configuration of it. Call it after all index/model items are written."""
+    chatbot_table.update_item(
+        Key={"groupName": group_name, "chatbotId": chatbot_id},
+        UpdateExpression="SET #updateTime = :updateTime",
+        ConditionExpression="attribute_exists(chatbotId)",
+        ExpressionAttributeNames={"#updateTime": "updateTime"},
+        ExpressionAttributeValues={
+            ":updateTime": str(datetime.now(timezone.utc)),
+        },
+    )
+
+
 def is_chatbot_existed(ddb_table, group_name: str, chatbot_id: str):
     response = ddb_table.get_item(
         Key={
@@ -111,6 +111,9 @@ resp_header = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "*",
 }
+# key of the index mapping _meta the online intention matcher compares to
+# decide whether to reload the intention examples it holds in memory
+INTENTION_VERSION_META_KEY = "intention_version"
 
 
 class OpenSearchIngestionWorker:
@@ -228,6 +231,7 @@ def __delete_execution(event, group_name):
             # delete aos data
             for index in indexes:
                 __delete_documents_by_text_set(index, questions)
+                __update_intention_version(index)
             # delete intention（ddb）
             intention_table.delete_item(
                 Key={
@@ -479,6 +483,18 @@ def __save_2_aos(
         if not index_exists:
             __create_index(index, modelId)
         __refresh_index(index, modelId, qaList)
+    for index_item in index.split(","):
+        __update_intention_version(index_item)
+
+
+def __update_intention_version(index: str):
+    try:
+        aos_client.indices.put_mapping(
+            index=index,
+            body={"_meta": {INTENTION_VERSION_META_KEY: str(time.time_ns())}},
+        )
+    except NotFoundError:
+        logger.info("Index is not existed: %s", index)
 
 
 def __create_index(index: str, modelId: str):
@@ -8,6 +8,7 @@ from .csv import process_csv
 from .html import process_html
 from .json import process_json
 from .jsonl import process_jsonl
+from .loader_input import LoaderInput
 from .pdf import process_pdf
 from .text import process_text
 from .image import process_image
@@ -26,7 +27,27 @@ logger.setLevel(logging.INFO)
 #     return shards
 
 
+# Loaders reading the original file, which get a LoaderInput
+LOADER_INPUT_FILE_TYPES = ["csv", "doc", "pdf", "xlsx", "image"]
+
+
 def cb_process_object(s3, file_type: str, file_content, **kwargs):
+    """
+    Load a file into documents. For the LOADER_INPUT_FILE_TYPES,
+    file_content is the file content as bytes or a LoaderInput, it is read
+    from S3 if empty.
+    """
+    if file_type not in LOADER_INPUT_FILE_TYPES:
+        return _process_object(s3, file_type, file_content, **kwargs)
+
+    loader_input = LoaderInput.wrap(s3, file_content, kwargs["bucket"], kwargs["key"])
+    try:
+        return _process_object(s3, file_type, loader_input, **kwargs)
+    finally:
+        loader_input.remove_local_copy()
+
+
+def _process_object(s3, file_type: str, file_content, **kwargs):
     res = None
     if file_type == "txt":
         res = process_text(file_content, **kwargs)
@@ -35,7 +56,7 @@ def cb_process_object(s3, file_type: str, file_content, **kwargs):
     elif file_type == "html":
         res = process_html(file_content, **kwargs)
     elif file_type == "doc":
-        res = process_doc(s3, **kwargs)
+        res = process_doc(s3, file_content, **kwargs)
     elif file_type == "md":
         res = process_md(file_content, **kwargs)
     elif file_type == "pdf":
@@ -59,8 +80,8 @@ def cb_process_object(s3, file_type: str, file_content, **kwargs):
     elif file_type == "jsonl":
         res = process_jsonl(s3, file_content, **kwargs)
     elif file_type == "xlsx":
-        res = process_xlsx(s3, **kwargs)
+        res = process_xlsx(s3, file_content, **kwargs)
     elif file_type == "image":
         logger.info("process image")
-        res = process_image(s3, **kwargs)
+        res = process_image(s3, file_content, **kwargs)
     return res
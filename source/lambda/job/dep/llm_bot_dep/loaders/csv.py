@@ -1,6 +1,4 @@
 import csv
-import uuid
-from datetime import datetime
 from io import TextIOWrapper
 from typing import Dict, List, Optional, Sequence
 
@@ -8,6 +6,8 @@ from langchain.docstore.document import Document
 from langchain.document_loaders.csv_loader import CSVLoader
 from langchain.document_loaders.helpers import detect_file_encodings
 
+from .loader_input import LoaderInput
+
 
 class CustomCSVLoader(CSVLoader):
     """Load a `CSV` file into a list of Documents.
@@ -160,18 +160,12 @@ class CustomCSVLoader(CSVLoader):
         return docs
 
 
-def process_csv(s3, csv_content: str, **kwargs):
-    now = datetime.now()
-    timestamp_str = now.strftime("%Y%m%d%H%M%S")
-    random_uuid = str(uuid.uuid4())[:8]
-    bucket_name = kwargs["bucket"]
-    key = kwargs["key"]
+def process_csv(s3, csv_content: LoaderInput, **kwargs):
     row_count = kwargs["csv_row_count"]
-    local_path = f"/tmp/csv-{timestamp_str}-{random_uuid}.csv"
-
-    s3.download_file(bucket_name, key, local_path)
     loader = CustomCSVLoader(
-        file_path=local_path, aws_path=f"s3://{bucket_name}/{key}", row_count=row_count
+        file_path=csv_content.local_path(suffix=".csv"),
+        aws_path=csv_content.aws_path,
+        row_count=row_count,
     )
     data = loader.load()
 
@@ -1,6 +1,4 @@
 import logging
-import uuid
-from datetime import datetime
 from typing import List, Optional
 
 import mammoth
@@ -9,6 +7,7 @@ from langchain.docstore.document import Document
 from langchain.document_loaders.base import BaseLoader
 
 from llm_bot_dep.loaders.html import CustomHtmlLoader
+from llm_bot_dep.loaders.loader_input import LoaderInput
 from llm_bot_dep.splitter_utils import MarkdownHeaderTextSplitter
 
 logger = logging.getLogger(__name__)
@@ -80,16 +79,11 @@ class CustomDocLoader(BaseLoader):
         return doc
 
 
-def process_doc(s3, **kwargs):
-    now = datetime.now()
-    timestamp_str = now.strftime("%Y%m%d%H%M%S")
-    random_uuid = str(uuid.uuid4())[:8]
-    bucket_name = kwargs["bucket"]
-    key = kwargs["key"]
-    local_path = f"/tmp/doc-{timestamp_str}-{random_uuid}.docx"
-
-    s3.download_file(bucket_name, key, local_path)
-    loader = CustomDocLoader(file_path=local_path, aws_path=f"s3://{bucket_name}/{key}")
+def process_doc(s3, doc_content: LoaderInput, **kwargs):
+    loader = CustomDocLoader(
+        file_path=doc_content.local_path(suffix=".docx"),
+        aws_path=doc_content.aws_path,
+    )
     doc = loader.load()
     splitter = MarkdownHeaderTextSplitter(kwargs["res_bucket"])
     doc_list = splitter.split_text(doc)
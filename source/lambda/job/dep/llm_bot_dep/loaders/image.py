@@ -1,13 +1,11 @@
 import logging
-import uuid
-from datetime import datetime
 from langchain.docstore.document import Document
 from langchain.document_loaders.base import BaseLoader
 import json
+from llm_bot_dep.loaders.loader_input import LoaderInput
 from llm_bot_dep.splitter_utils import MarkdownHeaderTextSplitter
 import boto3
 import base64
-import os
 
 
 bedrock_client = boto3.client("bedrock-runtime")
@@ -94,22 +92,11 @@ You are a seasoned image analysis expert. Your task is to carefully observe the
         return Document(page_content=response_body["content"][0]["text"], metadata=metadata)
 
 
-def process_image(s3, **kwargs):
-    bucket_name = kwargs["bucket"]
-    key = kwargs["key"]
+def process_image(s3, image_content: LoaderInput, **kwargs):
     file_type = kwargs["image_file_type"]
-    _, file_extension = os.path.splitext(key)
-    
-    now = datetime.now()
-    timestamp_str = now.strftime("%Y%m%d%H%M%S")
-    random_uuid = str(uuid.uuid4())[:8]
-    local_path = f"/tmp/image-{timestamp_str}-{random_uuid}{file_extension}"
-
-    s3.download_file(bucket_name, key, local_path)
-    logger.info("File downloaded to " + local_path)
     loader = CustomImageLoader(
-        file_path=local_path,
-        aws_path=f"s3://{bucket_name}/{key}",
+        file_path=image_content.local_path(),
+        aws_path=image_content.aws_path,
         file_type=file_type
     )
     doc = loader.load()
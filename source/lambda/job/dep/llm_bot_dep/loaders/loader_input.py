@@ -0,0 +1,117 @@
+import logging
+import os
+import shutil
+import tempfile
+from typing import IO, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Objects larger than this are spooled to disk when read from S3
+_MAX_MEMORY_SIZE = 64 * 1024 * 1024
+
+
+class LoaderInput:
+    """
+    Content of an S3 object passed to the loaders, so that the object is read
+    from S3 only once. Loaders which need a file path call local_path(), which
+    writes a local copy on first use and returns the same copy afterwards.
+
+    Args:
+        content: The object content, bytes or a binary file object.
+        bucket: The bucket of the object.
+        key: The key of the object.
+    """
+
+    def __init__(self, content: Union[bytes, IO[bytes]], bucket: str, key: str):
+        self.content = content
+        self.bucket = bucket
+        self.key = key
+        self._local_path = None
+
+    @classmethod
+    def from_s3(cls, s3, bucket: str, key: str) -> "LoaderInput":
+        """Read the object into a spooled temporary file"""
+        buffer = tempfile.SpooledTemporaryFile(max_size=_MAX_MEMORY_SIZE)
+        s3.download_fileobj(bucket, key, buffer)
+        buffer.seek(0)
+        return cls(buffer, bucket, key)
+
+    @classmethod
+    def wrap(cls, s3, file_content, bucket: str, key: str) -> "LoaderInput":
+        """
+        Create the input from the content the caller already read, or read
+        the object from S3 if there is none.
+        """
+        if isinstance(file_content, LoaderInput):
+            return file_content
+        if isinstance(file_content, str):
+            file_content = file_content.encode("utf-8")
+        if not file_content:
+            return cls.from_s3(s3, bucket, key)
+        return cls(file_content, bucket, key)
+
+    @property
+    def aws_path(self) -> str:
+        return f"s3://{self.bucket}/{self.key}"
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.key)[1]
+
+    def read_bytes(self) -> bytes:
+        if isinstance(self.content, bytes):
+            return self.content
+        self.content.seek(0)
+        return self.content.read()
+
+    def local_path(self, suffix: Optional[str] = None) -> str:
+        """
+        Path of a local copy of the content, suffix defaults to the key
+        extension.
+        """
+        if self._local_path is not None:
+            return self._local_path
+        fd, path = tempfile.mkstemp(
+            prefix="loader-", suffix=self.extension if suffix is None else suffix
+        )
+        with os.fdopen(fd, "wb") as local_file:
+            if isinstance(self.content, bytes):
+                local_file.write(self.content)
+            else:
+                self.content.seek(0)
+                shutil.copyfileobj(self.content, local_file)
+        logger.info("Copied %s to %s", self.aws_path, path)
+        self._local_path = path
+        return path
+
+    def remove_local_copy(self):
+        if self._local_path is None:
+            return
+        try:
+            os.remove(self._local_path)
+        except FileNotFoundError:
+            pass
+        self._local_path = None
+
+    def close(self):
+        self.remove_local_copy()
+        if not isinstance(self.content, bytes):
+            self.content.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # sent to the parse worker processes as bytes, without the local copy
+        return {
+            "content": self.read_bytes(),
+            "bucket": self.bucket,
+            "key": self.key,
+            "_local_path": None,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
@@ -1,7 +1,6 @@
 import datetime
 import json
 import logging
-import os
 import re
 import time
 import uuid
@@ -15,6 +14,7 @@ from ..cleaning import remove_duplicate_sections
 from ..splitter_utils import MarkdownHeaderTextSplitter
 from ..storage_utils import _s3_uri_exist
 from .html import CustomHtmlLoader
+from .loader_input import LoaderInput
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -113,7 +113,7 @@ def load_content_from_s3(s3, bucket, key):
     return obj["Body"].read().decode("utf-8")
 
 
-def process_pdf(s3, pdf: bytes, **kwargs):
+def process_pdf(s3, pdf: LoaderInput, **kwargs):
     """
     Process a given PDF file and extracts structured information from it.
 
@@ -121,8 +121,8 @@ def process_pdf(s3, pdf: bytes, **kwargs):
     and structures the information into a list of dictionaries containing headings and content.
 
     Parameters:
-    s3 (boto3.client): The S3 client to use for downloading the PDF file.
-    pdf (bytes): The PDF file to process.
+    s3 (boto3.client): The S3 client to use for the ETL model results.
+    pdf (LoaderInput): The PDF file to process.
     **kwargs: Arbitrary keyword arguments. The function expects 'bucket' and 'key' among the kwargs
               to specify the S3 bucket and key where the PDF file is located.
 
@@ -139,19 +139,14 @@ def process_pdf(s3, pdf: bytes, **kwargs):
     portal_bucket_name = kwargs.get("portal_bucket_name", None)
     # TODO: make it configurable in frontend
     document_language = kwargs.get("document_language", "zh")
-    # Extract file name also in consideration of file name with blank space
-    local_path = str(os.path.basename(key))
-    # Download to local for further processing
-    logger.info(local_path)
-    s3.download_file(Bucket=bucket, Key=key, Filename=local_path)
-    loader = PDFMinerPDFasHTMLLoader(local_path)
-    # Entire PDF is loaded as a single Document
-    file_content = loader.load()[0].page_content
 
     if not etl_model_endpoint or not smr_client or not res_bucket:
         logger.info(
             "No ETL model endpoint or SageMaker Runtime client provided, using default PDF loader..."
         )
+        loader = PDFMinerPDFasHTMLLoader(pdf.local_path(suffix=".pdf"))
+        # Entire PDF is loaded as a single Document
+        file_content = loader.load()[0].page_content
         loader = CustomHtmlLoader(aws_path=f"s3://{bucket}/{key}")
         doc = loader.load(file_content)
         splitter = MarkdownHeaderTextSplitter(res_bucket)
@@ -1,21 +1,23 @@
 import json
-import uuid
 import logging
+import os
 from typing import Iterable, List
-from datetime import datetime
 import pandas as pd
 from langchain.docstore.document import Document
 
+from .loader_input import LoaderInput
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def process_xlsx(s3, **kwargs) -> List[Document]:
+def process_xlsx(s3, xlsx_content: LoaderInput, **kwargs) -> List[Document]:
     """
     Process the Excel file
     We will extract the question and assemble the content in page_content of Document, extract the answer and assemble as extra field in metadata (jsonlAnswer) of Document.
 
+    :param xlsx_content: the Excel file
     :param kwargs: other arguments
     :return: list of Document, e.g.
     [
@@ -25,15 +27,8 @@ def process_xlsx(s3, **kwargs) -> List[Document]:
     ]
     """
     logger.info("Processing xlsx file...")
-    now = datetime.now()
-    timestamp_str = now.strftime("%Y%m%d%H%M%S")
-    random_uuid = str(uuid.uuid4())[:8]
-    bucket_name = kwargs["bucket"]
-    key = kwargs["key"]
     row_count = kwargs["xlsx_row_count"]
-    local_path = f"/tmp/excel-{timestamp_str}-{random_uuid}.xlsx"
-
-    s3.download_file(bucket_name, key, local_path)
+    local_path = xlsx_content.local_path(suffix=".xlsx")
 
     try:
         # load the excel file
@@ -59,7 +54,7 @@ def process_xlsx(s3, **kwargs) -> List[Document]:
                     # assemble the metadata
                     metadata = metadata_template
                     metadata["jsonlAnswer"] = json_obj["answer"]
-                    metadata["file_path"] = f"s3://{bucket_name}/{key}"
+                    metadata["file_path"] = xlsx_content.aws_path
                     logger.info(
                         "question: {}, answer: {}".format(
                             json_obj["question"], json_obj["answer"]
@@ -82,9 +77,10 @@ def process_xlsx(s3, **kwargs) -> List[Document]:
             local_temp_path = local_path.replace('.xlsx', '.csv')
             df.to_csv(local_temp_path, index=None)
             loader = CustomCSVLoader(
-                file_path=local_temp_path, aws_path=f"s3://{bucket_name}/{key}", row_count=row_count
+                file_path=local_temp_path, aws_path=xlsx_content.aws_path, row_count=row_count
             )
             doc_list = loader.load()
+            os.remove(local_temp_path)
     except UnicodeDecodeError as e:
         logger.error(f"Excel file is not utf-8 encoded, error: {e}")
         raise e
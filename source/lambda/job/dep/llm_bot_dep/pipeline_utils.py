@@ -0,0 +1,295 @@
+"""
+Staged pipeline with bounded queues, to overlap the network and CPU bound
+steps of the ingestion
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+_END = object()
+
+
+def _timed_call(fn, item):
+    # top level so that it can be sent to a process pool
+    start = time.perf_counter()
+    result = fn(item)
+    return result, time.perf_counter() - start
+
+
+class StageMetrics:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.queue_depth_sum = 0
+        self.max_queue_depth = 0
+        self.first_start = None
+        self.last_end = None
+
+    def record_input(self, queue_depth: int):
+        if self.first_start is None:
+            self.first_start = time.perf_counter()
+        self.items_in += 1
+        self.queue_depth_sum += queue_depth
+        self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def to_dict(self):
+        wall_time = 0.0
+        if self.first_start is not None and self.last_end is not None:
+            wall_time = self.last_end - self.first_start
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "errors": self.errors,
+            "wall_time": wall_time,
+            "busy_time": self.busy_time,
+            "throughput": self.items_in / wall_time if wall_time else 0.0,
+            "utilization": self.busy_time / (wall_time * self.workers) if wall_time else 0.0,
+            "avg_queue_depth": self.queue_depth_sum / self.items_in if self.items_in else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+class PipelineStage:
+    """
+    A step of a StagedPipeline, running fn on each item with `workers`
+    threads, or processes if use_processes is set, in which case fn and the
+    items must be picklable.
+
+    Args:
+        name: Stage name in the metrics.
+        fn: Called with an input item, or with a list of up to `coalesce`
+            queued items if coalesce is set.
+        workers: Number of items processed at the same time.
+        queue_size: Capacity of the input queue, upstream stages block when
+            it is full.
+        fan_out: If set, fn returns an iterable of items for the next stage.
+        on_result: Called with the input and result of fn.
+        on_error: Called with the input and exception of fn, the item is
+            dropped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: Optional[int] = None,
+        use_processes: bool = False,
+        coalesce: int = 0,
+        fan_out: bool = False,
+        on_result: Optional[Callable[[Any, Any], None]] = None,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue_size = queue_size or 2 * self.workers
+        self.use_processes = use_processes
+        self.coalesce = coalesce
+        self.fan_out = fan_out
+        self.on_result = on_result
+        self.on_error = on_error
+        self.metrics = StageMetrics(name, self.workers)
+
+
+class StagedPipeline:
+    """
+    Run items through stages connected by bounded queues. Each stage has a
+    feeder thread submitting items to its executor, at most `workers` at a
+    time, and a collector thread passing results on in input order. A full
+    queue blocks the stages before it, so no more than a few items per stage
+    are held in memory.
+    """
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages = stages
+
+    def _create_executor(self, stage: PipelineStage) -> Executor:
+        if stage.use_processes:
+            executor = ProcessPoolExecutor(max_workers=stage.workers)
+            # start the worker processes now, before the stage threads, as
+            # forking a process with running threads may copy held locks
+            executor.submit(int).result()
+            return executor
+        return ThreadPoolExecutor(
+            max_workers=stage.workers, thread_name_prefix=stage.name
+        )
+
+    def _feed(self, stage, executor, input_queue, in_flight):
+        while True:
+            item = input_queue.get()
+            if item is _END:
+                in_flight.put(_END)
+                return
+            stage.metrics.record_input(input_queue.qsize())
+            if stage.coalesce:
+                item = [item]
+                while len(item) < stage.coalesce:
+                    try:
+                        next_item = input_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if next_item is _END:
+                        # seen again by this loop
+                        input_queue.put(_END)
+                        break
+                    stage.metrics.record_input(input_queue.qsize())
+                    item.append(next_item)
+            try:
+                future = executor.submit(_timed_call, stage.fn, item)
+            except Exception as e:
+                future = e
+            # blocks while `workers` items are in flight
+            in_flight.put((item, future))
+
+    def _collect(self, stage, in_flight, output_queue):
+        while True:
+            entry = in_flight.get()
+            if entry is _END:
+                if output_queue is not None:
+                    output_queue.put(_END)
+                return
+            item, future = entry
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                result, busy_time = future.result()
+            except Exception as e:
+                stage.metrics.errors += 1
+                stage.metrics.last_end = time.perf_counter()
+                logger.error("Stage %s failed: %s", stage.name, e)
+                if stage.on_error is not None:
+                    self._callback(stage.on_error, item, e)
+                continue
+            stage.metrics.busy_time += busy_time
+            outputs = list(result) if stage.fan_out else [result]
+            stage.metrics.items_out += len(outputs)
+            stage.metrics.last_end = time.perf_counter()
+            if stage.on_result is not None:
+                self._callback(stage.on_result, item, result)
+            if output_queue is not None:
+                for output in outputs:
+                    output_queue.put(output)
+
+    def _callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Pipeline callback failed")
+
+    def run(self, items: Iterable):
+        """Run all items through the stages, returns once all are done"""
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        executors = [self._create_executor(stage) for stage in self.stages]
+        threads = []
+        try:
+            for i, (stage, executor) in enumerate(zip(self.stages, executors)):
+                in_flight = queue.Queue(maxsize=stage.workers)
+                output_queue = queues[i + 1] if i + 1 < len(queues) else None
+                threads.append(threading.Thread(
+                    target=self._feed,
+                    args=(stage, executor, queues[i], in_flight),
+                    name=f"{stage.name}-feeder",
+                    daemon=True,
+                ))
+                threads.append(threading.Thread(
+                    target=self._collect,
+                    args=(stage, in_flight, output_queue),
+                    name=f"{stage.name}-collector",
+                    daemon=True,
+                ))
+            for thread in threads:
+                thread.start()
+            try:
+                for item in items:
+                    queues[0].put(item)
+            finally:
+                queues[0].put(_END)
+            for thread in threads:
+                thread.join()
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+
+    def metrics(self) -> List[dict]:
+        return [stage.metrics.to_dict() for stage in self.stages]
+
+    def log_metrics(self):
+        for metrics in self.metrics():
+            logger.info(
+                "Stage %s: %d in, %d out, %d errors, %.2f items/s, "
+                "%.0f%% busy with %d workers, queue depth avg %.1f max %d",
+                metrics["stage"],
+                metrics["items_in"],
+                metrics["items_out"],
+                metrics["errors"],
+                metrics["throughput"],
+                metrics["utilization"] * 100,
+                metrics["workers"],
+                metrics["avg_queue_depth"],
+                metrics["max_queue_depth"],
+            )
+
+
+class CompletionTracker:
+    """
+    Track the parts an item is split into by a pipeline, e.g. the chunk
+    batches of a file, and call on_complete(key, info, error) once when all
+    parts are done or one failed. error is None on success.
+    """
+
+    def __init__(self, on_complete: Callable[[Any, Any, Optional[Exception]], None]):
+        self.on_complete = on_complete
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, info=None):
+        with self._lock:
+            self._entries[key] = {"info": info, "parts": None, "done": 0}
+
+    def set_parts(self, key, parts: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["parts"] = parts
+            complete = entry["done"] >= parts
+            if complete:
+                del self._entries[key]
+        if complete:
+            self.on_complete(key, entry["info"], None)
+
+    def part_done(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["done"] += 1
+            complete = entry["parts"] is not None and entry["done"] >= entry["parts"]
+            if complete:
+                del self._entries[key]
+        if complete:
+            self.on_complete(key, entry["info"], None)
+
+    def fail(self, key, error: Exception):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.on_complete(key, entry["info"], error)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# connections kept per client, i.e. per region
+SAGEMAKER_MAX_POOL_CONNECTIONS = int(
+    os.environ.get("SAGEMAKER_MAX_POOL_CONNECTIONS", 50))
+SAGEMAKER_TCP_KEEPALIVE = os.environ.get(
+    "SAGEMAKER_TCP_KEEPALIVE", "true").lower() == "true"
+
+
+class EndpointMetrics:
+    """Latency and in-flight concurrency of the calls to one endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.invocations = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self, latency: float, error: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self.invocations += 1
+            self.errors += int(error)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "invocations": self.invocations,
+                "errors": self.errors,
+                "avg_latency": self.total_latency / self.invocations if self.invocations else 0.0,
+                "max_latency": self.max_latency,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+class SagemakerEndpointInvoker:
+    """
+    Invoke SageMaker endpoints through one sagemaker-runtime client per
+    region. boto3 clients are thread safe, the client connection pool is
+    sized for the executor threads calling the same endpoint.
+    """
+
+    def __init__(
+        self,
+        max_pool_connections: int = SAGEMAKER_MAX_POOL_CONNECTIONS,
+        tcp_keepalive: bool = SAGEMAKER_TCP_KEEPALIVE,
+        client_factory: Optional[Callable] = None,
+    ):
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.client_factory = client_factory or self._create_client
+        self._clients: Dict[Optional[str], object] = {}
+        self._metrics: Dict[str, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _create_client(self, region_name: Optional[str]):
+        config = Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+        )
+        return boto3.client(
+            "sagemaker-runtime", region_name=region_name, config=config)
+
+    def get_client(self, region_name: Optional[str] = None):
+        client = self._clients.get(region_name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(region_name)
+                if client is None:
+                    client = self.client_factory(region_name)
+                    self._clients[region_name] = client
+        return client
+
+    def _get_metrics(self, endpoint_name: str) -> EndpointMetrics:
+        metrics = self._metrics.get(endpoint_name)
+        if metrics is None:
+            with self._lock:
+                metrics = self._metrics.setdefault(
+                    endpoint_name, EndpointMetrics())
+        return metrics
+
+    def invoke(
+        self,
+        endpoint_name: str,
+        body: bytes,
+        content_type: str = "application/json",
+        accepts: str = "application/json",
+        region_name: Optional[str] = None,
+        endpoint_kwargs: Optional[dict] = None,
+    ):
+        """
+        Call invoke_endpoint and record its latency
+
+        Returns:
+            the invoke_endpoint response, its Body is the model output stream
+        """
+        client = self.get_client(region_name)
+        metrics = self._get_metrics(endpoint_name)
+        metrics.start()
+        start = time.perf_counter()
+        error = False
+        try:
+            return client.invoke_endpoint(
+                EndpointName=endpoint_name,
+                Body=body,
+                ContentType=content_type,
+                Accept=accepts,
+                **(endpoint_kwargs or {}),
+            )
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.end(time.perf_counter() - start, error=error)
+
+    def metrics(self) -> Dict[str, dict]:
+        with self._lock:
+            endpoint_metrics = list(self._metrics.items())
+        return {name: metrics.to_dict() for name, metrics in endpoint_metrics}
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics = {}
+
+
+sm_invoker = SagemakerEndpointInvoker()
@@ -20,6 +20,11 @@ from langchain_core.messages import BaseMessage
 from langchain_core.outputs import GenerationChunk
 from langchain_core.pydantic_v1 import Extra, root_validator
 
+try:
+    from sm_invoker import sm_invoker
+except ImportError:
+    from llm_bot_dep.sm_invoker import sm_invoker
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -385,6 +390,18 @@ class SagemakerEndpointChat(BaseChatModel):
         return text
 
 
+# content handlers are stateless, they are built once and shared by calls
+CONTENT_HANDLERS = {
+    "vector": vectorContentHandler(),
+    "bce": vectorContentHandler(),
+    "m3": m3ContentHandler(),
+    "cross": crossContentHandler(),
+    "answer": answerContentHandler(),
+    "rerank": rerankContentHandler(),
+}
+M3_MODEL_KWARGS = {"batch_size": 12, "max_length": 512, "return_type": "dense"}
+
+
 def SagemakerEndpointVectorOrCross(
     prompt: str,
     endpoint_name: str,
@@ -403,58 +420,46 @@ def SagemakerEndpointVectorOrCross(
             Accept=accepts,
             **_endpoint_kwargs,
         )
+
+    The endpoint is called through sm_invoker, with its pooled client and
+    the prebuilt content handlers, instead of a langchain wrapper per call.
     """
     if target_model:
         endpoint_kwargs = {"TargetModel": target_model}
     else:
         endpoint_kwargs = None
-    client = boto3.client("sagemaker-runtime", region_name=region_name)
-    if model_type == "vector" or model_type == "bce":
-        content_handler = vectorContentHandler()
-        embeddings = SagemakerEndpointEmbeddings(
-            client=client,
-            endpoint_name=endpoint_name,
-            content_handler=content_handler,
-            endpoint_kwargs=endpoint_kwargs,
-        )
-        query_result = embeddings.embed_query(prompt)
-        return query_result
-    elif model_type == "cross":
-        content_handler = crossContentHandler()
-    elif model_type == "m3":
-        content_handler = m3ContentHandler()
-        model_kwargs = {}
-        model_kwargs["batch_size"] = 12
-        model_kwargs["max_length"] = 512
-        model_kwargs["return_type"] = "dense"
-        embeddings = SagemakerEndpointEmbeddings(
-            client=client,
-            endpoint_name=endpoint_name,
-            content_handler=content_handler,
-            model_kwargs=model_kwargs,
+    content_handler = CONTENT_HANDLERS[model_type]
+    if model_type in ("vector", "bce", "m3"):
+        # same as SagemakerEndpointEmbeddings.embed_query
+        model_kwargs = M3_MODEL_KWARGS if model_type == "m3" else {}
+        body = content_handler.transform_input(
+            [prompt.replace("\n", " ")], model_kwargs)
+    else:
+        # same as SagemakerEndpoint._call
+        body = content_handler.transform_input(prompt, kwargs)
+    try:
+        response = sm_invoker.invoke(
+            endpoint_name,
+            body,
+            content_type=content_handler.content_type,
+            accepts=content_handler.accepts,
+            region_name=region_name,
             endpoint_kwargs=endpoint_kwargs,
         )
-        query_result = embeddings.embed_query(prompt)
-        return query_result
-    elif model_type == "answer":
-        content_handler = answerContentHandler()
-    elif model_type == "rerank":
-        content_handler = rerankContentHandler()
-    # TODO: replace with SagemakerEndpointStreaming
-    genericModel = SagemakerEndpoint(
-        client=client,
-        endpoint_name=endpoint_name,
-        # region_name = region_name,
-        content_handler=content_handler,
-        endpoint_kwargs=endpoint_kwargs,
-    )
-    return genericModel(prompt=prompt, stop=stop, **kwargs)
+    except Exception as e:
+        raise ValueError(f"Error raised by inference endpoint: {e}")
+    output = content_handler.transform_output(response["Body"])
+    if model_type in ("vector", "bce", "m3"):
+        return output[0]
+    if stop is not None:
+        output = enforce_stop_tokens(output, stop)
+    return output
 
 
 def getCustomEmbeddings(
     endpoint_name: str, region_name: str, bedrock_region: str, model_type: str
 ) -> SagemakerEndpointEmbeddings:
-    client = boto3.client("sagemaker-runtime", region_name=region_name)
+    client = sm_invoker.get_client(region_name)
     bedrock_client = boto3.client("bedrock-runtime", region_name=bedrock_region)
     embeddings = None
     if model_type == "bedrock":
@@ -1,8 +1,10 @@
+import copy
 import logging
 import re
 import traceback
 import uuid
-from typing import Any, List
+from collections import deque
+from typing import Any, Iterator, List
 
 import boto3
 from langchain.docstore.document import Document
@@ -83,6 +85,61 @@ class SpacyTextSplitter(TextSplitter):
         return self._merge_splits(splits, self._separator)
 
 
+def chunk_documents(
+    documents: List[Document], text_splitter: TextSplitter
+) -> Iterator[Document]:
+    """Split the documents into chunks, with chunk ids suffixed by their index
+    in the document, and the number of chunks of a document added as "size"
+    to its heading_hierarchy. Same as text_splitter.split_documents, but
+    each document is split once.
+
+    The texts of all chunks are split first, as chunks of a document get the
+    heading_hierarchy of the last document with the same chunk_id, the chunk
+    documents are created as they are consumed.
+
+    Args:
+        documents (List[Document]): Documents split by MarkdownHeaderTextSplitter
+        text_splitter (TextSplitter): Splitter of the documents into chunks
+
+    Yields:
+        Document: A chunk of a document
+    """
+    document_splits = deque()
+    updated_heading_hierarchy = {}
+    for document in documents:
+        chunk_id = document.metadata["chunk_id"]
+        if getattr(text_splitter, "_add_start_index", False):
+            splits = text_splitter.split_documents([document])
+        else:
+            splits = text_splitter.split_text(document.page_content)
+        document_splits.append((document, splits))
+        # Add size in heading_hierarchy
+        if "heading_hierarchy" in document.metadata:
+            hierarchy = document.metadata["heading_hierarchy"]
+            hierarchy["size"] = len(splits)
+            updated_heading_hierarchy[chunk_id] = hierarchy
+
+    while document_splits:
+        document, splits = document_splits.popleft()
+        chunk_id = document.metadata["chunk_id"]
+        hierarchy = updated_heading_hierarchy.get(chunk_id)
+        # the hierarchy is shared by the chunks, not copied
+        memo = {}
+        if "heading_hierarchy" in document.metadata and hierarchy is not None:
+            memo[id(document.metadata["heading_hierarchy"])] = hierarchy
+        for index, split in enumerate(splits, start=1):
+            if not isinstance(split, Document):
+                split = Document(
+                    page_content=split,
+                    metadata=copy.deepcopy(document.metadata, dict(memo)),
+                )
+            logger.debug(chunk_id)
+            split.metadata["chunk_id"] = f"{chunk_id}-{index}"
+            if hierarchy is not None:
+                split.metadata["heading_hierarchy"] = hierarchy
+            yield split
+
+
 def find_parent(headers: dict, level: int):
     """Find the parent node of current node
     Find the last node whose level is less than current node
@@ -168,6 +225,11 @@ def extract_headings(md_content: str):
     headers = {}
     lines = md_content.split("\n")
     id_index_dict = {}
+    # Ids of the headers which can be the parent of the next header, with
+    # increasing levels, the same result as find_parent in a single pass
+    parent_stack = []
+    # Last header id of each level, as find_previous_with_same_level
+    last_id_of_level = {}
     for line in lines:
         match = re.match(r"\s*(#+)(.*)", line)
         if match:
@@ -177,24 +239,30 @@ def extract_headings(md_content: str):
             title = match.group(2).strip()
             id_prefix = str(uuid.uuid4())[:8]
             _id = f"${header_index}-{id_prefix}"
-            parent = find_parent(headers, level)
-            previous = find_previous_with_same_level(headers, level)
+            while parent_stack and headers[parent_stack[-1]]["level"] >= level:
+                parent_stack.pop()
+            parent = parent_stack[-1] if parent_stack else None
+            previous = last_id_of_level.get(level)
             headers[_id] = {
                 "title": title,
                 "level": level,
                 "parent": parent,
                 "previous": previous,
+                "child": [],
+                "next": None,
             }
+            if parent is not None and headers[parent]["level"] == level - 1:
+                headers[parent]["child"].append(_id)
+            if previous is not None:
+                headers[previous]["next"] = _id
+            parent_stack.append(_id)
+            last_id_of_level[level] = _id
             # Use list in case multiple heading have the same title
             if title not in id_index_dict:
                 id_index_dict[title] = [_id]
             else:
                 id_index_dict[title].append(_id)
 
-    for header_obj in headers:
-        headers[header_obj]["child"] = find_child(headers, header_obj)
-        headers[header_obj]["next"] = find_next_with_same_level(headers, header_obj)
-
     return headers, id_index_dict
 
 
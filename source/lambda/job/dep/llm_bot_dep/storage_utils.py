@@ -3,8 +3,14 @@ Helper functions for storage intermediate content or log
 """
 
 import datetime
+import itertools
 import json
 import logging
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 from urllib.parse import urlparse
 from botocore.exceptions import ClientError
 
@@ -69,14 +75,167 @@ def save_content_to_s3(s3, document: Document, res_bucket: str, splitting_type:
         s3 (_type_): S3 client
     """
     logger_file = convert_to_logger(document)
-    # Extract the filename from the file_path in the metadata
-    file_path = document.metadata.get("file_path", "")
-    # filename = file_path.split('/')[-1].split('.')[0]
-    filename = file_path.replace("s3://", "").replace("/", "-").replace(".", "-")
+    filename = _artifact_prefix(document.metadata.get("file_path", ""))
     # RecursiveCharacterTextSplitter have been rewrite to split based on chunk size & overlap, use separate folder to store the logger file
     upload_chunk_to_s3(s3, logger_file, res_bucket, filename, splitting_type)
 
 
+def _artifact_prefix(file_path: str) -> str:
+    # Extract the filename from the file_path in the metadata
+    # filename = file_path.split('/')[-1].split('.')[0]
+    return file_path.replace("s3://", "").replace("/", "-").replace(".", "-")
+
+
+class ArtifactWriter:
+    """Save intermediate documents like save_content_to_s3, but as one JSONL
+    object per file and splitting type instead of one object per document:
+    filename A
+        ├── semantic-splitting
+        │   ├── timestamp 1
+        │   │   ├── <time>-<pid>-<sequence>.jsonl, one document per line
+        ...
+
+    Documents are buffered until flush(), or until a buffer reaches
+    max_object_size bytes, and uploaded by background threads. close() waits
+    for the uploads.
+
+    Args:
+        s3: S3 client
+        res_bucket: Target S3 bucket
+        sample_rate: Fraction of the files whose documents are saved, 0
+            disables the writer. Files are sampled by their path, so all
+            documents of a sampled file are saved.
+        max_object_size: Size of the JSONL objects, in bytes
+        max_workers: Number of concurrent uploads
+    """
+
+    def __init__(
+        self,
+        s3,
+        res_bucket: str,
+        sample_rate: float = 1.0,
+        max_object_size: int = 8 * 1024 * 1024,
+        max_workers: int = 2,
+    ):
+        self.s3 = s3
+        self.res_bucket = res_bucket
+        self.sample_rate = sample_rate
+        self.max_object_size = max_object_size
+        self.max_workers = max_workers
+        self._buffers = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def is_sampled(self, file_path: str) -> bool:
+        if self.res_bucket is None or self.sample_rate <= 0:
+            return False
+        if self.sample_rate >= 1:
+            return True
+        return zlib.crc32(file_path.encode("utf-8")) / 2**32 < self.sample_rate
+
+    def add(self, document: Document, splitting_type: str):
+        file_path = document.metadata.get("file_path", "")
+        if not self.is_sampled(file_path):
+            return
+        line = json.dumps(
+            {"page_content": document.page_content, "metadata": document.metadata},
+            ensure_ascii=False,
+            default=str,
+        ).encode("utf-8") + b"\n"
+        with self._lock:
+            buffer = self._buffers.setdefault(
+                (file_path, splitting_type), {"lines": [], "size": 0}
+            )
+            buffer["lines"].append(line)
+            buffer["size"] += len(line)
+            full = buffer["size"] >= self.max_object_size
+            if full:
+                del self._buffers[(file_path, splitting_type)]
+        if full:
+            self._upload(file_path, splitting_type, buffer["lines"])
+
+    def flush(self):
+        """Start the upload of all buffered documents"""
+        with self._lock:
+            buffers = self._buffers
+            self._buffers = {}
+        for (file_path, splitting_type), buffer in buffers.items():
+            self._upload(file_path, splitting_type, buffer["lines"])
+
+    def close(self):
+        """Upload all buffered documents and wait for the uploads"""
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _upload(self, file_path: str, splitting_type: str, lines: list):
+        now = datetime.datetime.now()
+        object_key = (
+            f"{_artifact_prefix(file_path)}/{splitting_type}/"
+            f"{now.strftime('%Y-%m-%d-%H')}/"
+            f"{now.strftime('%Y-%m-%d-%H-%M-%S-%f')}-{os.getpid()}-{next(self._sequence)}.jsonl"
+        )
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="artifact-writer"
+                )
+            self._executor.submit(self._put_object, object_key, b"".join(lines))
+
+    def _put_object(self, object_key: str, body: bytes):
+        try:
+            res = self.s3.put_object(Bucket=self.res_bucket, Key=object_key, Body=body)
+            logger.debug(f"Upload artifact file to S3: {res}")
+        except Exception as e:
+            logger.error(f"Error uploading artifact file to S3: {e}")
+
+
+def read_artifacts(
+    s3, res_bucket: str, file_path: str, splitting_type: Optional[str] = None
+) -> Iterator[Document]:
+    """Read the documents saved for a file, by ArtifactWriter as JSONL or by
+    save_content_to_s3 as one logger file per document
+
+    Args:
+        file_path (str): The file_path in the document metadata, e.g. s3://bucket/key
+        splitting_type (str): Only read the documents of this splitting type
+    """
+    prefix = _artifact_prefix(file_path) + "/"
+    if splitting_type is not None:
+        prefix += splitting_type + "/"
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=res_bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            body = s3.get_object(Bucket=res_bucket, Key=key)["Body"].read().decode("utf-8")
+            if key.endswith(".jsonl"):
+                for line in body.splitlines():
+                    if line:
+                        record = json.loads(line)
+                        yield Document(
+                            page_content=record["page_content"],
+                            metadata=record["metadata"],
+                        )
+            elif key.endswith(".log"):
+                yield _convert_from_logger(body)
+
+
+def _convert_from_logger(logger_content: str) -> Document:
+    page_content, metadata = logger_content.rsplit("\nMetadata: ", 1)
+    return Document(
+        page_content=page_content[len("Page Content: \n"):],
+        metadata=json.loads(metadata),
+    )
+
+
 def _s3_uri_exist(s3_client, s3_uri: str) -> bool:
     """Checks if an object exists at a given S3 URI. 
     eg. s3://bucket/folder/file.csv
@@ -91,7 +91,14 @@ except Exception as e:
 from llm_bot_dep import sm_utils
 from llm_bot_dep.constant import SplittingType
 from llm_bot_dep.loaders.auto import cb_process_object
-from llm_bot_dep.storage_utils import save_content_to_s3
+from llm_bot_dep.loaders.loader_input import LoaderInput
+from llm_bot_dep.pipeline_utils import (
+    CompletionTracker,
+    PipelineStage,
+    StagedPipeline,
+)
+from llm_bot_dep.splitter_utils import chunk_documents
+from llm_bot_dep.storage_utils import ArtifactWriter
 
 # Adaption to allow nougat to run in AWS Glue with writable /tmp
 os.environ["TRANSFORMERS_CACHE"] = "/tmp/transformers_cache"
@@ -140,6 +147,27 @@ OBJECT_EXPIRY_TIME = 3600
 credentials = boto3.Session().get_credentials()
 MAX_OS_DOCS_PER_PUT = 8
 
+
+def get_optional_arg(name: str, default):
+    """Job arguments with a default, which getResolvedOptions does not support"""
+    if f"--{name}" in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(f"--{name}") + 1]
+    return os.environ.get(name, default)
+
+
+# Degree of parallelism of the ingestion stages, see ingestion_pipeline
+PREFETCH_WORKERS = int(get_optional_arg("PREFETCH_WORKERS", 4))
+PARSE_WORKERS = int(
+    get_optional_arg("PARSE_WORKERS", min(os.cpu_count() or 1, 4))
+)
+EMBED_WORKERS = int(get_optional_arg("EMBED_WORKERS", 4))
+INDEX_WORKERS = int(get_optional_arg("INDEX_WORKERS", 1))
+# chunk batches written in one bulk request
+INDEX_COALESCE_BATCHES = int(get_optional_arg("INDEX_COALESCE_BATCHES", 5))
+# fraction of the files whose split documents are saved to the result bucket,
+# 0 to disable
+ARTIFACT_SAMPLE_RATE = float(get_optional_arg("ARTIFACT_SAMPLE_RATE", 1))
+
 nltk.data.path.append("/tmp/nltk_data")
 
 
@@ -187,14 +215,14 @@ class S3FileProcessor:
         response = s3_client.get_object(Bucket=self.bucket, Key=key)
         return response["Body"].read()
 
-    def process_file(self, key: str, file_type: str, file_content: str):
+    def process_file(self, key: str, file_type: str, file_content: bytes):
         """
         Process a file based on its type and return the processed data.
 
         Args:
             key (str): The key of the file.
             file_type (str): The type of the file.
-            file_content (str): The content of the file.
+            file_content (bytes): The content of the file.
 
         Returns:
             tuple: A tuple containing the file type, processed file content, and additional keyword arguments.
@@ -229,16 +257,16 @@ class S3FileProcessor:
             return "txt", self.decode_file_content(file_content), kwargs
         elif file_type == "csv":
             kwargs["csv_row_count"] = 1
-            return "csv", self.decode_file_content(file_content), kwargs
+            return "csv", LoaderInput(file_content, self.bucket, key), kwargs
         elif file_type in ["xlsx", "xls"]:
             kwargs["xlsx_row_count"] = 1
-            return "xlsx", file_content, kwargs
+            return "xlsx", LoaderInput(file_content, self.bucket, key), kwargs
         elif file_type == "html":
             return "html", self.decode_file_content(file_content), kwargs
         elif file_type in ["pdf"]:
-            return "pdf", file_content, kwargs
+            return "pdf", LoaderInput(file_content, self.bucket, key), kwargs
         elif file_type in ["docx", "doc"]:
-            return "doc", file_content, kwargs
+            return "doc", LoaderInput(file_content, self.bucket, key), kwargs
         elif file_type == "md":
             return "md", self.decode_file_content(file_content), kwargs
         elif file_type == "json":
@@ -247,7 +275,7 @@ class S3FileProcessor:
             return "jsonl", file_content, kwargs
         elif file_type in ["png", "jpeg", "jpg", "webp"]:
             kwargs["image_file_type"] = file_type
-            return "image", file_content, kwargs
+            return "image", LoaderInput(file_content, self.bucket, key), kwargs
         else:
             message = "Unknown file type: " + file_type
             input_body = {
@@ -360,40 +388,10 @@ class BatchChunkDocumentProcessor:
             Document: A chunk of a document.
 
         """
-        temp_text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
-        )
-        temp_content = content
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
         )
-        updated_heading_hierarchy = {}
-        for temp_document in temp_content:
-            temp_chunk_id = temp_document.metadata["chunk_id"]
-            temp_split_size = len(
-                temp_text_splitter.split_documents([temp_document])
-            )
-            # Add size in heading_hierarchy
-            if "heading_hierarchy" in temp_document.metadata:
-                temp_hierarchy = temp_document.metadata["heading_hierarchy"]
-                temp_hierarchy["size"] = temp_split_size
-                updated_heading_hierarchy[temp_chunk_id] = temp_hierarchy
-
-        for document in content:
-            splits = text_splitter.split_documents([document])
-            # List of Document objects
-            index = 1
-            for split in splits:
-                chunk_id = split.metadata["chunk_id"]
-                logger.info(chunk_id)
-                split.metadata["chunk_id"] = f"{chunk_id}-{index}"
-                if chunk_id in updated_heading_hierarchy:
-                    split.metadata["heading_hierarchy"] = (
-                        updated_heading_hierarchy[chunk_id]
-                    )
-                    logger.info(split.metadata["heading_hierarchy"])
-                index += 1
-                yield split
+        yield from chunk_documents(content, text_splitter)
 
     def batch_generator(
         self, content: List[Document], gen_chunk_flag: bool = True
@@ -515,7 +513,11 @@ class OpenSearchIngestionWorker:
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
     )
-    def aos_ingestion(self, documents: List[Document]) -> None:
+    def embed_documents(self, documents: List[Document]):
+        """
+        Returns:
+            tuple: texts, embedding vectors and metadatas of the documents
+        """
         texts = [doc.page_content for doc in documents]
         metadatas = [doc.metadata for doc in documents]
         embeddings_vectors = self.docsearch.embedding_function.embed_documents(
@@ -535,6 +537,13 @@ class OpenSearchIngestionWorker:
                 metadata_list.append(metadata)
             embeddings_vectors = embeddings_vectors_list
             metadatas = metadata_list
+        return texts, embeddings_vectors, metadatas
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+    )
+    def index_documents(self, texts, embeddings_vectors, metadatas) -> None:
         self.docsearch._OpenSearchVectorSearch__add(
             texts, embeddings_vectors, metadatas=metadatas
         )
@@ -565,78 +574,212 @@ class OpenSearchDeleteWorker:
             return
 
 
+def put_object_status(kwargs, status, detail=None):
+    input_body = {
+        "s3Path": f"s3://{kwargs['bucket']}/{kwargs['key']}",
+        "s3Bucket": kwargs["bucket"],
+        "s3Prefix": kwargs["key"],
+        "executionId": table_item_id,
+        "createTime": kwargs.get(
+            "create_time", str(datetime.now(timezone.utc))
+        ),
+        "status": status,
+    }
+    if detail is not None:
+        input_body["detail"] = detail
+    etl_object_table.put_item(Item=input_body)
+
+
+_parse_worker_clients = {}
+
+
+def _get_parse_worker_clients():
+    # clients are created in each worker process, not inherited on fork
+    if _parse_worker_clients.get("pid") != os.getpid():
+        s3 = boto3.client("s3")
+        _parse_worker_clients.update(
+            pid=os.getpid(),
+            s3_client=s3,
+            smr_client=boto3.client("sagemaker-runtime"),
+            # uploads still running when the worker process exits are
+            # waited for by the interpreter shutdown
+            artifact_writer=ArtifactWriter(
+                s3, res_bucket, sample_rate=ARTIFACT_SAMPLE_RATE
+            ),
+        )
+    return _parse_worker_clients
+
+
+def parse_object(task):
+    """
+    Parse and split a file and save the intermediate content, runs in a
+    worker process.
+
+    Returns:
+        list: (file key, batch of chunk documents) tuples
+    """
+    file_type, file_content, kwargs, batch_chunk_processor = task
+    clients = _get_parse_worker_clients()
+    kwargs = {**kwargs, "smr_client": clients["smr_client"]}
+    # The res is list[Document] type
+    res = cb_process_object(
+        clients["s3_client"], file_type, file_content, **kwargs
+    )
+    artifact_writer = clients["artifact_writer"]
+    for document in res:
+        artifact_writer.add(document, SplittingType.SEMANTIC.value)
+
+    gen_chunk_flag = False if file_type in ["csv", "xlsx", "xls"] else True
+    batches = []
+    for batch in batch_chunk_processor.batch_generator(res, gen_chunk_flag):
+        if len(batch) == 0:
+            continue
+
+        for document in batch:
+            if "complete_heading" in document.metadata:
+                document.page_content = (
+                    document.metadata["complete_heading"]
+                    + " "
+                    + document.page_content
+                )
+
+            artifact_writer.add(document, SplittingType.CHUNK.value)
+        batches.append((kwargs["key"], batch))
+    artifact_writer.flush()
+    return batches
+
+
 def ingestion_pipeline(
     s3_files_iterator,
     batch_chunk_processor,
     ingestion_worker,
+    file_processor,
     extract_only=False,
 ):
-    for file_type, file_content, kwargs in s3_files_iterator:
-        input_body = {
-            "s3Path": f"s3://{kwargs['bucket']}/{kwargs['key']}",
-            "s3Bucket": kwargs["bucket"],
-            "s3Prefix": kwargs["key"],
-            "executionId": table_item_id,
-            "createTime": kwargs["create_time"],
-            "status": "SUCCEED",
-        }
-        try:
-            # The res is list[Document] type
-            res = cb_process_object(
-                s3_client, file_type, file_content, **kwargs
-            )
-            for document in res:
-                save_content_to_s3(
-                    s3_client,
-                    document,
-                    res_bucket,
-                    SplittingType.SEMANTIC.value,
-                )
-
-            gen_chunk_flag = False if file_type in ["csv", "xlsx", "xls"] else True
-            batches = batch_chunk_processor.batch_generator(res, gen_chunk_flag)
+    """
+    Ingest files in stages connected by bounded queues, so that downloads,
+    parsing, embedding and indexing of different files overlap:
 
-            for batch in batches:
-                if len(batch) == 0:
-                    continue
+    prefetch (PREFETCH_WORKERS threads): read the file from S3
+    parse (PARSE_WORKERS processes): parse, split and save the chunks
+    embed (EMBED_WORKERS threads): embed a batch of chunks
+    index (INDEX_WORKERS threads): write up to INDEX_COALESCE_BATCHES
+        embedded batches in one bulk request
 
-                for document in batch:
-                    if "complete_heading" in document.metadata:
-                        document.page_content = (
-                            document.metadata["complete_heading"]
-                            + " "
-                            + document.page_content
-                        )
-                    else:
-                        document.page_content = document.page_content
+    The status of a file is written once all its batches are indexed, or
+    when one of its stages failed.
 
-                    save_content_to_s3(
-                        s3_client,
-                        document,
-                        res_bucket,
-                        SplittingType.CHUNK.value,
-                    )
+    Args:
+        s3_files_iterator: iterator of (file type, "", {"bucket", "key"}),
+            i.e. iterate_s3_files(extract_content=False)
+        file_processor: S3FileProcessor reading the files
+    """
 
-                if not extract_only:
-                    ingestion_worker.aos_ingestion(batch)
-        except Exception as e:
+    def on_complete(key, kwargs, error):
+        if error is None:
+            put_object_status(kwargs, "SUCCEED")
+        else:
             logger.error(
                 "Error processing object %s: %s",
                 kwargs["bucket"] + "/" + kwargs["key"],
-                e,
+                error,
             )
-            input_body = {
-                "s3Path": f"s3://{kwargs['bucket']}/{kwargs['key']}",
-                "s3Bucket": kwargs["bucket"],
-                "s3Prefix": kwargs["key"],
-                "executionId": table_item_id,
-                "createTime": kwargs["create_time"],
-                "status": "FAILED",
-                "detail": str(e),
-            }
-            traceback.print_exc()
-        finally:
-            etl_object_table.put_item(Item=input_body)
+            put_object_status(kwargs, "FAILED", str(error))
+
+    tracker = CompletionTracker(on_complete)
+
+    def prefetch(item):
+        file_type, _, kwargs = item
+        file_content = file_processor.get_file_content(kwargs["key"])
+        # None for unsupported file types, whose status is already written
+        processed = file_processor.process_file(
+            kwargs["key"], file_type, file_content
+        )
+        if processed is None:
+            return []
+        file_type, file_content, kwargs = processed
+        # the parse worker processes use their own client
+        kwargs = {k: v for k, v in kwargs.items() if k != "smr_client"}
+        tracker.add(kwargs["key"], kwargs)
+        return [(file_type, file_content, kwargs, batch_chunk_processor)]
+
+    def on_prefetch_error(item, error):
+        put_object_status(item[2], "FAILED", str(error))
+
+    def on_parsed(task, batches):
+        tracker.set_parts(task[2]["key"], 0 if extract_only else len(batches))
+
+    def on_parse_error(task, error):
+        tracker.fail(task[2]["key"], error)
+
+    def embed(item):
+        key, batch = item
+        # skip the remaining batches of a failed file
+        if key not in tracker:
+            return key, None
+        return key, ingestion_worker.embed_documents(batch)
+
+    def on_embed_error(item, error):
+        tracker.fail(item[0], error)
+
+    def index(items):
+        texts, vectors, metadatas = [], [], []
+        for _, embedded in items:
+            if embedded is None:
+                continue
+            texts.extend(embedded[0])
+            vectors.extend(embedded[1])
+            metadatas.extend(embedded[2])
+        if texts:
+            ingestion_worker.index_documents(texts, vectors, metadatas)
+
+    def on_indexed(items, _):
+        for key, _ in items:
+            tracker.part_done(key)
+
+    def on_index_error(items, error):
+        for key, _ in items:
+            tracker.fail(key, error)
+
+    stages = [
+        PipelineStage(
+            "prefetch",
+            prefetch,
+            workers=PREFETCH_WORKERS,
+            fan_out=True,
+            on_error=on_prefetch_error,
+        ),
+        PipelineStage(
+            "parse",
+            parse_object,
+            workers=PARSE_WORKERS,
+            use_processes=True,
+            fan_out=True,
+            on_result=on_parsed,
+            on_error=on_parse_error,
+        ),
+    ]
+    if not extract_only:
+        stages += [
+            PipelineStage(
+                "embed",
+                embed,
+                workers=EMBED_WORKERS,
+                on_error=on_embed_error,
+            ),
+            PipelineStage(
+                "index",
+                index,
+                workers=INDEX_WORKERS,
+                coalesce=INDEX_COALESCE_BATCHES,
+                on_result=on_indexed,
+                on_error=on_index_error,
+            ),
+        ]
+
+    pipeline = StagedPipeline(stages)
+    pipeline.run(s3_files_iterator)
+    pipeline.log_metrics()
 
 
 def delete_pipeline(s3_files_iterator, document_generator, delete_worker):
@@ -679,8 +822,9 @@ def create_processors_and_workers(
     """
 
     if operation_type in ["create", "extract_only"]:
+        # files are read by the prefetch stage of ingestion_pipeline
         s3_files_iterator = file_processor.iterate_s3_files(
-            extract_content=True
+            extract_content=False
         )
         batch_processor = BatchChunkDocumentProcessor(
             chunk_size=1024, chunk_overlap=30, batch_size=10
@@ -754,10 +898,16 @@ def main():
     )
 
     if operation_type == "create":
-        ingestion_pipeline(s3_files_iterator, batch_processor, worker)
+        ingestion_pipeline(
+            s3_files_iterator, batch_processor, worker, file_processor
+        )
     elif operation_type == "extract_only":
         ingestion_pipeline(
-            s3_files_iterator, batch_processor, worker, extract_only=True
+            s3_files_iterator,
+            batch_processor,
+            worker,
+            file_processor,
+            extract_only=True,
         )
     elif operation_type == "delete":
         delete_pipeline(s3_files_iterator, batch_processor, worker)
@@ -771,7 +921,9 @@ def main():
                 "create", docsearch, embedding_model_endpoint, file_processor
             )
         )
-        ingestion_pipeline(s3_files_iterator, batch_processor, worker)
+        ingestion_pipeline(
+            s3_files_iterator, batch_processor, worker, file_processor
+        )
     else:
         raise ValueError(
             "Invalid operation type. Valid types: create, delete, update, extract_only"
@@ -122,6 +122,8 @@ def main():
 
     local_ingestion_multithread.bge_m3_embedding_lock = threading.Lock()
     local_ingestion_multithread.index_create_lock = multiprocessing.Lock()
+    # do not save the split documents either
+    local_ingestion_multithread.artifact_writer.sample_rate = 0
 
     # local_ingestion_multithread.aos_injection_mp = ProcessPoolExecutor(aos_injection_mp_worker_num)
     # start all process
@@ -262,7 +262,8 @@ from llm_bot_dep.ddb_utils import WorkspaceManager
 from llm_bot_dep.embeddings import get_embedding_info
 from llm_bot_dep.enhance_utils import EnhanceWithBedrock
 from llm_bot_dep.loaders.auto import cb_process_object
-from llm_bot_dep.storage_utils import save_content_to_s3
+from llm_bot_dep.splitter_utils import chunk_documents
+from llm_bot_dep.storage_utils import ArtifactWriter
 from opensearchpy import RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 from tenacity import retry, stop_after_attempt, wait_exponential
@@ -320,6 +321,9 @@ batchIndice = args["BATCH_INDICE"]
 etlObjTable = args["ETL_OBJECT_TABLE"]
 workspace_id = args["WORKSPACE_ID"]
 workspace_table = args["WORKSPACE_TABLE"]
+# fraction of the files whose split documents are saved to the result bucket,
+# 0 to disable
+ARTIFACT_SAMPLE_RATE = float(args.get("ARTIFACT_SAMPLE_RATE", 1))
 
 s3 = boto3.client("s3")
 smr_client = boto3.client("sagemaker-runtime")
@@ -327,6 +331,7 @@ dynamodb = boto3.resource("dynamodb")
 table = dynamodb.Table(etlObjTable)
 workspace_table = dynamodb.Table(workspace_table)
 workspace_manager = WorkspaceManager(workspace_table)
+artifact_writer = ArtifactWriter(s3, res_bucket, sample_rate=ARTIFACT_SAMPLE_RATE)
 
 ENHANCE_CHUNK_SIZE = 25000
 # Make it 3600s for debugging purpose
@@ -518,7 +523,7 @@ def _aos_injection(
         else:
             document.page_content = document.page_content
         document.metadata["embedding_endpoint_name"] = endpoint_name
-        save_content_to_s3(s3, document, res_bucket, SplittingType.CHUNK.value)
+        artifact_writer.add(document, SplittingType.CHUNK.value)
 
     texts = [doc.page_content for doc in documents]
     metadatas = [doc.metadata for doc in documents]
@@ -653,38 +658,10 @@ def _aos_injection(
 def chunk_generator(
     content: List[Document], chunk_size: int = 500, chunk_overlap: int = 30
 ) -> Generator[Document, None, None]:
-    temp_text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=chunk_overlap
-    )
-    temp_content = content
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
-    updated_heading_hierarchy = {}
-    for temp_document in temp_content:
-        temp_chunk_id = temp_document.metadata["chunk_id"]
-        temp_split_size = len(temp_text_splitter.split_documents([temp_document]))
-        # Add size in heading_hierarchy
-        if "heading_hierarchy" in temp_document.metadata:
-            temp_hierarchy = temp_document.metadata["heading_hierarchy"]
-            temp_hierarchy["size"] = temp_split_size
-            updated_heading_hierarchy[temp_chunk_id] = temp_hierarchy
-
-    for document in content:
-        splits = text_splitter.split_documents([document])
-        # list of Document objects
-        index = 1
-        for split in splits:
-            chunk_id = split.metadata["chunk_id"]
-            logger.debug(chunk_id)
-            split.metadata["chunk_id"] = f"{chunk_id}-{index}"
-            if chunk_id in updated_heading_hierarchy:
-                split.metadata["heading_hierarchy"] = updated_heading_hierarchy[
-                    chunk_id
-                ]
-                logger.debug(split.metadata["heading_hierarchy"])
-            index += 1
-            yield split
+    return chunk_documents(content, text_splitter)
 
 
 def aos_injection(
@@ -752,12 +729,12 @@ def gen_documents(s3_bucket, s3_prefix, worker_num, batchIndice, max_file_num=ma
     for file_type, file_content, kwargs in iterate_s3_files(
         s3_bucket, s3_prefix, worker_num, batchIndice, max_file_num=max_file_num
     ):
+        # the chunks of the previous files have been handed to _aos_injection
+        artifact_writer.flush()
         try:
             res = cb_process_object(s3, file_type, file_content, **kwargs)
             for document in res:
-                save_content_to_s3(
-                    s3, document, res_bucket, SplittingType.SEMANTIC.value
-                )
+                artifact_writer.add(document, SplittingType.SEMANTIC.value)
             # the res is unified to list[Document] type, store the res to S3 for observation
             # TODO, parse the metadata to embed with different index
             if res:
@@ -858,9 +835,7 @@ def __main(worker_num, batchIndice, max_file_num=math.inf):
         try:
             res = cb_process_object(s3, file_type, file_content, **kwargs)
             for document in res:
-                save_content_to_s3(
-                    s3, document, res_bucket, SplittingType.SEMANTIC.value
-                )
+                artifact_writer.add(document, SplittingType.SEMANTIC.value)
 
             # the res is unified to list[Document] type, store the res to S3 for observation
             # TODO, parse the metadata to embed with different index
@@ -913,11 +888,8 @@ def __main(worker_num, batchIndice, max_file_num=math.inf):
 
                 if len(enhanced_prompt_list) > 0:
                     for document in enhanced_prompt_list:
-                        save_content_to_s3(
-                            s3,
-                            document,
-                            res_bucket,
-                            SplittingType.QA_ENHANCEMENT.value,
+                        artifact_writer.add(
+                            document, SplittingType.QA_ENHANCEMENT.value
                         )
                     aos_injection(
                         enhanced_prompt_list,
@@ -934,6 +906,7 @@ def __main(worker_num, batchIndice, max_file_num=math.inf):
                 e,
             )
             traceback.print_exc()
+        artifact_writer.flush()
 
 
 def main(worker_num, batchIndice, max_file_num=math.inf):
@@ -950,7 +923,11 @@ def main(worker_num, batchIndice, max_file_num=math.inf):
         # Download the package to /tmp/nltk_data
         nltk.download(package, download_dir="/tmp/nltk_data")
 
-    _main(worker_num, batchIndice, max_file_num=max_file_num)
+    try:
+        _main(worker_num, batchIndice, max_file_num=max_file_num)
+    finally:
+        # wait for the artifact uploads
+        artifact_writer.close()
 
 
 # def main_multithread():
@@ -0,0 +1,171 @@
+import importlib.util
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from langchain.docstore.document import Document
+
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "..", "glue-job-script.py")
+
+
+def load_glue_job_script():
+    # the job arguments are read when the script is imported
+    argv = [
+        "glue-job-script.py",
+        "--embedding_model_endpoint", "embedding",
+        "--s3_bucket", "bucket",
+        "--s3_prefix", "docs/",
+        "--chatbot_id", "admin",
+        "--index_id", "admin-qd-default",
+        "--embedding_model_type", "bedrock",
+        "--index_type", "qd",
+    ]
+    environ = {
+        "AOS_ENDPOINT": "aos.example.com",
+        "CHATBOT_TABLE_NAME": "chatbot",
+        "ETL_OBJECT_TABLE_NAME": "etl-object",
+        "ETL_ENDPOINT": "etl",
+        "RES_BUCKET": "res",
+        "REGION": "us-east-1",
+        "BEDROCK_REGION": "us-east-1",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }
+    with mock.patch.object(sys, "argv", argv), mock.patch.dict(os.environ, environ):
+        spec = importlib.util.spec_from_file_location("glue_job_script", SCRIPT_PATH)
+        module = importlib.util.module_from_spec(spec)
+        # parse_object is pickled by reference for the parse worker processes
+        sys.modules["glue_job_script"] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+glue_job_script = load_glue_job_script()
+
+# three batches of two chunks per file
+SECTIONS_PER_FILE = 6
+
+
+def process_object(s3, file_type, file_content, **kwargs):
+    # runs in the parse worker processes
+    if kwargs["key"] == "docs/broken.md":
+        raise ValueError("can not parse")
+    return [
+        Document(
+            page_content=f"{file_content} section {i}",
+            metadata={"file_path": f"s3://bucket/{kwargs['key']}", "chunk_id": f"${i}"},
+        )
+        for i in range(SECTIONS_PER_FILE)
+    ]
+
+
+class FakeTable:
+    def __init__(self):
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def put_item(self, Item):
+        with self._lock:
+            self.statuses.setdefault(Item["s3Prefix"], []).append(Item["status"])
+
+
+class FakeFileProcessor(glue_job_script.S3FileProcessor):
+    def get_file_content(self, key):
+        if key == "docs/missing.md":
+            raise KeyError(key)
+        return key.encode("utf-8")
+
+
+class FakeIngestionWorker:
+    def __init__(self):
+        self.embedded = []
+        self.indexed = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, documents):
+        key = documents[0].metadata["file_path"].split("/", 3)[-1]
+        with self._lock:
+            self.embedded.append(key)
+        if key == "docs/bad-batch.md":
+            raise RuntimeError("throttled")
+        texts = [d.page_content for d in documents]
+        return texts, [[0.1]] * len(texts), [d.metadata for d in documents]
+
+    def index_documents(self, texts, embeddings_vectors, metadatas):
+        with self._lock:
+            self.indexed.extend(texts)
+
+
+def s3_files(*keys):
+    return [(key.split(".")[-1], "", {"bucket": "bucket", "key": key}) for key in keys]
+
+
+class TestIngestionPipeline(unittest.TestCase):
+    def setUp(self):
+        self.table = FakeTable()
+        self.worker = FakeIngestionWorker()
+        for attribute, value in (
+            ("etl_object_table", self.table),
+            ("cb_process_object", process_object),
+            ("ARTIFACT_SAMPLE_RATE", 0),
+            ("PARSE_WORKERS", 2),
+            # one batch in flight besides the failing one
+            ("EMBED_WORKERS", 1),
+        ):
+            patcher = mock.patch.object(glue_job_script, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.file_processor = FakeFileProcessor("bucket", "docs/", ["md"])
+        self.batch_processor = glue_job_script.BatchChunkDocumentProcessor(
+            chunk_size=1024, chunk_overlap=30, batch_size=2
+        )
+
+    def run_pipeline(self, keys, extract_only=False):
+        glue_job_script.ingestion_pipeline(
+            s3_files(*keys),
+            self.batch_processor,
+            self.worker,
+            self.file_processor,
+            extract_only=extract_only,
+        )
+        return self.table.statuses
+
+    def test_statuses(self):
+        statuses = self.run_pipeline([
+            "docs/a.md", "docs/broken.md", "docs/bad-batch.md", "docs/b.md",
+            "docs/c.exe", "docs/missing.md",
+        ])
+        self.assertEqual(statuses, {
+            "docs/a.md": ["RUNNING", "SUCCEED"],
+            "docs/b.md": ["RUNNING", "SUCCEED"],
+            # parse failure
+            "docs/broken.md": ["RUNNING", "FAILED"],
+            # failed embed batch, written once
+            "docs/bad-batch.md": ["RUNNING", "FAILED"],
+            # unsupported type, written by process_file
+            "docs/c.exe": ["RUNNING", "FAILED"],
+            # download failure
+            "docs/missing.md": ["FAILED"],
+        })
+        # the batches of the failed file after the next one are skipped
+        self.assertLess(self.worker.embedded.count("docs/bad-batch.md"), 3)
+        self.assertEqual(
+            sorted(self.worker.indexed),
+            [f"docs/{k}.md section {i}" for k in "ab" for i in range(SECTIONS_PER_FILE)],
+        )
+
+    def test_extract_only(self):
+        statuses = self.run_pipeline(
+            ["docs/a.md", "docs/broken.md", "docs/c.exe"], extract_only=True)
+        self.assertEqual(statuses, {
+            "docs/a.md": ["RUNNING", "SUCCEED"],
+            "docs/broken.md": ["RUNNING", "FAILED"],
+            "docs/c.exe": ["RUNNING", "FAILED"],
+        })
+        self.assertEqual(self.worker.embedded, [])
+        self.assertEqual(self.worker.indexed, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import io
+import os
+import pickle
+import unittest
+
+from llm_bot_dep.loaders.csv import process_csv
+from llm_bot_dep.loaders.loader_input import LoaderInput
+
+CSV_CONTENT = "name,price\napple,1\npear,2\n".encode("utf-8")
+
+
+class CountingS3Client:
+    """Stub S3 client counting the object transfers"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.transfers = 0
+
+    def get_object(self, Bucket, Key):
+        self.transfers += 1
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def download_fileobj(self, Bucket, Key, Fileobj):
+        self.transfers += 1
+        Fileobj.write(self.objects[(Bucket, Key)])
+
+    def download_file(self, Bucket, Key, Filename):
+        self.transfers += 1
+        with open(Filename, "wb") as local_file:
+            local_file.write(self.objects[(Bucket, Key)])
+
+
+class TestLoaderInput(unittest.TestCase):
+    def setUp(self):
+        self.s3 = CountingS3Client({("bucket", "docs/fruits.csv"): CSV_CONTENT})
+
+    def test_reuses_downloaded_content(self):
+        # as S3FileProcessor reads the object
+        content = self.s3.get_object(Bucket="bucket", Key="docs/fruits.csv")["Body"].read()
+        loader_input = LoaderInput.wrap(self.s3, content, "bucket", "docs/fruits.csv")
+
+        docs = process_csv(
+            self.s3, loader_input, bucket="bucket", key="docs/fruits.csv", csv_row_count=1
+        )
+        self.assertEqual(self.s3.transfers, 1)
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(docs[0].metadata["file_path"], "s3://bucket/docs/fruits.csv")
+        self.assertIn("|apple|1|", docs[0].page_content)
+
+        # a single local copy
+        path = loader_input.local_path()
+        self.assertEqual(loader_input.local_path(), path)
+        loader_input.remove_local_copy()
+        self.assertFalse(os.path.exists(path))
+
+    def test_reads_from_s3_once(self):
+        with LoaderInput.wrap(self.s3, "", "bucket", "docs/fruits.csv") as loader_input:
+            self.assertEqual(loader_input.read_bytes(), CSV_CONTENT)
+            path = loader_input.local_path()
+            self.assertTrue(path.endswith(".csv"))
+            with open(path, "rb") as local_file:
+                self.assertEqual(local_file.read(), CSV_CONTENT)
+            self.assertEqual(loader_input.read_bytes(), CSV_CONTENT)
+        self.assertEqual(self.s3.transfers, 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_pickle(self):
+        # sent to the parse worker processes
+        loader_input = LoaderInput.from_s3(self.s3, "bucket", "docs/fruits.csv")
+        local_path = loader_input.local_path()
+        copy = pickle.loads(pickle.dumps(loader_input))
+        self.assertEqual(copy.read_bytes(), CSV_CONTENT)
+        self.assertNotEqual(copy.local_path(), local_path)
+        copy.close()
+        loader_input.close()
+        self.assertEqual(self.s3.transfers, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import threading
+import time
+import unittest
+
+from llm_bot_dep.pipeline_utils import (
+    CompletionTracker,
+    PipelineStage,
+    StagedPipeline,
+)
+
+DOWNLOAD_TIME = 0.02
+PARSE_TIME = 0.02
+EMBED_TIME = 0.03
+INDEX_TIME = 0.01
+BATCHES_PER_FILE = 2
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def download(key):
+    time.sleep(DOWNLOAD_TIME)
+    return key
+
+
+def parse(key):
+    # cpu bound, run in worker processes
+    if key == "broken.pdf":
+        raise ValueError("can not parse")
+    busy_wait(PARSE_TIME)
+    return [(key, i) for i in range(BATCHES_PER_FILE)]
+
+
+def embed(batch):
+    time.sleep(EMBED_TIME)
+    if batch == ("bad-batch.pdf", 1):
+        raise RuntimeError("throttled")
+    return batch
+
+
+class FakeIndex:
+    def __init__(self):
+        self.bulk_requests = []
+        self._lock = threading.Lock()
+
+    def bulk(self, batches):
+        time.sleep(INDEX_TIME)
+        with self._lock:
+            self.bulk_requests.append(batches)
+
+
+def sequential_ingestion(keys, index):
+    statuses = {}
+    for key in keys:
+        try:
+            for batch in parse(download(key)):
+                index.bulk([embed(batch)])
+            statuses[key] = "SUCCEED"
+        except Exception:
+            statuses[key] = "FAILED"
+    return statuses
+
+
+def pipelined_ingestion(keys, index, parse_workers=2):
+    statuses = {}
+
+    def on_complete(key, info, error):
+        assert key not in statuses
+        statuses[key] = "SUCCEED" if error is None else "FAILED"
+
+    tracker = CompletionTracker(on_complete)
+
+    def prefetch(key):
+        tracker.add(key)
+        return download(key)
+
+    pipeline = StagedPipeline([
+        PipelineStage("prefetch", prefetch, workers=4),
+        PipelineStage(
+            "parse", parse, workers=parse_workers, use_processes=True, fan_out=True,
+            on_result=lambda key, batches: tracker.set_parts(key, len(batches)),
+            on_error=lambda key, e: tracker.fail(key, e),
+        ),
+        PipelineStage(
+            "embed", embed, workers=4,
+            on_error=lambda batch, e: tracker.fail(batch[0], e),
+        ),
+        PipelineStage(
+            "index", index.bulk, coalesce=4,
+            on_result=lambda batches, _: [tracker.part_done(b[0]) for b in batches],
+        ),
+    ])
+    pipeline.run(keys)
+    return statuses, pipeline
+
+
+class TestStagedPipeline(unittest.TestCase):
+    def test_statuses(self):
+        keys = [f"{i}.pdf" for i in range(6)] + ["broken.pdf", "bad-batch.pdf"]
+        expected = sequential_ingestion(keys, FakeIndex())
+        index = FakeIndex()
+        statuses, pipeline = pipelined_ingestion(keys, index)
+
+        self.assertEqual(statuses, expected)
+        self.assertEqual(statuses["broken.pdf"], "FAILED")
+        self.assertEqual(statuses["bad-batch.pdf"], "FAILED")
+        indexed = [batch for request in index.bulk_requests for batch in request]
+        self.assertEqual(len(indexed), 6 * BATCHES_PER_FILE + 1)
+        metrics = {m["stage"]: m for m in pipeline.metrics()}
+        self.assertEqual(metrics["parse"]["errors"], 1)
+        self.assertEqual(metrics["embed"]["items_in"], 7 * BATCHES_PER_FILE)
+        self.assertEqual(metrics["index"]["items_in"], 6 * BATCHES_PER_FILE + 1)
+        self.assertLessEqual(len(index.bulk_requests), len(indexed))
+
+    def test_backpressure(self):
+        produced = []
+        consumed = []
+        max_ahead = []
+
+        def items():
+            for i in range(50):
+                produced.append(i)
+                max_ahead.append(len(produced) - len(consumed))
+                yield i
+
+        def slow_sink(item):
+            time.sleep(0.002)
+            consumed.append(item)
+
+        StagedPipeline([
+            PipelineStage("double", lambda x: 2 * x, workers=2, queue_size=2),
+            PipelineStage("sink", slow_sink, queue_size=2),
+        ]).run(items())
+        self.assertEqual(len(consumed), 50)
+        # bounded by the queue sizes and items in flight, not the input size
+        self.assertLessEqual(max(max_ahead), 12)
+
+    def test_benchmark(self):
+        keys = [f"{i}.pdf" for i in range(20)]
+        start = time.perf_counter()
+        sequential_ingestion(keys, FakeIndex())
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, pipeline = pipelined_ingestion(keys, FakeIndex())
+        pipelined_time = time.perf_counter() - start
+
+        print(
+            f"{len(keys)} files: sequential {sequential_time:.2f}s, "
+            f"pipelined {pipelined_time:.2f}s"
+        )
+        pipeline.log_metrics()
+        self.assertLess(pipelined_time, sequential_time / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
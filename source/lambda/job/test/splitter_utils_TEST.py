@@ -0,0 +1,251 @@
+import random
+import re
+import time
+import unittest
+import uuid
+from unittest import mock
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from llm_bot_dep import splitter_utils
+from llm_bot_dep.splitter_utils import (
+    MarkdownHeaderTextSplitter,
+    chunk_documents,
+    extract_headings,
+    find_child,
+    find_next_with_same_level,
+    find_parent,
+    find_previous_with_same_level,
+)
+
+
+def quadratic_extract_headings(md_content: str):
+    # extract_headings before the single pass rewrite
+    header_index = 0
+    headers = {}
+    id_index_dict = {}
+    for line in md_content.split("\n"):
+        match = re.match(r"\s*(#+)(.*)", line)
+        if match:
+            header_index += 1
+            level = len(match.group(1))
+            title = match.group(2).strip()
+            _id = f"${header_index}-{str(uuid.uuid4())[:8]}"
+            headers[_id] = {
+                "title": title,
+                "level": level,
+                "parent": find_parent(headers, level),
+                "previous": find_previous_with_same_level(headers, level),
+            }
+            id_index_dict.setdefault(title, []).append(_id)
+
+    for header_obj in headers:
+        headers[header_obj]["child"] = find_child(headers, header_obj)
+        headers[header_obj]["next"] = find_next_with_same_level(headers, header_obj)
+
+    return headers, id_index_dict
+
+
+def two_pass_chunk_generator(content, text_splitter):
+    # BatchChunkDocumentProcessor.chunk_generator before chunk_documents
+    updated_heading_hierarchy = {}
+    for temp_document in content:
+        temp_chunk_id = temp_document.metadata["chunk_id"]
+        temp_split_size = len(text_splitter.split_documents([temp_document]))
+        if "heading_hierarchy" in temp_document.metadata:
+            temp_hierarchy = temp_document.metadata["heading_hierarchy"]
+            temp_hierarchy["size"] = temp_split_size
+            updated_heading_hierarchy[temp_chunk_id] = temp_hierarchy
+
+    for document in content:
+        splits = text_splitter.split_documents([document])
+        index = 1
+        for split in splits:
+            chunk_id = split.metadata["chunk_id"]
+            split.metadata["chunk_id"] = f"{chunk_id}-{index}"
+            if chunk_id in updated_heading_hierarchy:
+                split.metadata["heading_hierarchy"] = updated_heading_hierarchy[chunk_id]
+            index += 1
+            yield split
+
+
+def generate_markdown(heading_count: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = []
+    level = 1
+    for i in range(heading_count):
+        # mostly nested sections, with jumps and skipped levels
+        level = max(1, min(6, level + rng.choice([-3, -1, -1, 0, 0, 1, 1, 2])))
+        title = f"Section {rng.randrange(heading_count // 4 + 1)}"
+        indent = " " if rng.random() < 0.05 else ""
+        separator = "" if rng.random() < 0.05 else " "
+        lines.append(f"{indent}{'#' * level}{separator}{title}")
+        for _ in range(rng.randrange(3)):
+            lines.append(f"Paragraph {i} with a | table | row |")
+    return "\n".join(lines)
+
+
+def run_with_fixed_ids(function, md_content):
+    counter = iter(range(10**9))
+    with mock.patch.object(
+        splitter_utils.uuid, "uuid4", side_effect=lambda: uuid.UUID(int=next(counter))
+    ):
+        return function(md_content)
+
+
+class TestExtractHeadings(unittest.TestCase):
+    def test_same_as_quadratic(self):
+        for seed in range(5):
+            md_content = generate_markdown(1500, seed)
+            expected = run_with_fixed_ids(quadratic_extract_headings, md_content)
+            result = run_with_fixed_ids(extract_headings, md_content)
+            self.assertEqual(result, expected)
+            # same key order in the serialized hierarchy
+            self.assertEqual(
+                [list(header) for header in result[0].values()],
+                [list(header) for header in expected[0].values()],
+            )
+
+    def test_small_document(self):
+        headers, id_index_dict = extract_headings(
+            "# A\ntext\n## B\n### C\n## D\n# A\n### E"
+        )
+        ids = list(headers)
+        a, b, c, d, a2, e = ids
+        self.assertEqual(headers[a]["child"], [b, d])
+        self.assertEqual(headers[b]["child"], [c])
+        self.assertEqual(headers[b]["parent"], a)
+        self.assertEqual(headers[b]["next"], d)
+        self.assertEqual(headers[d]["previous"], b)
+        self.assertEqual(headers[a]["next"], a2)
+        # a skipped level, not a child of A
+        self.assertEqual(headers[e]["parent"], a2)
+        self.assertEqual(headers[a2]["child"], [])
+        self.assertEqual(headers[e]["previous"], c)
+        self.assertEqual(id_index_dict["A"], [a, a2])
+
+    def test_50k_headings(self):
+        md_content = generate_markdown(50000)
+        start = time.perf_counter()
+        headers, _ = extract_headings(md_content)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(headers), 50000)
+
+        # compare sampled headers with the quadratic lookups
+        rng = random.Random(0)
+        ids = list(headers)
+        for header_id in rng.sample(ids, 50):
+            index = ids.index(header_id)
+            level = headers[header_id]["level"]
+            before = dict((i, headers[i]) for i in ids[:index])
+            self.assertEqual(headers[header_id]["parent"], find_parent(before, level))
+            self.assertEqual(
+                headers[header_id]["previous"], find_previous_with_same_level(before, level)
+            )
+            self.assertEqual(headers[header_id]["child"], find_child(headers, header_id))
+            self.assertEqual(
+                headers[header_id]["next"], find_next_with_same_level(headers, header_id)
+            )
+
+        # the quadratic version takes minutes for 50k headings, time it on
+        # a smaller document and scale
+        small_content = generate_markdown(2500)
+        start = time.perf_counter()
+        quadratic_extract_headings(small_content)
+        quadratic_small = time.perf_counter() - start
+        start = time.perf_counter()
+        extract_headings(small_content)
+        linear_small = time.perf_counter() - start
+        print(
+            f"2500 headings: quadratic {quadratic_small:.2f}s, "
+            f"single pass {linear_small * 1000:.1f}ms "
+            f"({quadratic_small / linear_small:.0f}x); "
+            f"50000 headings: single pass {elapsed * 1000:.0f}ms, "
+            f"quadratic estimated {quadratic_small * 400:.0f}s"
+        )
+        self.assertLess(linear_small * 10, quadratic_small)
+
+
+def generate_corpus(heading_count: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(200)]
+    lines = []
+    for i, heading in enumerate(generate_markdown(heading_count, seed).split("\n")):
+        if heading.lstrip().startswith("#"):
+            lines.append(heading.strip())
+            paragraphs = rng.randrange(1, 4)
+            for _ in range(paragraphs):
+                lines.append(" ".join(rng.choice(words) for _ in range(rng.randrange(20, 300))))
+                lines.append("")
+    return "\n".join(lines)
+
+
+def split_sections(md_content: str):
+    return run_with_fixed_ids(
+        MarkdownHeaderTextSplitter(None).split_text,
+        Document(page_content=md_content, metadata={"file_path": "s3://bucket/manual.md"}),
+    )
+
+
+class TestChunkDocuments(unittest.TestCase):
+    def setUp(self):
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=30)
+
+    def test_same_as_two_pass(self):
+        md_content = generate_corpus(300)
+        expected = list(two_pass_chunk_generator(split_sections(md_content), self.text_splitter))
+        chunks = list(chunk_documents(split_sections(md_content), self.text_splitter))
+        self.assertGreater(len(chunks), 300)
+        self.assertEqual(chunks, expected)
+        self.assertEqual(
+            [list(chunk.metadata) for chunk in chunks],
+            [list(chunk.metadata) for chunk in expected],
+        )
+        sizes = {}
+        for chunk in chunks:
+            sizes[chunk.metadata["chunk_id"].rsplit("-", 1)[0]] = int(
+                chunk.metadata["chunk_id"].rsplit("-", 1)[1]
+            )
+        for chunk in chunks:
+            self.assertEqual(
+                chunk.metadata["heading_hierarchy"]["size"],
+                sizes[chunk.metadata["chunk_id"].rsplit("-", 1)[0]],
+            )
+
+    def test_duplicated_chunk_ids(self):
+        # chunks get the heading_hierarchy of the last section with their chunk id
+        sections = [
+            Document(
+                page_content="a " * 400,
+                metadata={"chunk_id": "$1", "heading_hierarchy": {"title": "A"}, "figure_list": []},
+            ),
+            Document(page_content="b", metadata={"chunk_id": "$1", "heading_hierarchy": {"title": "B"}}),
+        ]
+        chunks = list(chunk_documents(sections, self.text_splitter))
+        self.assertEqual([c.metadata["chunk_id"] for c in chunks], ["$1-1", "$1-2", "$1-1"])
+        self.assertEqual(chunks[0].metadata["heading_hierarchy"], {"title": "B", "size": 1})
+        self.assertIs(chunks[0].metadata["heading_hierarchy"], chunks[2].metadata["heading_hierarchy"])
+        # other metadata is copied
+        chunks[0].metadata["figure_list"].append("figure")
+        self.assertEqual(chunks[1].metadata["figure_list"], [])
+
+    def test_benchmark(self):
+        md_content = generate_corpus(3000)
+        cpu_times = {}
+        for name, chunker in (("two pass", two_pass_chunk_generator), ("single pass", chunk_documents)):
+            sections = split_sections(md_content)
+            start = time.process_time()
+            chunk_count = sum(1 for _ in chunker(sections, self.text_splitter))
+            cpu_times[name] = time.process_time() - start
+        print(
+            f"{len(md_content) // 1024}KB markdown, {len(sections)} sections, "
+            f"{chunk_count} chunks: two pass {cpu_times['two pass']:.2f}s CPU, "
+            f"single pass {cpu_times['single pass']:.2f}s CPU"
+        )
+        # one of the two split_text passes per document is removed, so the
+        # speedup stays under 2x
+        self.assertLess(cpu_times["single pass"], 0.7 * cpu_times["two pass"])
+
+
+if __name__ == "__main__":
+    unittest.main()
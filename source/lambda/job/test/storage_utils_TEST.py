@@ -0,0 +1,141 @@
+import io
+import threading
+import time
+import unittest
+
+from langchain.docstore.document import Document
+from llm_bot_dep.constant import SplittingType
+from llm_bot_dep.storage_utils import (
+    ArtifactWriter,
+    read_artifacts,
+    save_content_to_s3,
+)
+
+PUT_LATENCY = 0.002
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        time.sleep(PUT_LATENCY)
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        with self._lock:
+            self.objects[(Bucket, Key)] = Body
+        return {}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def get_paginator(self, operation_name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = sorted(
+                    key for bucket, key in client.objects
+                    if bucket == Bucket and key.startswith(Prefix)
+                )
+                yield {"Contents": [{"Key": key} for key in keys]}
+
+        return Paginator()
+
+
+def make_documents(file_path, count):
+    return [
+        Document(
+            page_content=f"chunk {i}\nof {file_path}",
+            metadata={"file_path": file_path, "chunk_id": f"$${i}", "heading_hierarchy": {}},
+        )
+        for i in range(count)
+    ]
+
+
+class TestArtifactWriter(unittest.TestCase):
+    def test_one_object_per_file_and_type(self):
+        s3 = FakeS3Client()
+        sections = make_documents("s3://bucket/a.pdf", 3)
+        chunks = make_documents("s3://bucket/a.pdf", 20) + make_documents("s3://bucket/b.md", 5)
+        with ArtifactWriter(s3, "res") as writer:
+            for document in sections:
+                writer.add(document, SplittingType.SEMANTIC.value)
+            for document in chunks:
+                writer.add(document, SplittingType.CHUNK.value)
+        self.assertEqual(len(s3.objects), 3)
+        self.assertTrue(all(key.endswith(".jsonl") for _, key in s3.objects))
+
+        saved = list(read_artifacts(s3, "res", "s3://bucket/a.pdf", SplittingType.CHUNK.value))
+        self.assertEqual(saved, chunks[:20])
+        saved = list(read_artifacts(s3, "res", "s3://bucket/a.pdf"))
+        self.assertEqual(len(saved), 23)
+
+    def test_size_cap(self):
+        s3 = FakeS3Client()
+        documents = make_documents("s3://bucket/a.pdf", 100)
+        with ArtifactWriter(s3, "res", max_object_size=1000) as writer:
+            for document in documents:
+                writer.add(document, SplittingType.CHUNK.value)
+        self.assertGreater(len(s3.objects), 5)
+        self.assertTrue(all(len(body) < 1200 for body in s3.objects.values()))
+        saved = list(read_artifacts(s3, "res", "s3://bucket/a.pdf"))
+        self.assertCountEqual(
+            [d.metadata["chunk_id"] for d in saved],
+            [d.metadata["chunk_id"] for d in documents],
+        )
+
+    def test_sampling(self):
+        s3 = FakeS3Client()
+        with ArtifactWriter(s3, "res", sample_rate=0) as writer:
+            for document in make_documents("s3://bucket/a.pdf", 10):
+                writer.add(document, SplittingType.CHUNK.value)
+        self.assertEqual(s3.objects, {})
+
+        file_paths = [f"s3://bucket/{i}.pdf" for i in range(200)]
+        with ArtifactWriter(s3, "res", sample_rate=0.25) as writer:
+            for file_path in file_paths:
+                for document in make_documents(file_path, 2):
+                    writer.add(document, SplittingType.CHUNK.value)
+        sampled = [f for f in file_paths if writer.is_sampled(f)]
+        self.assertEqual(len(s3.objects), len(sampled))
+        self.assertTrue(20 < len(sampled) < 80)
+        for file_path in sampled:
+            self.assertEqual(len(list(read_artifacts(s3, "res", file_path))), 2)
+
+    def test_reads_logger_files(self):
+        s3 = FakeS3Client()
+        documents = make_documents("s3://bucket/a.pdf", 3)
+        for document in documents:
+            save_content_to_s3(s3, document, "res", SplittingType.CHUNK.value)
+        self.assertEqual(len(s3.objects), 3)
+        saved = list(read_artifacts(s3, "res", "s3://bucket/a.pdf"))
+        self.assertCountEqual(
+            [(d.page_content, d.metadata["chunk_id"]) for d in saved],
+            [(d.page_content, d.metadata["chunk_id"]) for d in documents],
+        )
+
+    def test_benchmark(self):
+        documents = make_documents("s3://bucket/a.pdf", 500)
+        s3 = FakeS3Client()
+        start = time.perf_counter()
+        for document in documents:
+            save_content_to_s3(s3, document, "res", SplittingType.CHUNK.value)
+        per_document_time = time.perf_counter() - start
+
+        s3 = FakeS3Client()
+        start = time.perf_counter()
+        with ArtifactWriter(s3, "res") as writer:
+            for document in documents:
+                writer.add(document, SplittingType.CHUNK.value)
+        writer_time = time.perf_counter() - start
+        print(
+            f"{len(documents)} chunks: one object per chunk {per_document_time * 1000:.0f}ms, "
+            f"artifact writer {writer_time * 1000:.0f}ms with {len(s3.objects)} objects"
+        )
+        self.assertLess(writer_time, per_document_time / 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
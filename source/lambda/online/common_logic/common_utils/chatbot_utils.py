@@ -1,5 +1,8 @@
+import copy
 import logging
 import os
+import threading
+import time
 from datetime import datetime
 from typing import List
 
@@ -8,7 +11,45 @@ import boto3
 from .chatbot import Chatbot
 
 
+CHATBOT_CACHE_TTL = int(os.environ.get("CHATBOT_CACHE_TTL", 300))
+CHATBOT_CACHE_VERSION_CHECK_INTERVAL = int(
+    os.environ.get("CHATBOT_CACHE_VERSION_CHECK_INTERVAL", 10)
+)
+# batch_get_item accepts at most 100 keys per request
+BATCH_GET_MAX_KEYS = 100
+
+logger = logging.getLogger("chatbot_utils")
+logger.setLevel(logging.INFO)
+
+
+def batch_get_items(table, keys: List[dict]):
+    """Get items by keys from a table with batch_get_item
+
+    Args:
+        table: DynamoDB table resource
+        keys (List[dict]): item keys, duplicates are fetched once
+
+    Returns:
+        list of items, in no particular order
+    """
+    unique_keys = list({tuple(sorted(key.items())): key for key in keys}.values())
+    items = []
+    for i in range(0, len(unique_keys), BATCH_GET_MAX_KEYS):
+        request_items = {table.name: {"Keys": unique_keys[i:i + BATCH_GET_MAX_KEYS]}}
+        while request_items:
+            response = table.meta.client.batch_get_item(RequestItems=request_items)
+            items.extend(response.get("Responses", {}).get(table.name, []))
+            request_items = response.get("UnprocessedKeys")
+    return items
+
+
 class ChatbotManager:
+    # chatbot configurations cached in the warm container, shared by all
+    # managers and keyed by (group_name, chatbot_id)
+    _chatbot_cache = {}
+    _chatbot_cache_lock = threading.Lock()
+    _environ_instance = None
+
     def __init__(self, chatbot_table, index_table, model_table):
         self.chatbot_table = chatbot_table
         self.index_table = index_table
@@ -16,6 +57,8 @@ class ChatbotManager:
 
     @classmethod
     def from_environ(cls):
+        if cls._environ_instance is not None:
+            return cls._environ_instance
         chatbot_table_name = os.environ.get("CHATBOT_TABLE_NAME", "")
         model_table_name = os.environ.get("MODEL_TABLE_NAME", "")
         index_table_name = os.environ.get("INDEX_TABLE_NAME", "")
@@ -24,10 +67,31 @@ class ChatbotManager:
         model_table = dynamodb.Table(model_table_name)
         index_table = dynamodb.Table(index_table_name)
         chatbot_manager = cls(chatbot_table, index_table, model_table)
+        cls._environ_instance = chatbot_manager
         return chatbot_manager
 
+    @classmethod
+    def invalidate_cache(cls, group_name: str = None, chatbot_id: str = None):
+        """Drop cached chatbots, all of them if no chatbot is given"""
+        with cls._chatbot_cache_lock:
+            if group_name is None:
+                cls._chatbot_cache.clear()
+            else:
+                cls._chatbot_cache.pop((group_name, chatbot_id), None)
+
+    def _get_chatbot_version(self, group_name: str, chatbot_id: str):
+        # chatbot_management updates updateTime on every chatbot edit
+        item = self.chatbot_table.get_item(
+            Key={"groupName": group_name, "chatbotId": chatbot_id},
+            ProjectionExpression="updateTime",
+        ).get("Item")
+        return item.get("updateTime") if item else None
+
     def get_chatbot(self, group_name: str, chatbot_id: str):
-        """Get chatbot from chatbot id and add index, model, etc. data
+        """Get chatbot from chatbot id and add index, model, etc. data.
+        The result is cached for CHATBOT_CACHE_TTL seconds and revalidated
+        against the chatbot updateTime every
+        CHATBOT_CACHE_VERSION_CHECK_INTERVAL seconds.
 
         Args:
             group_name (str): group name
@@ -36,27 +100,71 @@ class ChatbotManager:
         Returns:
             Chatbot instance
         """
+        cache_key = (group_name, chatbot_id)
+        now = time.monotonic()
+        entry = self._chatbot_cache.get(cache_key)
+        if entry is not None and now < entry["expire_at"]:
+            if now - entry["checked_at"] < CHATBOT_CACHE_VERSION_CHECK_INTERVAL:
+                return entry["chatbot"]
+            if self._get_chatbot_version(group_name, chatbot_id) == entry["version"]:
+                entry["checked_at"] = now
+                return entry["chatbot"]
+            logger.info(f"chatbot {cache_key} changed, reloading")
+
+        chatbot, version = self._load_chatbot(group_name, chatbot_id)
+        with self._chatbot_cache_lock:
+            self._chatbot_cache[cache_key] = {
+                "chatbot": chatbot,
+                "version": version,
+                "checked_at": now,
+                "expire_at": now + CHATBOT_CACHE_TTL,
+            }
+        return chatbot
+
+    def _load_chatbot(self, group_name: str, chatbot_id: str):
         chatbot_response = self.chatbot_table.get_item(
             Key={"groupName": group_name, "chatbotId": chatbot_id}
         )
         chatbot_content = chatbot_response.get("Item")
         if not chatbot_content:
-            return Chatbot.from_dynamodb_item({})
+            return Chatbot.from_dynamodb_item({}), None
+
+        index_ids = [
+            index_id
+            for index_item in chatbot_content.get("indexIds").values()
+            for index_id in index_item.get("value").values()
+        ]
+        index_contents = {
+            item["indexId"]: item
+            for item in batch_get_items(
+                self.index_table,
+                [{"groupName": group_name, "indexId": index_id}
+                    for index_id in index_ids],
+            )
+        }
+        embedding_model_ids = [
+            index_content.get("modelIds").get("embedding")
+            for index_content in index_contents.values()
+        ]
+        model_contents = {
+            item["modelId"]: item
+            for item in batch_get_items(
+                self.model_table,
+                [{"groupName": group_name, "modelId": model_id}
+                    for model_id in embedding_model_ids if model_id],
+            )
+        }
+
         for index_type, index_item in chatbot_content.get("indexIds").items():
             for tag, index_id in index_item.get("value").items():
-                index_content = self.index_table.get_item(
-                    Key={"groupName": group_name, "indexId": index_id}
-                ).get("Item")
+                index_content = copy.deepcopy(index_contents.get(index_id))
                 embedding_model_id = index_content.get(
                     "modelIds").get("embedding")
                 if embedding_model_id:
-                    model_content = self.model_table.get_item(
-                        Key={"groupName": group_name,
-                             "modelId": embedding_model_id}
-                    ).get("Item")
-                    index_content["modelIds"]["embedding"] = model_content
+                    index_content["modelIds"]["embedding"] = copy.deepcopy(
+                        model_contents.get(embedding_model_id))
                 chatbot_content["indexIds"][index_type]["value"][tag] = index_content
 
         chatbot = Chatbot.from_dynamodb_item(chatbot_content)
 
-        return chatbot
+        return chatbot, chatbot_content.get("updateTime")
@@ -1,10 +1,180 @@
 import csv
 import os
 import re
+import threading
+from collections import deque
 from typing import Iterable, Union
 
 abs_dir = os.path.dirname(__file__)
 
+CHINESE_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+# "AWS" is rebranded in Chinese text, i.e. when a Chinese character is found
+# within this many characters from where it starts
+CN_REBRANDING_WINDOW = 10
+
+
+class MultiPatternMatcher:
+    """
+    Aho-Corasick automaton over a set of patterns, each with a kind and a
+    replacement. Text is scanned once whatever the number of patterns.
+    """
+
+    MASK = "mask"
+    REBRAND = "rebrand"
+    CN_REBRAND = "cn_rebrand"
+
+    def __init__(self, patterns: Iterable[tuple]):
+        """
+        Args:
+            patterns: (pattern, kind, replacement) tuples
+        """
+        self.patterns = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        self.outputs = [[]]
+        for pattern, kind, replacement in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[node] + 1)
+                    self.outputs.append([])
+                node = next_node
+            self.outputs[node].append(len(self.patterns))
+            self.patterns.append((pattern, kind, replacement))
+        self._build_fail_links()
+
+    def _build_fail_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_node] = self.goto[fail].get(char, 0)
+                self.outputs[next_node] = (
+                    self.outputs[next_node] + self.outputs[self.fail[next_node]]
+                )
+
+    def step(self, node, char):
+        while node and char not in self.goto[node]:
+            node = self.fail[node]
+        return self.goto[node].get(char, 0)
+
+
+class ContentFilterStream:
+    """
+    Apply a MultiPatternMatcher to streamed text in a single pass.
+
+    Characters covered by any MASK pattern are replaced by "*". Then the
+    leftmost-longest REBRAND/CN_REBRAND patterns which do not overlap a
+    masked character are replaced; CN_REBRAND only if a Chinese character
+    follows within CN_REBRANDING_WINDOW characters. Only the tail of the
+    text that a future match may still change is held back between chunks.
+    """
+
+    def __init__(self, matcher: MultiPatternMatcher, kinds=None):
+        self.matcher = matcher
+        self.kinds = kinds or {
+            MultiPatternMatcher.MASK,
+            MultiPatternMatcher.REBRAND,
+            MultiPatternMatcher.CN_REBRAND,
+        }
+        self.state = 0
+        self.pos = 0
+        # pending text, starting at absolute position buffer_start
+        self.buffer = []
+        self.mask = []
+        self.buffer_start = 0
+        self.candidates = []
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the text which is now final"""
+        matcher = self.matcher
+        for char in chunk:
+            self.state = matcher.step(self.state, char)
+            self.pos += 1
+            self.buffer.append(char)
+            self.mask.append(False)
+            for pattern_id in matcher.outputs[self.state]:
+                pattern, kind, _ = matcher.patterns[pattern_id]
+                if kind not in self.kinds:
+                    continue
+                start = self.pos - len(pattern)
+                if kind == MultiPatternMatcher.MASK:
+                    offset = start - self.buffer_start
+                    for i in range(offset, offset + len(pattern)):
+                        self.mask[i] = True
+                else:
+                    self.candidates.append((start, self.pos, pattern_id))
+        return self._emit(final=False)
+
+    def finish(self) -> str:
+        """Return the text held back, call once the stream ends"""
+        return self._emit(final=True)
+
+    def _masked(self, start, end):
+        offset = self.buffer_start
+        return "".join(
+            "*" if self.mask[i - offset] else self.buffer[i - offset]
+            for i in range(start, end)
+        )
+
+    def _emit(self, final):
+        # a future match may start at any of the last depth characters
+        boundary = self.pos if final else self.pos - self.matcher.depth[self.state]
+        emit_to = boundary
+        cursor = self.buffer_start
+        pieces = []
+        remaining = []
+        for start, end, pattern_id in sorted(
+            self.candidates, key=lambda x: (x[0], x[0] - x[1])
+        ):
+            if start < cursor:
+                # overlaps a replaced pattern
+                continue
+            if start >= emit_to:
+                remaining.append((start, end, pattern_id))
+                continue
+            if end > boundary:
+                # a mask ending later may still overlap it
+                emit_to = start
+                remaining.append((start, end, pattern_id))
+                continue
+            offset = self.buffer_start
+            if any(self.mask[i - offset] for i in range(start, end)):
+                continue
+            _, kind, replacement = self.matcher.patterns[pattern_id]
+            if kind == MultiPatternMatcher.CN_REBRAND:
+                window_end = start + CN_REBRANDING_WINDOW
+                if window_end > boundary and not final:
+                    emit_to = start
+                    remaining.append((start, end, pattern_id))
+                    continue
+                window = self._masked(start, min(window_end, self.pos))
+                if not CHINESE_PATTERN.search(window):
+                    continue
+            pieces.append(self._masked(cursor, start))
+            pieces.append(replacement)
+            cursor = end
+
+        pieces.append(self._masked(cursor, emit_to))
+        consumed = emit_to - self.buffer_start
+        del self.buffer[:consumed]
+        del self.mask[:consumed]
+        self.buffer_start = emit_to
+        self.candidates = remaining
+        return "".join(pieces)
+
 
 class ContentFilterBase:
     def filter_sentence(self, sentence: str):
@@ -12,6 +182,10 @@ class ContentFilterBase:
 
 
 class MarketContentFilter(ContentFilterBase):
+    # matchers shared by all filters of the container, keyed by word files
+    _matcher_cache = {}
+    _matcher_cache_lock = threading.Lock()
+
     def __init__(
         self,
         sensitive_words_path=os.path.join(abs_dir, "sensitive_word.csv"),
@@ -21,12 +195,41 @@ class MarketContentFilter(ContentFilterBase):
             sensitive_words_path)
         self.aws_products = self.create_aws_products(aws_products_path)
         # Define a regular expression pattern to match Chinese characters
-        self.chinese_pattern = re.compile(r"[\u4e00-\u9fff]")
+        self.chinese_pattern = CHINESE_PATTERN
+        self.matcher = self.get_matcher(sensitive_words_path, aws_products_path)
 
     @staticmethod
     def check_market_entry(entry_type):
         return "mkt" in entry_type or "market" in entry_type
 
+    def get_matcher(self, sensitive_words_path, aws_products_path):
+        cache_key = (sensitive_words_path, aws_products_path)
+        with self._matcher_cache_lock:
+            matcher = self._matcher_cache.get(cache_key)
+            if matcher is None:
+                matcher = self.create_matcher()
+                self._matcher_cache[cache_key] = matcher
+        return matcher
+
+    def create_matcher(self):
+        cn_rebranding_dict = {"AWS": "亚马逊云科技"}
+        patterns = [
+            (word, MultiPatternMatcher.MASK, None)
+            for word in self.sensitive_words
+        ]
+        # Replace "AWS" by "Amazon" in product name
+        patterns.extend(
+            (key, MultiPatternMatcher.REBRAND, value)
+            for key, value in self.aws_products.items()
+        )
+        # Replace "AWS" by "亚马逊云科技" if detected Chinese characters within its right time window of length 10
+        patterns.extend(
+            (key, MultiPatternMatcher.CN_REBRAND, value)
+            for key, value in cn_rebranding_dict.items()
+            if key not in self.aws_products
+        )
+        return MultiPatternMatcher(patterns)
+
     def create_sensitive_words(self, sensitive_words_path):
         sensitive_words = set()
         with open(sensitive_words_path, mode="r") as file:
@@ -43,11 +246,12 @@ class MarketContentFilter(ContentFilterBase):
                 aws_products[row[0]] = row[1]
         return aws_products
 
+    def _filter(self, sentence, kinds=None):
+        stream = ContentFilterStream(self.matcher, kinds)
+        return stream.feed(sentence) + stream.finish()
+
     def filter_sensitive_words(self, sentence):
-        for sensitive_word in self.sensitive_words:
-            length = len(sensitive_word)
-            sentence = sentence.replace(sensitive_word, "*" * length)
-        return sentence
+        return self._filter(sentence, {MultiPatternMatcher.MASK})
 
     def contains_chinese_characters(self, text):
         # Search for the pattern in the text
@@ -57,25 +261,10 @@ class MarketContentFilter(ContentFilterBase):
         return match is not None
 
     def rebranding_words(self, sentence: str):
-        cn_rebranding_dict = {"AWS": "亚马逊云科技"}
-        # Replace "AWS" by "Amazon" in product name
-        for key, value in self.aws_products.items():
-            sentence = sentence.replace(key, value)
-
-        # Replace "AWS" by "亚马逊云科技" if detected Chinese characters within its right time window of length 10
-        for key, value in cn_rebranding_dict.items():
-            index = sentence.find(key)
-            while index != -1:
-                substring = sentence[index: index + 10]
-                if self.contains_chinese_characters(substring):
-                    sentence = sentence.replace(key, value, 1)
-                    index = sentence.find(key)
-                else:
-                    index = sentence.find(
-                        key, index + 1
-                    )  # find from at least index+1 to avoid dead loop
-
-        return sentence
+        return self._filter(
+            sentence,
+            {MultiPatternMatcher.REBRAND, MultiPatternMatcher.CN_REBRAND}
+        )
 
     def filter_source(self, sources: list[str]):
         filtered_sources = []
@@ -85,9 +274,20 @@ class MarketContentFilter(ContentFilterBase):
         return filtered_sources
 
     def filter_sentence(self, sentence):
-        sentence = self.filter_sensitive_words(sentence)
-        sentence = self.rebranding_words(sentence)
-        return sentence
+        # masking and rebranding in a single pass
+        return self._filter(sentence)
+
+    def filter_stream(self, chunks: Iterable[str]):
+        """Filter streamed chunks, e.g. from token_to_sentence_gen. Matches
+        spanning chunks are handled by holding back only their prefix."""
+        stream = ContentFilterStream(self.matcher)
+        for chunk in chunks:
+            filtered = stream.feed(chunk)
+            if filtered:
+                yield filtered
+        filtered = stream.finish()
+        if filtered:
+            yield filtered
 
 
 def token_to_sentence_gen(
@@ -1,6 +1,6 @@
 import json
 import math
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List
 
 import boto3
@@ -14,6 +14,9 @@ client = boto3.resource("dynamodb")
 
 
 class DynamoDBChatMessageHistory(BaseChatMessageHistory):
+    # set once the createTimestamp index is found missing, to skip it
+    _create_time_index_missing = False
+
     def __init__(
         self,
         sessions_table_name: str,
@@ -32,6 +35,7 @@ class DynamoDBChatMessageHistory(BaseChatMessageHistory):
         self.group_name = group_name
         self.chatbot_id = chatbot_id
         self.MESSAGE_BY_SESSION_ID_INDEX_NAME = "bySessionId"
+        self.MESSAGE_BY_SESSION_ID_CREATE_TIME_INDEX_NAME = "bySessionIdCreateTimestamp"
 
     @property
     def session(self):
@@ -44,43 +48,81 @@ class DynamoDBChatMessageHistory(BaseChatMessageHistory):
     @property
     def messages(self):
         """Retrieve the messages from DynamoDB"""
-        response = {}
-        try:
-            response = self.messages_table.query(
-                KeyConditionExpression="sessionId = :session_id",
-                ExpressionAttributeValues={":session_id": self.session_id},
-                IndexName=self.MESSAGE_BY_SESSION_ID_INDEX_NAME,
-            )
-        except ClientError as error:
-            if error.response["Error"]["Code"] == "ResourceNotFoundException":
-                print("No record found for session id: %s", self.session_id)
-            else:
-                print(error)
-
-        items = response.get("Items", [])
-        items = sorted(items, key=lambda x: x["createTimestamp"])
-
-        return items
+        return self.load_messages()
 
     @property
     def messages_as_langchain(self):
-        response = {}
+        return self.load_messages_as_langchain()
+
+    def _query_session_messages(self, index_name, limit=None, newest_first=False):
+        """Query the messages of the session page by page, stop after limit items"""
+        query_kwargs = {
+            "KeyConditionExpression": "sessionId = :session_id",
+            "ExpressionAttributeValues": {":session_id": self.session_id},
+            "IndexName": index_name,
+            "ScanIndexForward": not newest_first,
+        }
+        items = []
+        while True:
+            if limit is not None:
+                query_kwargs["Limit"] = limit - len(items)
+            response = self.messages_table.query(**query_kwargs)
+            items.extend(response.get("Items", []))
+            last_evaluated_key = response.get("LastEvaluatedKey")
+            if not last_evaluated_key or (limit is not None and len(items) >= limit):
+                return items
+            query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+    def load_messages(self, max_rounds=None):
+        """Retrieve the messages of the latest max_rounds rounds in
+        chronological order, all messages if max_rounds is None.
+        A round is a user message and its ai message.
+        """
+        limit = None if max_rounds is None else 2 * max_rounds
+        if limit is not None and limit <= 0:
+            return []
+        items = None
         try:
-            response = self.messages_table.query(
-                KeyConditionExpression="sessionId = :session_id",
-                ExpressionAttributeValues={":session_id": self.session_id},
-                IndexName=self.MESSAGE_BY_SESSION_ID_INDEX_NAME,
-            )
+            if not DynamoDBChatMessageHistory._create_time_index_missing:
+                try:
+                    items = self._query_session_messages(
+                        self.MESSAGE_BY_SESSION_ID_CREATE_TIME_INDEX_NAME,
+                        limit=limit,
+                        newest_first=True,
+                    )
+                    items.reverse()
+                except ClientError as error:
+                    if error.response["Error"]["Code"] != "ValidationException":
+                        raise
+                    # the index sorted by createTimestamp is not deployed yet
+                    DynamoDBChatMessageHistory._create_time_index_missing = True
+            if items is None:
+                items = self._query_session_messages(
+                    self.MESSAGE_BY_SESSION_ID_INDEX_NAME)
+                items = sorted(items, key=lambda x: x["createTimestamp"])
+                if limit is not None:
+                    items = items[-limit:]
         except ClientError as error:
             if error.response["Error"]["Code"] == "ResourceNotFoundException":
                 print("No record found for session id: %s", self.session_id)
             else:
                 print(error)
-        items = response.get("Items", [])
-        items = sorted(items, key=lambda x: x["createTimestamp"])
-        ret = []
+            return []
 
-        for item in items:
+        # drop the ai message whose user message is beyond the limit
+        if (
+            limit is not None
+            and len(items) >= limit
+            and items[0]["role"] == MessageType.AI_MESSAGE_TYPE
+        ):
+            items = items[1:]
+        return items
+
+    def load_messages_as_langchain(self, max_rounds=None):
+        """Same as load_messages, in langchain message format"""
+        ret = []
+        # only the kept items are decoded
+        for item in self.load_messages(max_rounds=max_rounds):
             assert item["role"] in [
                 MessageType.AI_MESSAGE_TYPE,
                 MessageType.HUMAN_MESSAGE_TYPE,
@@ -136,6 +178,60 @@ class DynamoDBChatMessageHistory(BaseChatMessageHistory):
                 }
             )
 
+    def upsert_session(self, latest_question=""):
+        """Create or update the session record with a single update_item"""
+        current_timestamp = datetime.utcnow().isoformat() + "Z"
+        update_expression = (
+            "SET lastModifiedTimestamp = :t"
+            ", chatbotId = if_not_exists(chatbotId, :chatbot_id)"
+            ", clientType = if_not_exists(clientType, :client_type)"
+            ", startTime = if_not_exists(startTime, :t)"
+            ", createTimestamp = if_not_exists(createTimestamp, :t)"
+        )
+        expression_attribute_values = {
+            ":t": current_timestamp,
+            ":chatbot_id": self.chatbot_id,
+            ":client_type": self.client_type,
+        }
+        if latest_question:
+            update_expression += ", latestQuestion = :q"
+            expression_attribute_values[":q"] = latest_question
+        else:
+            update_expression += ", latestQuestion = if_not_exists(latestQuestion, :q)"
+            expression_attribute_values[":q"] = ""
+
+        self.sessions_table.update_item(
+            Key={"sessionId": self.session_id, "userId": self.user_id},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_attribute_values,
+        )
+
+    def _build_message_item(
+        self,
+        message_id,
+        message_type,
+        custom_message_id,
+        entry_type,
+        message_content,
+        current_timestamp,
+        input_message_id="",
+        additional_kwargs=None,
+    ):
+        additional_kwargs = additional_kwargs or {}
+        return {
+            "messageId": message_id,
+            "sessionId": self.session_id,
+            "chatbotId": self.chatbot_id,
+            "role": message_type,
+            "customMessageId": custom_message_id,
+            "inputMessageId": input_message_id,
+            "entryType": entry_type,
+            "content": message_content,
+            "createTimestamp": current_timestamp,
+            "lastModifiedTimestamp": current_timestamp,
+            "additional_kwargs": json.dumps(additional_kwargs),
+        }
+
     def add_message(
         self,
         message_id,
@@ -148,27 +244,68 @@ class DynamoDBChatMessageHistory(BaseChatMessageHistory):
     ) -> None:
         """Append the message to the record in DynamoDB"""
         current_timestamp = datetime.utcnow().isoformat() + "Z"
-        additional_kwargs = additional_kwargs or {}
 
         try:
             self.messages_table.put_item(
-                Item={
-                    "messageId": message_id,
-                    "sessionId": self.session_id,
-                    "chatbotId": self.chatbot_id,
-                    "role": message_type,
-                    "customMessageId": custom_message_id,
-                    "inputMessageId": input_message_id,
-                    "entryType": entry_type,
-                    "content": message_content,
-                    "createTimestamp": current_timestamp,
-                    "lastModifiedTimestamp": current_timestamp,
-                    "additional_kwargs": json.dumps(additional_kwargs),
-                }
+                Item=self._build_message_item(
+                    message_id,
+                    message_type,
+                    custom_message_id,
+                    entry_type,
+                    message_content,
+                    current_timestamp,
+                    input_message_id=input_message_id,
+                    additional_kwargs=additional_kwargs,
+                )
             )
         except ClientError as err:
             print(f"Error adding message: {err}")
 
+    def add_round(
+        self,
+        user_message_id,
+        ai_message_id,
+        custom_message_id,
+        entry_type,
+        query,
+        answer,
+        additional_kwargs=None,
+    ) -> None:
+        """Append the user message and its ai message with one
+        batch_write_item, then upsert the session with one update_item"""
+        now = datetime.utcnow()
+        # the ai message must sort after the user message
+        user_timestamp = now.isoformat() + "Z"
+        ai_timestamp = (now + timedelta(milliseconds=1)).isoformat() + "Z"
+        items = [
+            self._build_message_item(
+                user_message_id,
+                MessageType.HUMAN_MESSAGE_TYPE,
+                custom_message_id,
+                entry_type,
+                query,
+                user_timestamp,
+                additional_kwargs=additional_kwargs,
+            ),
+            self._build_message_item(
+                ai_message_id,
+                MessageType.AI_MESSAGE_TYPE,
+                custom_message_id,
+                entry_type,
+                answer,
+                ai_timestamp,
+                input_message_id=user_message_id,
+                additional_kwargs=additional_kwargs,
+            ),
+        ]
+        try:
+            with self.messages_table.batch_writer() as batch:
+                for item in items:
+                    batch.put_item(Item=item)
+        except ClientError as err:
+            print(f"Error adding messages: {err}")
+        self.upsert_session(latest_question=query)
+
     def add_user_message(
         self,
         message_id,
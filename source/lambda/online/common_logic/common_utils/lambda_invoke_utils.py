@@ -1,3 +1,4 @@
+import contextvars
 import enum
 import functools
 import importlib
@@ -5,21 +6,27 @@ import json
 import time
 import os
 from typing import Any, Dict, Optional, Callable, Union
-import threading
 
 import requests
 from common_logic.common_utils.constant import StreamMessageType
 from common_logic.common_utils.logger_utils import get_logger
-from common_logic.common_utils.websocket_utils import is_websocket_request, send_to_ws_client
+from common_logic.common_utils.websocket_utils import is_websocket_request, ws_sender
 from pydantic import BaseModel, Field, model_validator
 
 
 from .exceptions import LambdaInvokeError
 
 logger = get_logger("lambda_invoke_utils")
-# thread_local = threading.local()
-thread_local = threading.local()
-CURRENT_STATE = None
+# The state of the running node. A context variable is used so that nodes
+# running in parallel, and worker threads started with a copied context,
+# each see their own state.
+_current_state: contextvars.ContextVar = contextvars.ContextVar(
+    "current_state", default=None
+)
+# Objects of the running request kept out of the graph state
+_current_request_context: contextvars.ContextVar = contextvars.ContextVar(
+    "current_request_context", default=None
+)
 
 __FUNC_NAME_MAP = {
     "query_preprocess": "Preprocess for Multi-round Conversation",
@@ -36,31 +43,100 @@ class StateContext:
 
     def __init__(self, state):
         self.state = state
+        self._token = None
 
     @classmethod
     def get_current_state(cls):
-        # print("thread id",threading.get_ident(),'parent id',threading.)
-        # state = getattr(thread_local,'state',None)
-        state = CURRENT_STATE
+        state = _current_state.get()
         assert state is not None, "There is not a valid state in current context"
         return state
 
     @classmethod
     def set_current_state(cls, state):
-        global CURRENT_STATE
-        assert CURRENT_STATE is None, "Parallel node executions are not alowed"
-        CURRENT_STATE = state
+        return _current_state.set(state)
 
     @classmethod
-    def clear_state(cls):
-        global CURRENT_STATE
-        CURRENT_STATE = None
+    def clear_state(cls, token=None):
+        if token is not None:
+            _current_state.reset(token)
+        else:
+            _current_state.set(None)
+
+    def __enter__(self):
+        self._token = self.set_current_state(self.state)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.clear_state(self._token)
+        self._token = None
+
+
+class RequestContext:
+    """
+    Side context of a graph invocation. Holds what nodes need but should not
+    be part of the graph state, as it is large or not serializable, e.g. the
+    event body with its ddb history object, and the time spent merging node
+    updates into the state.
+    """
+
+    def __init__(self, **objects):
+        self.objects = objects
+        # since the last node started, and over the whole request
+        self.state_merge_time = 0.0
+        self.total_state_merge_time = 0.0
+        self._token = None
+
+    def __getitem__(self, key):
+        return self.objects[key]
+
+    def __setitem__(self, key, value):
+        self.objects[key] = value
+
+    def get(self, key, default=None):
+        return self.objects.get(key, default)
+
+    def pop(self, key, default=None):
+        return self.objects.pop(key, default)
+
+    def pop_state_merge_time(self):
+        merge_time, self.state_merge_time = self.state_merge_time, 0.0
+        return merge_time
+
+    @classmethod
+    def add_state_merge_time(cls, seconds):
+        context = _current_request_context.get()
+        if context is not None:
+            context.state_merge_time += seconds
+            context.total_state_merge_time += seconds
+
+    @classmethod
+    def get_current_context(cls):
+        context = _current_request_context.get()
+        assert context is not None, "There is not a valid request context in current context"
+        return context
 
     def __enter__(self):
-        self.set_current_state(self.state)
+        self._token = _current_request_context.set(self)
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.clear_state()
+        _current_request_context.reset(self._token)
+        self._token = None
+
+
+def timed_reducer(reducer: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    """
+    Add the time spent in a state reducer to the state merge time of the
+    current request, which node_monitor_wrapper reports.
+    """
+    @functools.wraps(reducer)
+    def wrapper(left, right):
+        start = time.perf_counter()
+        try:
+            return reducer(left, right)
+        finally:
+            RequestContext.add_state_merge_time(time.perf_counter() - start)
+
+    return wrapper
 
 
 class LAMBDA_INVOKE_MODE(enum.Enum):
@@ -252,7 +328,12 @@ def chatbot_lambda_call_wrapper(fn):
             _is_main_lambda_inner = True
 
         # run
-        ret = fn(event, context=context)
+        try:
+            ret = fn(event, context=context)
+        finally:
+            if _is_main_lambda_inner and stream:
+                # post queued traces before the lambda is frozen
+                ws_sender.flush()
         # save response to body
         # TODO
         if current_lambda_invoke_mode == LAMBDA_INVOKE_MODE.API_GW.value:
@@ -292,7 +373,7 @@ def send_trace(
 
     if enable_trace:
         if current_stream_use and ws_connection_id is not None:
-            send_to_ws_client(
+            ws_sender.send(
                 message={
                     "message_type": StreamMessageType.MONITOR,
                     "message": trace_info,
@@ -317,10 +398,19 @@ def node_monitor_wrapper(fn: Optional[Callable[..., Any]] = None, *, monitor_key
             current_stream_use = state["stream"]
             ws_connection_id = state["ws_connection_id"]
             enable_trace = state["enable_trace"]
+            # trace infos are only collected on demand
+            trace_infos = state.get("trace_infos")
+            # time spent merging the updates of the previous nodes, i.e. the
+            # input of this node
+            request_context = _current_request_context.get()
+            state_merge_time = None
+            if request_context is not None:
+                state_merge_time = request_context.pop_state_merge_time()
             send_trace(f"\n\n ### {__FUNC_NAME_MAP.get(func.__name__, func.__name__)}\n\n",
                        current_stream_use, ws_connection_id, enable_trace)
-            state['trace_infos'].append(
-                f"Enter: {func.__name__}, time: {time.time()}")
+            if trace_infos is not None:
+                trace_infos.append(
+                    f"Enter: {func.__name__}, time: {enter_time}")
 
             with StateContext(state):
                 output = func(state)
@@ -330,9 +420,13 @@ def node_monitor_wrapper(fn: Optional[Callable[..., Any]] = None, *, monitor_key
                 send_trace(f"\n\n {current_monitor_infos}",
                            current_stream_use, ws_connection_id, enable_trace)
             exit_time = time.time()
-            state['trace_infos'].append(
-                f"Exit: {func.__name__}, time: {time.time()}")
-            send_trace(f"\n\n Elapsed time: {round((exit_time-enter_time)*100)/100} s",
+            if trace_infos is not None:
+                trace_infos.append(
+                    f"Exit: {func.__name__}, time: {exit_time}")
+            elapsed_info = f"Elapsed time: {round((exit_time-enter_time)*100)/100} s"
+            if state_merge_time is not None:
+                elapsed_info += f", state merge time: {state_merge_time*1000:.3f} ms"
+            send_trace(f"\n\n {elapsed_info}",
                        current_stream_use, ws_connection_id, enable_trace)
             return output
 
@@ -0,0 +1,77 @@
+import time
+from typing import Any, Optional, Sequence, Type
+
+from langgraph.channels.base import BaseChannel
+from typing_extensions import Self
+
+from .lambda_invoke_utils import RequestContext
+
+
+class AppendOnlyListChannel(BaseChannel[list, list, tuple]):
+    """
+    State channel of a list which is only appended to, e.g.
+    chat_history: Annotated[list, AppendOnlyListChannel]
+
+    Unlike an add_messages reducer, which copies the whole list on every
+    update, updates extend a shared list in place. The channel, and every copy
+    langgraph makes of it, e.g. to evaluate conditional edges, keeps its own
+    length. Items below a length never change, so (list, length) is an
+    immutable snapshot. A channel whose list was already extended by a copy
+    adopts those items if they are the ones it is updated with, otherwise it
+    forks the list.
+
+    Nodes must not modify the lists they read from the state.
+    """
+
+    __slots__ = ("items", "length")
+
+    def __init__(self, typ: Type[Any] = list):
+        super().__init__(typ)
+        self.items = []
+        self.length = 0
+
+    def __eq__(self, value: object) -> bool:
+        return isinstance(value, AppendOnlyListChannel)
+
+    @property
+    def ValueType(self) -> Type[list]:
+        return list
+
+    @property
+    def UpdateType(self) -> Type[list]:
+        return list
+
+    def checkpoint(self) -> tuple:
+        return (self.items, self.length)
+
+    def from_checkpoint(self, checkpoint: Optional[tuple]) -> Self:
+        empty = self.__class__(self.typ)
+        empty.key = self.key
+        if checkpoint is not None:
+            empty.items, empty.length = checkpoint
+        return empty
+
+    def _extend(self, new_items: list):
+        end = self.length + len(new_items)
+        if len(self.items) == self.length:
+            self.items.extend(new_items)
+        elif len(self.items) < end or any(
+            item is not new_item
+            for item, new_item in zip(self.items[self.length:end], new_items)
+        ):
+            self.items = self.items[:self.length] + new_items
+        self.length = end
+
+    def update(self, values: Sequence[list]) -> bool:
+        if not values:
+            return False
+        start = time.perf_counter()
+        for new_items in values:
+            self._extend(list(new_items))
+        RequestContext.add_state_merge_time(time.perf_counter() - start)
+        return True
+
+    def get(self) -> list:
+        if len(self.items) == self.length:
+            return self.items
+        return self.items[:self.length]
@@ -1,6 +1,8 @@
 import boto3
 import os
 import json
+import threading
+import time
 
 from pydantic import BaseModel, Field
 from collections import defaultdict
@@ -12,6 +14,11 @@ ddb_prompt_table_name = os.environ.get("PROMPT_TABLE_NAME", "")
 dynamodb_resource = boto3.resource("dynamodb")
 ddb_prompt_table = dynamodb_resource.Table(ddb_prompt_table_name)
 
+PROMPT_CACHE_TTL = int(os.environ.get("PROMPT_CACHE_TTL", 300))
+PROMPT_CACHE_VERSION_CHECK_INTERVAL = int(
+    os.environ.get("PROMPT_CACHE_VERSION_CHECK_INTERVAL", 10)
+)
+
 
 # export models to front
 EXPORT_MODEL_IDS = [
@@ -54,8 +61,13 @@ class PromptTemplate(BaseModel):
 
 
 class PromptTemplateManager:
-    def __init__(self) -> None:
+    def __init__(self, prompt_table=None) -> None:
         self.prompt_templates = defaultdict(dict)
+        self.prompt_table = prompt_table or ddb_prompt_table
+        # prompt items cached in the warm container, keyed by
+        # (group_name, sort_key)
+        self._ddb_prompt_cache = {}
+        self._ddb_prompt_cache_lock = threading.Lock()
 
     def get_prompt_template_id(self, model_id, task_type):
         return f"{model_id}__{task_type}"
@@ -96,12 +108,52 @@ class PromptTemplateManager:
             raise KeyError(
                 f'prompt_template_id: {prompt_template_id}, prompt_name: {prompt_name}')
 
+    def invalidate_ddb_prompt_cache(self):
+        with self._ddb_prompt_cache_lock:
+            self._ddb_prompt_cache.clear()
+
+    def _get_ddb_prompt_version(self, key: dict):
+        # prompt_management updates UpdateTime on every prompt put
+        item = self.prompt_table.get_item(
+            Key=key,
+            ProjectionExpression="UpdateTime",
+        ).get("Item")
+        return item.get("UpdateTime") if item else None
+
+    def _get_ddb_prompt_item(self, group_name: str, sort_key: str):
+        """Get the prompts of all task types stored under sort_key.
+        The item is cached for PROMPT_CACHE_TTL seconds and revalidated
+        against its UpdateTime every PROMPT_CACHE_VERSION_CHECK_INTERVAL
+        seconds.
+        """
+        key = {"GroupName": group_name, "SortKey": sort_key}
+        cache_key = (group_name, sort_key)
+        now = time.monotonic()
+        entry = self._ddb_prompt_cache.get(cache_key)
+        if entry is not None and now < entry["expire_at"]:
+            if now - entry["checked_at"] < PROMPT_CACHE_VERSION_CHECK_INTERVAL:
+                return entry["prompt"]
+            if self._get_ddb_prompt_version(key) == entry["version"]:
+                entry["checked_at"] = now
+                return entry["prompt"]
+
+        item = self.prompt_table.get_item(Key=key).get("Item", {})
+        prompt = item.get("Prompt", {})
+        with self._ddb_prompt_cache_lock:
+            self._ddb_prompt_cache[cache_key] = {
+                "prompt": prompt,
+                "version": item.get("UpdateTime"),
+                "checked_at": now,
+                "expire_at": now + PROMPT_CACHE_TTL,
+            }
+        return prompt
+
     def get_prompt_templates_from_ddb(self, group_name: str, model_id: str, task_type: str, chatbot_id: str = "admin", scene: str = "common"):
-        response = ddb_prompt_table.get_item(
-            Key={"GroupName": group_name,
-                 "SortKey": f"{model_id}__{scene}__{chatbot_id}"}
-        )
-        return response.get("Item", {}).get("Prompt", {}).get(task_type, {})
+        prompt = self._get_ddb_prompt_item(
+            group_name, f"{model_id}__{scene}__{chatbot_id}")
+        # callers merge the templates into their llm config, return a copy
+        # so the cached item is never modified
+        return dict(prompt.get(task_type, {}))
 
     def get_all_templates(self, allow_model_ids=EXPORT_MODEL_IDS):
         assert isinstance(allow_model_ids, list), allow_model_ids
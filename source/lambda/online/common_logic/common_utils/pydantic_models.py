@@ -43,6 +43,11 @@ class QueryRewriteConfig(LLMConfig):
 class QueryProcessConfig(ForbidBaseModel):
     conversation_query_rewrite_config: QueryRewriteConfig = Field(
         default_factory=QueryRewriteConfig)
+    # start intention detection lookups on the original query during rewrite
+    speculative_lookup: bool = False
+    # reuse speculative lookups when the rewritten query is at least this
+    # similar to the original one, only exact matches are reused if None
+    speculative_lookup_similarity_threshold: Union[float, None] = None
 
 
 class RetrieverConfigBase(AllowBaseModel):
@@ -111,6 +116,8 @@ class ChatbotConfig(AllowBaseModel):
     chatbot_mode: ChatbotMode = ChatbotMode.chat
     use_history: bool = True
     enable_trace: bool = True
+    # collect enter/exit records of nodes and chains, logged after the run
+    collect_trace_infos: bool = False
     scene: SceneType = SceneType.COMMON
     agent_repeated_call_limit: int = 5
     query_process_config: QueryProcessConfig = Field(
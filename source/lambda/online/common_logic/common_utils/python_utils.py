@@ -1,4 +1,8 @@
 import collections.abc
+import hashlib
+import json
+import threading
+from collections import OrderedDict
 
 
 def update_nest_dict(d: dict, u: dict):
@@ -13,3 +17,53 @@ def update_nest_dict(d: dict, u: dict):
 def add_messages(left: list, right: list):
     """Add-don't-overwrite."""
     return left + right
+
+
+def make_cache_key(*parts, default=None):
+    """Hash json serializable parts into a cache key, dict keys are sorted.
+    `default` converts other objects as in json.dumps. Returns None if the
+    parts can not be serialized, i.e. they should not be cached.
+    """
+    try:
+        raw_key = json.dumps(
+            parts, sort_keys=True, ensure_ascii=False, default=default)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread safe cache keeping at most max_size recently used entries"""
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -0,0 +1,97 @@
+import logging
+from typing import Iterable, Union
+
+logger = logging.getLogger("reference_utils")
+
+REFERENCE_TAG_START = "<reference>"
+REFERENCE_TAG_END = "</reference>"
+
+
+class ReferenceTagParser:
+    """
+    Remove <reference>n</reference> tags from a streamed LLM answer and
+    collect the reference numbers.
+
+    Each chunk is scanned with str.find, the text before the next tag is
+    emitted in one piece and only what may still turn into a tag is held
+    back: an open tag waiting for its end, or a trailing partial tag start
+    such as "<ref".
+    """
+
+    def __init__(self, tag_start=REFERENCE_TAG_START, tag_end=REFERENCE_TAG_END):
+        self.tag_start = tag_start
+        self.tag_end = tag_end
+        self.references = []
+        self._buffer = ""
+        # where to resume looking for the tag end when the buffer holds an open tag
+        self._tag_end_search_from = None
+
+    def _partial_tag_start_len(self, text: str, pos: int) -> int:
+        # a prefix of the tag start only has "<" as its first character
+        idx = text.rfind("<", max(pos, len(text) - len(self.tag_start) + 1))
+        if idx != -1 and self.tag_start.startswith(text[idx:]):
+            return len(text) - idx
+        return 0
+
+    def _add_reference(self, ref_content: str):
+        try:
+            self.references.append(int(ref_content))
+        except ValueError:
+            logger.error(f"Invalid reference number: {ref_content}")
+
+    def feed(self, chunk: str) -> str:
+        """Return the text of `chunk` that can be emitted now"""
+        if not self._buffer:
+            if "<" not in chunk:
+                return chunk
+            text = chunk
+        else:
+            text = self._buffer + chunk
+        output = []
+        pos = 0
+        while True:
+            if self._tag_end_search_from is None:
+                start = text.find(self.tag_start, pos)
+                if start == -1:
+                    keep = self._partial_tag_start_len(text, pos)
+                    output.append(text[pos:len(text) - keep])
+                    self._buffer = text[len(text) - keep:]
+                    break
+                output.append(text[pos:start])
+                pos = start
+                end_search_from = start + len(self.tag_start)
+            else:
+                end_search_from = self._tag_end_search_from
+                self._tag_end_search_from = None
+
+            end = text.find(self.tag_end, end_search_from)
+            if end == -1:
+                # keep the open tag, it is emitted as is if never closed
+                self._buffer = text[pos:]
+                self._tag_end_search_from = max(
+                    pos + len(self.tag_start),
+                    len(text) - len(self.tag_end) + 1
+                ) - pos
+                break
+            self._add_reference(text[pos + len(self.tag_start):end])
+            pos = end + len(self.tag_end)
+        return "".join(output)
+
+    def finish(self) -> str:
+        """Return the held back text at the end of the stream"""
+        text = self._buffer
+        self._buffer = ""
+        self._tag_end_search_from = None
+        return text
+
+    def filter(self, chunks: Union[str, Iterable[str]]):
+        """Yield the filtered text of a chunk stream, a str is a single chunk"""
+        if isinstance(chunks, str):
+            chunks = [chunks]
+        for chunk in chunks:
+            text = self.feed(chunk)
+            if text:
+                yield text
+        text = self.finish()
+        if text:
+            yield text
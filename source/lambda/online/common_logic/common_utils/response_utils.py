@@ -1,16 +1,50 @@
 import json
 import logging
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from common_logic.common_utils.ddb_utils import DynamoDBChatMessageHistory
-from common_logic.common_utils.websocket_utils import send_to_ws_client
+from common_logic.common_utils.websocket_utils import (
+    WebsocketClientError,
+    ws_sender
+)
 from common_logic.common_utils.constant import StreamMessageType
 from common_logic.common_utils.logger_utils import get_logger
 logger = get_logger("response_utils")
 
 
-class WebsocketClientError(Exception):
-    pass
+class ChatHistoryWriter:
+    """
+    Write chat history on background threads, off the response path.
+    flush() must be called before the lambda returns, since the container
+    is frozen afterwards.
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="chat_history")
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        future = self._executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def flush(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                logger.error(
+                    f"Failed to write chat history: {traceback.format_exc()}")
+
+
+chat_history_writer = ChatHistoryWriter()
 
 
 def write_chat_history_to_ddb(
@@ -22,15 +56,13 @@ def write_chat_history_to_ddb(
         entry_type,
         additional_kwargs=None,
 ):
-    ddb_obj.add_user_message(
-        f"user_{message_id}", custom_message_id, entry_type, query, additional_kwargs
-    )
-    ddb_obj.add_ai_message(
-        f"ai_{message_id}",
-        custom_message_id,
-        entry_type,
-        answer,
-        input_message_id=f"user_{message_id}",
+    ddb_obj.add_round(
+        user_message_id=f"user_{message_id}",
+        ai_message_id=f"ai_{message_id}",
+        custom_message_id=custom_message_id,
+        entry_type=entry_type,
+        query=query,
+        answer=answer,
         additional_kwargs=additional_kwargs
     )
 
@@ -41,7 +73,8 @@ def api_response(event_body: dict, response: dict):
     if not isinstance(answer, str):
         answer = json.dumps(answer, ensure_ascii=False)
 
-    write_chat_history_to_ddb(
+    chat_history_writer.submit(
+        write_chat_history_to_ddb,
         query=event_body['query'],
         answer=answer,
         ddb_obj=ddb_history_obj,
@@ -51,7 +84,7 @@ def api_response(event_body: dict, response: dict):
         additional_kwargs=response.get("ddb_additional_kwargs", {})
     )
 
-    return {
+    ret = {
         "session_id": event_body['session_id'],
         "entry_type": event_body['entry_type'],
         "created": time.time(),
@@ -62,6 +95,8 @@ def api_response(event_body: dict, response: dict):
         },
         **response['extra_response']
     }
+    chat_history_writer.flush()
+    return ret
 
 
 def stream_response(event_body: dict, response: dict):
@@ -76,17 +111,19 @@ def stream_response(event_body: dict, response: dict):
         answer = iter([answer])
 
     ddb_history_obj = event_body["ddb_history_obj"]
+    answer_str = ""
+    ws_sender.reset_stats()
 
     try:
-        send_to_ws_client(message={
+        ws_sender.send(message={
             "message_type": StreamMessageType.START,
             "message_id": f"ai_{message_id}",
             "custom_message_id": custom_message_id,
         },
             ws_connection_id=ws_connection_id
         )
-        answer_str = ""
 
+        # chunks are coalesced and numbered by ws_sender
         for i, chunk in enumerate(answer):
             if i == 0 and log_first_token_time:
                 first_token_time = time.time()
@@ -94,7 +131,7 @@ def stream_response(event_body: dict, response: dict):
                 logger.info(
                     f"{custom_message_id} running time of first token whole {entry_type} entry: {first_token_time-request_timestamp}s"
                 )
-            send_to_ws_client(message={
+            ws_sender.send(message={
                 "message_type": StreamMessageType.CHUNK,
                 "message_id": f"ai_{message_id}",
                 "custom_message_id": custom_message_id,
@@ -103,7 +140,6 @@ def stream_response(event_body: dict, response: dict):
                     "content": chunk,
                     # "knowledge_sources": sources,
                 },
-                "chunk_id": i,
             },
                 ws_connection_id=ws_connection_id
             )
@@ -116,7 +152,9 @@ def stream_response(event_body: dict, response: dict):
 
         logger.info(f"answer: {answer_str}")
 
-        write_chat_history_to_ddb(
+        # written in the background, flushed once END is sent
+        chat_history_writer.submit(
+            write_chat_history_to_ddb,
             query=event_body['query'],
             answer=answer_str,
             ddb_obj=ddb_history_obj,
@@ -188,13 +226,13 @@ def stream_response(event_body: dict, response: dict):
                     context_msg["ddb_additional_kwargs"].setdefault(
                         "figure", []).extend(md_images)
 
-            send_to_ws_client(
+            ws_sender.send(
                 message=context_msg,
                 ws_connection_id=ws_connection_id
             )
 
         # send end
-        send_to_ws_client(
+        ws_sender.send(
             {
                 "message_type": StreamMessageType.END,
                 "message_id": f"ai_{message_id}",
@@ -210,14 +248,27 @@ def stream_response(event_body: dict, response: dict):
         # bedrock error
         error = traceback.format_exc()
         logger.info(error)
-        send_to_ws_client(
-            {
-                "message_type": StreamMessageType.ERROR,
-                "message_id": f"ai_{message_id}",
-                "custom_message_id": custom_message_id,
-                "message": {"content": error},
-            },
-            ws_connection_id=ws_connection_id
+        try:
+            ws_sender.send(
+                {
+                    "message_type": StreamMessageType.ERROR,
+                    "message_id": f"ai_{message_id}",
+                    "custom_message_id": custom_message_id,
+                    "message": {"content": error},
+                },
+                ws_connection_id=ws_connection_id
+            )
+        except WebsocketClientError:
+            logger.info(traceback.format_exc())
+    finally:
+        # everything must be posted and written before the lambda returns
+        ws_sender.flush()
+        chat_history_writer.flush()
+        stats = ws_sender.stats
+        logger.info(
+            f"{custom_message_id} websocket posts: {stats['posts']} for {stats['messages']} messages, "
+            f"post time: {stats['post_time']:.4f}s, max post time: {stats['max_post_time']:.4f}s, "
+            f"max queue time: {stats['max_queue_time']:.4f}s"
         )
     return answer_str
 
@@ -0,0 +1,196 @@
+import copy
+import types
+import unittest
+from unittest import mock
+
+from common_logic.common_utils import chatbot_utils
+from common_logic.common_utils.chatbot_utils import ChatbotManager, batch_get_items
+
+
+class FakeDynamoDBClient:
+    """batch_get_item over the fake tables, counting the calls. The first
+    `unprocessed` keys of each request are returned as UnprocessedKeys."""
+
+    def __init__(self):
+        self.tables = {}
+        self.calls = 0
+        self.batch_get_item_calls = 0
+        self.unprocessed = 0
+
+    def batch_get_item(self, RequestItems):
+        self.calls += 1
+        self.batch_get_item_calls += 1
+        responses, unprocessed = {}, {}
+        for table_name, request in RequestItems.items():
+            keys = request["Keys"]
+            if self.unprocessed:
+                unprocessed[table_name] = {"Keys": keys[:self.unprocessed]}
+                keys = keys[self.unprocessed:]
+                self.unprocessed = 0
+            table = self.tables[table_name]
+            responses[table_name] = [
+                copy.deepcopy(table.items[table.item_key(key)]) for key in keys
+                if table.item_key(key) in table.items
+            ]
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
+
+
+class FakeTable:
+    def __init__(self, client, name, key_names):
+        self.client = client
+        self.name = name
+        self.key_names = key_names
+        self.meta = types.SimpleNamespace(client=client)
+        self.items = {}
+        client.tables[name] = self
+
+    def item_key(self, key):
+        return tuple(key[k] for k in self.key_names)
+
+    def put_item(self, Item):
+        self.items[self.item_key(Item)] = Item
+
+    def get_item(self, Key, ProjectionExpression=None):
+        self.client.calls += 1
+        item = self.items.get(self.item_key(Key))
+        if item is None:
+            return {}
+        if ProjectionExpression:
+            item = {k: item[k] for k in ProjectionExpression.split(",") if k in item}
+        # a new item on every call, as from DynamoDB
+        return {"Item": copy.deepcopy(item)}
+
+
+def make_manager():
+    client = FakeDynamoDBClient()
+    chatbot_table = FakeTable(client, "chatbot", ["groupName", "chatbotId"])
+    index_table = FakeTable(client, "index", ["groupName", "indexId"])
+    model_table = FakeTable(client, "model", ["groupName", "modelId"])
+    # 6 indices sharing 2 embedding models
+    index_ids = {"qd": ["qd-1", "qd-2", "qd-3"], "qq": ["qq-1", "qq-2"], "intention": ["intention-1"]}
+    for index_type, ids in index_ids.items():
+        for i, index_id in enumerate(ids):
+            index_table.put_item({
+                "groupName": "Admin",
+                "indexId": index_id,
+                "indexType": index_type,
+                "modelIds": {"embedding": f"embedding-{i % 2}"},
+            })
+    for i in range(2):
+        model_table.put_item({
+            "groupName": "Admin",
+            "modelId": f"embedding-{i}",
+            "parameter": {"ModelEndpoint": f"endpoint-{i}"},
+        })
+    chatbot_table.put_item({
+        "groupName": "Admin",
+        "chatbotId": "admin",
+        "updateTime": "1",
+        "indexIds": {
+            index_type: {"value": {index_id: index_id for index_id in ids}}
+            for index_type, ids in index_ids.items()
+        },
+    })
+    return ChatbotManager(chatbot_table, index_table, model_table), client
+
+
+class TestBatchGetItems(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeDynamoDBClient()
+        self.table = FakeTable(self.client, "index", ["groupName", "indexId"])
+        for i in range(250):
+            self.table.put_item({"groupName": "Admin", "indexId": str(i)})
+
+    def test_duplicated_keys(self):
+        keys = [{"groupName": "Admin", "indexId": str(i % 3)} for i in range(10)]
+        items = batch_get_items(self.table, keys)
+        self.assertEqual(sorted(item["indexId"] for item in items), ["0", "1", "2"])
+        self.assertEqual(self.client.batch_get_item_calls, 1)
+
+    def test_request_size(self):
+        keys = [{"groupName": "Admin", "indexId": str(i)} for i in range(250)]
+        self.assertEqual(len(batch_get_items(self.table, keys)), 250)
+        self.assertEqual(self.client.batch_get_item_calls, 3)
+
+    def test_unprocessed_keys(self):
+        self.client.unprocessed = 2
+        keys = [{"groupName": "Admin", "indexId": str(i)} for i in range(5)]
+        items = batch_get_items(self.table, keys)
+        self.assertEqual(sorted(item["indexId"] for item in items), ["0", "1", "2", "3", "4"])
+        self.assertEqual(self.client.batch_get_item_calls, 2)
+
+
+class TestChatbotCache(unittest.TestCase):
+    def setUp(self):
+        ChatbotManager.invalidate_cache()
+        self.addCleanup(ChatbotManager.invalidate_cache)
+        self.manager, self.client = make_manager()
+
+    def set_version_check_interval(self, seconds):
+        patcher = mock.patch.object(
+            chatbot_utils, "CHATBOT_CACHE_VERSION_CHECK_INTERVAL", seconds)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_dynamodb_calls(self):
+        chatbot = self.manager.get_chatbot("Admin", "admin")
+        # one get_item for the chatbot, one batch_get_item for the 6 indices
+        # and one for their embedding models, instead of 13 get_item calls
+        self.assertEqual(self.client.calls, 3)
+        qd = chatbot.index_ids["qd"]["value"]
+        self.assertEqual(len(qd), 3)
+        self.assertEqual(
+            qd["qd-2"]["modelIds"]["embedding"]["parameter"]["ModelEndpoint"], "endpoint-1")
+        self.assertEqual(len(chatbot.get_index_dict()), 6)
+
+    def test_hit_without_dynamodb_call(self):
+        chatbot = self.manager.get_chatbot("Admin", "admin")
+        calls = self.client.calls
+        for _ in range(5):
+            self.assertIs(self.manager.get_chatbot("Admin", "admin"), chatbot)
+        self.assertEqual(self.client.calls, calls)
+
+    def test_unchanged_version(self):
+        self.set_version_check_interval(0)
+        chatbot = self.manager.get_chatbot("Admin", "admin")
+        calls = self.client.calls
+        self.assertIs(self.manager.get_chatbot("Admin", "admin"), chatbot)
+        # only the updateTime is read
+        self.assertEqual(self.client.calls, calls + 1)
+
+    def test_changed_version(self):
+        self.set_version_check_interval(0)
+        self.manager.get_chatbot("Admin", "admin")
+        item = self.manager.chatbot_table.items[("Admin", "admin")]
+        item["updateTime"] = "2"
+        item["indexIds"]["qd"]["value"] = {"qd-1": "qd-1"}
+        calls = self.client.calls
+
+        chatbot = self.manager.get_chatbot("Admin", "admin")
+        self.assertEqual(list(chatbot.index_ids["qd"]["value"]), ["qd-1"])
+        # version check, then the reload
+        self.assertEqual(self.client.calls, calls + 4)
+
+    def test_missing_chatbot(self):
+        chatbot = self.manager.get_chatbot("Admin", "missing")
+        self.assertIsNone(chatbot.chatbot_id)
+        self.assertEqual(self.client.calls, 1)
+        entry = ChatbotManager._chatbot_cache[("Admin", "missing")]
+        self.assertIsNone(entry["version"])
+
+        self.manager.get_chatbot("Admin", "missing")
+        self.assertEqual(self.client.calls, 1)
+        # still missing, the version check does not reload it
+        self.set_version_check_interval(0)
+        self.assertIs(self.manager.get_chatbot("Admin", "missing"), chatbot)
+        self.assertEqual(self.client.calls, 2)
+
+    def test_invalidate_cache(self):
+        self.manager.get_chatbot("Admin", "admin")
+        ChatbotManager.invalidate_cache("Admin", "admin")
+        self.manager.get_chatbot("Admin", "admin")
+        self.assertEqual(self.client.calls, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from common_logic.common_utils.content_filter_utils import (
+    CHINESE_PATTERN,
+    MarketContentFilter,
+    token_to_sentence_gen_market,
+)
+
+AWS_PRODUCTS = {
+    "AWS Lambda": "Amazon Lambda",
+    "AWS Glue": "Amazon Glue",
+    "AWS Step Functions": "Amazon Step Functions",
+}
+SENSITIVE_WORDS = ["敏感词", "badword", "机密"]
+
+
+def reference_filter_sentence(sentence, sensitive_words, aws_products):
+    """The str.replace implementation used before the matcher"""
+    for sensitive_word in sensitive_words:
+        sentence = sentence.replace(sensitive_word, "*" * len(sensitive_word))
+    for key, value in aws_products.items():
+        sentence = sentence.replace(key, value)
+    index = sentence.find("AWS")
+    while index != -1:
+        if CHINESE_PATTERN.search(sentence[index: index + 10]):
+            sentence = sentence.replace("AWS", "亚马逊云科技", 1)
+            index = sentence.find("AWS")
+        else:
+            index = sentence.find("AWS", index + 1)
+    return sentence
+
+
+def write_csv(path, rows):
+    with open(path, "w") as f:
+        for row in rows:
+            f.write(",".join(row) + "\n")
+
+
+def make_filter(tmp_dir, sensitive_words, aws_products):
+    sensitive_words_path = os.path.join(tmp_dir, f"sensitive_{len(sensitive_words)}.csv")
+    aws_products_path = os.path.join(tmp_dir, f"products_{len(aws_products)}.csv")
+    write_csv(sensitive_words_path, [[w] for w in sensitive_words])
+    write_csv(aws_products_path, list(aws_products.items()))
+    return MarketContentFilter(sensitive_words_path, aws_products_path)
+
+
+class TestMarketContentFilter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.content_filter = make_filter(
+            self.tmp_dir.name, SENSITIVE_WORDS, AWS_PRODUCTS)
+        self.sentences = [
+            "AWS Lambda 是一个无服务器计算服务，不要说敏感词。",
+            "Use AWS Glue and AWS Step Functions, no badword here.",
+            "AWS 提供了很多服务，包括 AWS Lambda。",
+            "AWS is a cloud provider. 这是机密信息。",
+            "AWS",
+        ]
+
+    def test_same_as_reference(self):
+        for sentence in self.sentences:
+            self.assertEqual(
+                self.content_filter.filter_sentence(sentence),
+                reference_filter_sentence(sentence, SENSITIVE_WORDS, AWS_PRODUCTS),
+            )
+
+    def test_stream_chunk_boundaries(self):
+        text = "".join(self.sentences)
+        expected = self.content_filter.filter_sentence(text)
+        for split in range(1, len(text)):
+            chunks = [text[:split], text[split:]]
+            self.assertEqual("".join(self.content_filter.filter_stream(chunks)), expected)
+        tokens = [text[i:i + 3] for i in range(0, len(text), 3)]
+        self.assertEqual("".join(self.content_filter.filter_stream(tokens)), expected)
+        sentences = token_to_sentence_gen_market(tokens)
+        self.assertEqual("".join(self.content_filter.filter_stream(sentences)), expected)
+
+    def test_benchmark_10k_terms(self):
+        rng = random.Random(0)
+        alphabet = "abcdefghijklmnopqrstuvwxyz"
+        sensitive_words = list({
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(6, 10)))
+            for _ in range(10000)
+        })
+        aws_products = {
+            f"AWS Product{i}": f"Amazon Product{i}" for i in range(500)}
+        content_filter = make_filter(self.tmp_dir.name, sensitive_words, aws_products)
+        sentences = self.sentences * 20
+
+        start = time.perf_counter()
+        expected = [
+            reference_filter_sentence(s, sensitive_words, aws_products)
+            for s in sentences
+        ]
+        reference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        filtered = [content_filter.filter_sentence(s) for s in sentences]
+        matcher_time = time.perf_counter() - start
+
+        print(
+            f"{len(sentences)} sentences, {len(sensitive_words)} sensitive words: "
+            f"str.replace {reference_time:.4f}s, matcher {matcher_time:.4f}s"
+        )
+        self.assertEqual(filtered, expected)
+        self.assertLess(matcher_time, reference_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import json
+import unittest
+
+from botocore.exceptions import ClientError
+from common_logic.common_utils.constant import MessageType
+from common_logic.common_utils.ddb_utils import DynamoDBChatMessageHistory
+
+
+class FakeMessagesTable:
+    """Emulate querying the message indexes with Limit and a page size."""
+
+    def __init__(self, items, page_size=3, has_create_time_index=True):
+        self.items = items
+        self.page_size = page_size
+        self.has_create_time_index = has_create_time_index
+        self.read_items = 0
+
+    def query(self, IndexName, ScanIndexForward=True, Limit=None,
+              ExclusiveStartKey=None, **kwargs):
+        if IndexName == "bySessionIdCreateTimestamp":
+            if not self.has_create_time_index:
+                raise ClientError(
+                    {"Error": {"Code": "ValidationException"}}, "Query")
+            items = sorted(self.items, key=lambda x: x["createTimestamp"],
+                           reverse=not ScanIndexForward)
+        else:
+            # no sort key, items come back unordered
+            items = list(reversed(self.items))
+        start = ExclusiveStartKey["index"] if ExclusiveStartKey else 0
+        size = min(self.page_size, Limit or self.page_size)
+        page = items[start:start + size]
+        self.read_items += len(page)
+        response = {"Items": page}
+        if start + size < len(items):
+            response["LastEvaluatedKey"] = {"index": start + size}
+        return response
+
+
+def make_session(rounds):
+    items = []
+    for i in range(rounds):
+        for role, offset in [(MessageType.HUMAN_MESSAGE_TYPE, 0),
+                             (MessageType.AI_MESSAGE_TYPE, 1)]:
+            items.append({
+                "messageId": f"{role}_{i}",
+                "role": role,
+                "content": f"{role} {i}",
+                "createTimestamp": f"2024-01-01T00:{i:02d}:{offset:02d}Z",
+                "entryType": "common",
+                "customMessageId": "",
+                "additional_kwargs": json.dumps({}),
+            })
+    return items
+
+
+def make_history(table):
+    history = DynamoDBChatMessageHistory(
+        "sessions", "messages", "session", "user", "client", "Admin", "admin")
+    history.messages_table = table
+    return history
+
+
+class TestChatHistoryLoading(unittest.TestCase):
+    def setUp(self):
+        DynamoDBChatMessageHistory._create_time_index_missing = False
+
+    def test_latest_rounds(self):
+        table = FakeMessagesTable(make_session(100))
+        messages = make_history(table).load_messages_as_langchain(max_rounds=3)
+
+        self.assertEqual(
+            [m["content"] for m in messages],
+            ["human 97", "ai 97", "human 98", "ai 98", "human 99", "ai 99"],
+        )
+        # only the kept rounds are read, across two pages
+        self.assertEqual(table.read_items, 6)
+
+    def test_unbounded_and_short_sessions(self):
+        table = FakeMessagesTable(make_session(5))
+        self.assertEqual(len(make_history(table).messages_as_langchain), 10)
+        self.assertEqual(len(make_history(table).load_messages(max_rounds=7)), 10)
+        self.assertEqual(make_history(table).load_messages(max_rounds=0), [])
+
+    def test_unpaired_ai_message_dropped(self):
+        items = make_session(3)
+        # the latest user message has no answer
+        items = items[:-1]
+        messages = make_history(FakeMessagesTable(items)).load_messages(max_rounds=2)
+        self.assertEqual(
+            [m["content"] for m in messages], ["human 1", "ai 1", "human 2"])
+
+    def test_fallback_without_create_time_index(self):
+        table = FakeMessagesTable(make_session(10), has_create_time_index=False)
+        messages = make_history(table).load_messages(max_rounds=2)
+        self.assertEqual(
+            [m["content"] for m in messages],
+            ["human 8", "ai 8", "human 9", "ai 9"],
+        )
+
+
+class FakeBatchWriter:
+    def __init__(self, table):
+        self.table = table
+        self.items = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.table.calls.append(("batch_write_item", self.items))
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+
+class FakeWriteTable:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def batch_writer(self):
+        return FakeBatchWriter(self)
+
+    def update_item(self, **kwargs):
+        self.calls.append(("update_item", kwargs))
+
+
+class TestChatHistoryWriting(unittest.TestCase):
+    def test_add_round(self):
+        calls = []
+        history = make_history(FakeWriteTable(calls))
+        history.sessions_table = FakeWriteTable(calls)
+        history.add_round(
+            "user_1", "ai_1", "custom_1", "common", "hello", "hi",
+            additional_kwargs={"figure": []},
+        )
+
+        self.assertEqual([name for name, _ in calls], ["batch_write_item", "update_item"])
+        user_item, ai_item = calls[0][1]
+        self.assertEqual(user_item["role"], MessageType.HUMAN_MESSAGE_TYPE)
+        self.assertEqual(ai_item["inputMessageId"], "user_1")
+        self.assertLess(user_item["createTimestamp"], ai_item["createTimestamp"])
+        self.assertEqual(calls[1][1]["ExpressionAttributeValues"][":q"], "hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import gc
+import time
+import unittest
+from typing import Annotated, Optional, TypedDict
+from unittest import mock
+
+from common_logic.common_utils import lambda_invoke_utils
+from common_logic.common_utils.lambda_invoke_utils import (
+    RequestContext,
+    node_monitor_wrapper,
+    timed_reducer,
+)
+from common_logic.common_utils.langgraph_utils import AppendOnlyListChannel
+from common_logic.common_utils.python_utils import add_messages
+from langgraph.graph import END, StateGraph
+
+COPYING = timed_reducer(add_messages)
+
+
+def build_graph(list_field):
+    class State(TypedDict):
+        stream: bool
+        ws_connection_id: str
+        enable_trace: bool
+        trace_infos: Optional[list]
+        rounds: int
+        chat_history: Annotated[list, list_field]
+        agent_tool_history: Annotated[list, list_field]
+
+    @node_monitor_wrapper
+    def agent(state):
+        # the side context is visible in nodes
+        RequestContext.get_current_context()["event_body"]
+        return {
+            "agent_tool_history": [f"call {len(state['agent_tool_history'])}"],
+            "rounds": state["rounds"] - 1,
+        }
+
+    @node_monitor_wrapper
+    def tools_execution(state):
+        return {"agent_tool_history": [f"result of {state['agent_tool_history'][-1]}"]}
+
+    workflow = StateGraph(State)
+    workflow.add_node("agent", agent)
+    workflow.add_node("tools_execution", tools_execution)
+    workflow.set_entry_point("agent")
+    # reads a copy of the state updated with the agent output
+    workflow.add_conditional_edges(
+        "agent",
+        lambda state: "continue" if state["agent_tool_history"] and state["rounds"] > 0 else "end",
+        {"continue": "tools_execution", "end": END},
+    )
+    workflow.add_edge("tools_execution", "agent")
+    return workflow.compile()
+
+
+def run(app, rounds, chat_history, trace_infos=None, enable_trace=True, agent_tool_history=()):
+    with RequestContext(event_body={"ddb_history_obj": object()}) as context:
+        response = app.invoke(
+            {
+                "stream": False,
+                "ws_connection_id": None,
+                "enable_trace": enable_trace,
+                "trace_infos": trace_infos,
+                "rounds": rounds,
+                "chat_history": chat_history,
+                "agent_tool_history": list(agent_tool_history),
+            },
+            config={"recursion_limit": 2 * rounds + 2},
+        )
+    return response, context
+
+
+class TestAppendOnlyListChannel(unittest.TestCase):
+    def test_copies(self):
+        channel = AppendOnlyListChannel().from_checkpoint(None)
+        channel.update([["a", "b"]])
+        items = channel.get()
+
+        # a copy extended with the same items, as for a conditional edge
+        copy = channel.from_checkpoint(channel.checkpoint())
+        update = ["c"]
+        copy.update([update])
+        self.assertEqual(copy.get(), ["a", "b", "c"])
+        self.assertEqual(channel.get(), ["a", "b"])
+        channel.update([update])
+        self.assertEqual(channel.get(), ["a", "b", "c"])
+        self.assertIs(channel.get(), items)
+
+        # a copy extended with other items
+        copy = channel.from_checkpoint(channel.checkpoint())
+        copy.update([["d"]])
+        channel.update([["e"], ["f"]])
+        self.assertEqual(copy.get(), ["a", "b", "c", "d"])
+        self.assertEqual(channel.get(), ["a", "b", "c", "e", "f"])
+
+
+class TestGraphState(unittest.TestCase):
+    def setUp(self):
+        self.traces = []
+        patcher = mock.patch.object(
+            lambda_invoke_utils, "send_trace",
+            lambda trace_info, *args, **kwargs: self.traces.append(trace_info))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_state_as_copying_reducer(self):
+        chat_history = [{"role": "user", "content": str(i)} for i in range(10)]
+        expected, _ = run(build_graph(COPYING), 5, chat_history)
+        response, _ = run(build_graph(AppendOnlyListChannel), 5, chat_history)
+        self.assertEqual(response["agent_tool_history"], expected["agent_tool_history"])
+        self.assertEqual(len(response["agent_tool_history"]), 9)
+        self.assertEqual(response["chat_history"], chat_history)
+        # the input list is not extended in place
+        self.assertEqual(len(chat_history), 10)
+
+    def test_monitor_output(self):
+        run(build_graph(AppendOnlyListChannel), 3, [])
+        # one report per node run
+        merge_times = [t for t in self.traces if "state merge time" in t]
+        self.assertEqual(len(merge_times), 5)
+
+        trace_infos = []
+        run(build_graph(AppendOnlyListChannel), 3, [], trace_infos=trace_infos)
+        self.assertEqual(len(trace_infos), 10)
+        self.assertTrue(trace_infos[0].startswith("Enter: agent"))
+
+    def test_benchmark(self):
+        rounds = 200
+        # long running agent with a long tool history
+        history = [{"role": "user", "content": str(i)} for i in range(5000)]
+        merge_times = {}
+        for name, list_field in (("add_messages", COPYING), ("append only", AppendOnlyListChannel)):
+            app = build_graph(list_field)
+            # a collection of the objects left by other tests would dominate
+            # the merge time
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                _, context = run(
+                    app, rounds, history, enable_trace=False, agent_tool_history=history)
+                total_time = time.perf_counter() - start
+            finally:
+                gc.enable()
+            merge_times[name] = context.total_state_merge_time
+            print(
+                f"{name}: {2 * rounds - 1} node runs, {len(history)} history messages, "
+                f"state merge {context.total_state_merge_time * 1000:.2f}ms "
+                f"of {total_time * 1000:.1f}ms"
+            )
+        self.assertLess(merge_times["append only"], merge_times["add_messages"])
+
+
+if __name__ == "__main__":
+    unittest.main()
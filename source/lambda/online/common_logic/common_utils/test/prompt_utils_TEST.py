@@ -0,0 +1,117 @@
+import time
+import unittest
+
+from common_logic.common_utils.constant import LLMTaskType
+from common_logic.common_utils.prompt_utils import PromptTemplateManager
+
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+SORT_KEY = f"{MODEL_ID}__common__admin"
+
+
+class FakePromptTable:
+    """Serve prompt items from memory and count get_item calls."""
+
+    def __init__(self, latency=0.005):
+        self.latency = latency
+        self.items = {}
+        self.get_item_calls = 0
+
+    def put(self, group_name, sort_key, prompt):
+        self.items[(group_name, sort_key)] = {
+            "GroupName": group_name,
+            "SortKey": sort_key,
+            "Prompt": prompt,
+            "UpdateTime": str(time.time_ns()),
+        }
+
+    def get_item(self, Key, ProjectionExpression=None):
+        self.get_item_calls += 1
+        time.sleep(self.latency)
+        item = self.items.get((Key["GroupName"], Key["SortKey"]))
+        if item is None:
+            return {}
+        if ProjectionExpression:
+            item = {k: item[k] for k in ProjectionExpression.split(",") if k in item}
+        return {"Item": item}
+
+
+def run_agent_turn(manager, tool_iterations=3):
+    """Prompt lookups made by one agent turn: query rewrite, one tool calling
+    lookup per agent loop iteration and the rag tool."""
+    task_types = (
+        [LLMTaskType.CONVERSATION_SUMMARY_TYPE]
+        + [LLMTaskType.TOOL_CALLING_API] * tool_iterations
+        + [LLMTaskType.RAG]
+    )
+    for task_type in task_types:
+        manager.get_prompt_templates_from_ddb(
+            "Admin", model_id=MODEL_ID, task_type=task_type
+        )
+
+
+class TestPromptTemplateCache(unittest.TestCase):
+    def setUp(self):
+        self.table = FakePromptTable()
+        self.table.put(
+            "Admin",
+            SORT_KEY,
+            {
+                LLMTaskType.RAG: {"system_prompt": "rag prompt"},
+                LLMTaskType.TOOL_CALLING_API: {"agent_prompt": "agent prompt"},
+            },
+        )
+
+    def test_agent_loop_benchmark(self):
+        turns = 5
+        manager = PromptTemplateManager(prompt_table=self.table)
+        start = time.perf_counter()
+        for _ in range(turns):
+            run_agent_turn(manager)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{turns} agent turns with 3 tool iterations: "
+            f"{self.table.get_item_calls} get_item calls, {elapsed:.4f}s "
+            f"(uncached: {turns * 5} get_item calls)"
+        )
+        self.assertEqual(self.table.get_item_calls, 1)
+
+    def test_task_types_and_copies(self):
+        manager = PromptTemplateManager(prompt_table=self.table)
+        rag = manager.get_prompt_templates_from_ddb(
+            "Admin", model_id=MODEL_ID, task_type=LLMTaskType.RAG
+        )
+        rag["system_prompt"] = "modified"
+        self.assertEqual(
+            manager.get_prompt_templates_from_ddb(
+                "Admin", model_id=MODEL_ID, task_type=LLMTaskType.RAG
+            ),
+            {"system_prompt": "rag prompt"},
+        )
+        self.assertEqual(
+            manager.get_prompt_templates_from_ddb(
+                "Admin", model_id=MODEL_ID, task_type=LLMTaskType.CHAT
+            ),
+            {},
+        )
+
+    def test_reload_on_update_time_change(self):
+        manager = PromptTemplateManager(prompt_table=self.table)
+        manager.get_prompt_templates_from_ddb(
+            "Admin", model_id=MODEL_ID, task_type=LLMTaskType.RAG
+        )
+        self.table.put(
+            "Admin", SORT_KEY, {LLMTaskType.RAG: {"system_prompt": "new prompt"}}
+        )
+        # force a version check on the next lookup
+        for entry in manager._ddb_prompt_cache.values():
+            entry["checked_at"] -= 3600
+        self.assertEqual(
+            manager.get_prompt_templates_from_ddb(
+                "Admin", model_id=MODEL_ID, task_type=LLMTaskType.RAG
+            ),
+            {"system_prompt": "new prompt"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
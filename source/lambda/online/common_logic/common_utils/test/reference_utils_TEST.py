@@ -0,0 +1,159 @@
+import random
+import time
+import unittest
+
+from common_logic.common_utils.reference_utils import ReferenceTagParser
+
+
+def reference_filter_response(res):
+    """The per character implementation used before ReferenceTagParser,
+    returns the yielded pieces and the references"""
+    pieces = []
+    buffer = ""
+    references = []
+    tag_start = "<reference>"
+    tag_end = "</reference>"
+
+    for char in res:
+        if not buffer and char not in ["<", "<reference"]:
+            pieces.append(char)
+            continue
+
+        buffer += char
+
+        if buffer == tag_start[:len(buffer)]:
+            continue
+        elif buffer.startswith(tag_start):
+            if buffer.endswith(tag_end):
+                ref_content = buffer[len(tag_start):-len(tag_end)]
+                try:
+                    references.append(int(ref_content))
+                except ValueError:
+                    pass
+                buffer = ""
+            continue
+        else:
+            pieces.append(buffer[0])
+            buffer = buffer[1:]
+
+    if buffer:
+        pieces.append(buffer)
+    return pieces, references
+
+
+FRAGMENTS = [
+    "word ", "AWS ", "，", "\n", "<", "<<", "<ref", "<reference", "reference>",
+    "<reference>1</reference>", "<reference>23</reference>",
+    "<reference>x</reference>", "<reference></reference>", "</reference>",
+    "<reference>", "<reference><reference>4</reference>", "<b>", "< reference>",
+]
+
+
+def random_text(rng, n_fragments):
+    return "".join(rng.choice(FRAGMENTS) for _ in range(n_fragments))
+
+
+def random_chunks(rng, text):
+    chunks = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 15)
+        chunks.append(text[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def tokenize(text):
+    """Split an answer the way the model streams it, tags come as "<",
+    "reference", ">" tokens."""
+    tokens = []
+    for word in text.replace("<", " <").replace(">", "> ").split(" "):
+        if word.startswith("<"):
+            tokens.extend(["<", word[1:-1], ">"] if word.endswith(">") else [word])
+        elif word:
+            tokens.append(word + " ")
+    return tokens
+
+
+def make_answer(rng, n_tokens):
+    words = []
+    for i in range(n_tokens):
+        words.append(rng.choice(["Amazon", "Lambda", "serverless", "compute", "the", "is"]))
+        if i % 200 == 199:
+            words.append(f"<reference>{rng.randint(1, 5)}</reference>")
+    return " ".join(words)
+
+
+def parse(chunks):
+    parser = ReferenceTagParser()
+    pieces = list(parser.filter(chunks))
+    return pieces, parser.references
+
+
+class TestReferenceTagParser(unittest.TestCase):
+    def test_same_as_reference(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            text = random_text(rng, rng.randint(0, 12))
+            expected_pieces, expected_references = reference_filter_response(text)
+            for chunks in [list(text), [text], random_chunks(rng, text)]:
+                pieces, references = parse(chunks)
+                self.assertEqual("".join(pieces), "".join(expected_pieces), chunks)
+                self.assertEqual(references, expected_references, chunks)
+
+    def test_safe_prefix_emitted(self):
+        parser = ReferenceTagParser()
+        self.assertEqual(parser.feed("Lambda is serverless <ref"), "Lambda is serverless ")
+        self.assertEqual(parser.feed("erence>2</ref"), "")
+        self.assertEqual(parser.feed("erence>. It <b>scales"), ". It <b>scales")
+        self.assertEqual(parser.feed("<reference>3"), "")
+        self.assertEqual(parser.finish(), "<reference>3")
+        self.assertEqual(parser.references, [2])
+
+    def test_benchmark(self):
+        rng = random.Random(0)
+        answers = [make_answer(rng, n_tokens) for n_tokens in (2000, 3000, 4000)]
+
+        # non streaming answers are iterated per character by the reference
+        start = time.perf_counter()
+        expected = [reference_filter_response(answer) for answer in answers]
+        reference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parsed = [parse(answer) for answer in answers]
+        parser_time = time.perf_counter() - start
+
+        # streamed answers, one chunk per token
+        streams = [tokenize(answer) for answer in answers]
+        start = time.perf_counter()
+        expected_streamed = [reference_filter_response(tokens) for tokens in streams]
+        reference_stream_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parsed_streamed = [parse(tokens) for tokens in streams]
+        parser_stream_time = time.perf_counter() - start
+
+        def n_pieces(results):
+            return sum(len(pieces) for pieces, _ in results)
+
+        print(
+            f"{sum(len(a) for a in answers)} chars answer: per character "
+            f"{reference_time * 1000:.2f}ms, {n_pieces(expected)} pieces; "
+            f"parser {parser_time * 1000:.2f}ms, {n_pieces(parsed)} pieces\n"
+            f"{sum(len(s) for s in streams)} tokens stream: per character "
+            f"{reference_stream_time * 1000:.2f}ms, {n_pieces(expected_streamed)} pieces; "
+            f"parser {parser_stream_time * 1000:.2f}ms, {n_pieces(parsed_streamed)} pieces"
+        )
+        for results, expected_results in [
+                (parsed, expected), (parsed_streamed, expected_streamed)]:
+            for (pieces, references), (expected_pieces, expected_references) in zip(
+                    results, expected_results):
+                self.assertEqual("".join(pieces), "".join(expected_pieces))
+                self.assertEqual(references, expected_references)
+        self.assertEqual(n_pieces(parsed), len(answers))
+        self.assertLessEqual(n_pieces(parsed_streamed), n_pieces(expected_streamed))
+        self.assertLess(parser_time, reference_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+from common_logic.common_utils import websocket_utils
+from common_logic.common_utils.constant import StreamMessageType
+from common_logic.common_utils.websocket_utils import (
+    WebsocketClientError,
+    WebsocketSender,
+)
+
+
+class FakeWebsocket:
+    """Record posted messages, each post takes `latency` seconds."""
+
+    def __init__(self, latency=0.005, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.messages = []
+
+    def post(self, data, ws_connection_id):
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("GoneException")
+        self.messages.append(json.loads(data))
+
+
+def chunk_message(content):
+    return {
+        "message_type": StreamMessageType.CHUNK,
+        "message_id": "ai_1",
+        "custom_message_id": "1",
+        "message": {"role": "assistant", "content": content},
+    }
+
+
+def stream_tokens(send, tokens, token_interval=0.001):
+    send({"message_type": StreamMessageType.START, "message_id": "ai_1"}, "conn")
+    for token in tokens:
+        time.sleep(token_interval)
+        send(chunk_message(token), "conn")
+    send({"message_type": StreamMessageType.END, "message_id": "ai_1"}, "conn")
+
+
+class TestWebsocketSender(unittest.TestCase):
+    def test_coalescing_benchmark(self):
+        tokens = [f"token{i} " for i in range(200)]
+
+        sync_websocket = FakeWebsocket()
+        start = time.perf_counter()
+        stream_tokens(
+            lambda message, conn: sync_websocket.post(json.dumps(message), conn), tokens)
+        sync_time = time.perf_counter() - start
+
+        websocket = FakeWebsocket()
+        sender = WebsocketSender(window_ms=30, max_bytes=256, post_fn=websocket.post)
+        start = time.perf_counter()
+        stream_tokens(sender.send, tokens)
+        generation_time = time.perf_counter() - start
+        sender.flush()
+        total_time = time.perf_counter() - start
+
+        print(
+            f"{len(tokens)} tokens, sync posting: {sync_time:.3f}s, "
+            f"sender: generation {generation_time:.3f}s, delivered {total_time:.3f}s, "
+            f"{sender.stats['posts']} posts"
+        )
+        chunks = [
+            m for m in websocket.messages
+            if m["message_type"] == StreamMessageType.CHUNK
+        ]
+        self.assertEqual(websocket.messages[0]["message_type"], StreamMessageType.START)
+        self.assertEqual(websocket.messages[-1]["message_type"], StreamMessageType.END)
+        self.assertEqual([m["chunk_id"] for m in chunks], list(range(len(chunks))))
+        self.assertEqual("".join(m["message"]["content"] for m in chunks), "".join(tokens))
+        # the first chunk is not held back by the window
+        self.assertEqual(chunks[0]["message"]["content"], tokens[0])
+        self.assertLess(len(chunks), len(tokens) // 4)
+        self.assertLess(generation_time, sync_time)
+
+    def test_max_bytes(self):
+        websocket = FakeWebsocket(latency=0)
+        sender = WebsocketSender(window_ms=10000, max_bytes=10, post_fn=websocket.post)
+        for token in ["a", "bbbbb", "ccccc", "d"]:
+            sender.send(chunk_message(token), "conn")
+        sender.flush()
+        self.assertEqual(
+            [m["message"]["content"] for m in websocket.messages],
+            ["a", "bbbbbccccc", "d"],
+        )
+
+    def test_failed_connection(self):
+        sender = WebsocketSender(post_fn=FakeWebsocket(latency=0, fail=True).post)
+        sender.send({"message_type": StreamMessageType.START}, "conn")
+        sender.flush()
+        with self.assertRaises(WebsocketClientError):
+            sender.send(chunk_message("a"), "conn")
+
+    def test_failed_connections_bounded(self):
+        sender = WebsocketSender(
+            failed_connections_size=2, post_fn=FakeWebsocket(latency=0, fail=True).post)
+        for conn in ["conn-1", "conn-2", "conn-3"]:
+            sender.send({"message_type": StreamMessageType.START}, conn)
+        sender.flush()
+        self.assertEqual(len(sender._failed_connections), 2)
+        self.assertFalse(sender.is_failed("conn-1"))
+        self.assertTrue(sender.is_failed("conn-3"))
+
+    def test_serialized_once(self):
+        websocket = FakeWebsocket(latency=0)
+        sender = WebsocketSender(window_ms=0, post_fn=websocket.post)
+        with mock.patch.object(websocket_utils.json, "dumps", wraps=json.dumps) as dumps:
+            stream_tokens(sender.send, ["a", "b", "c"], token_interval=0)
+            sender.flush()
+        self.assertEqual(dumps.call_count, 5)
+        chunks = websocket.messages[1:-1]
+        self.assertEqual([m["chunk_id"] for m in chunks], [0, 1, 2])
+        self.assertEqual([m["message"]["content"] for m in chunks], ["a", "b", "c"])
+
+    def test_failing_logger(self):
+        sender = WebsocketSender(post_fn=FakeWebsocket(latency=0, fail=True).post)
+        with mock.patch.object(websocket_utils.logger, "error", side_effect=OSError("log")), \
+                mock.patch.object(websocket_utils.logger, "exception", side_effect=OSError("log")):
+            sender.send({"message_type": StreamMessageType.START}, "conn")
+            self.assertTrue(sender.flush(timeout=5))
+        with self.assertRaises(WebsocketClientError):
+            sender.send(chunk_message("a"), "conn")
+
+    def test_invalid_message(self):
+        websocket = FakeWebsocket(latency=0)
+        sender = WebsocketSender(window_ms=10000, post_fn=websocket.post)
+        sender.send(chunk_message("a"), "conn")
+        sender.send(chunk_message("b"), "conn")
+        sender.send(chunk_message("c"), "conn")
+        # no content, fails while a batch is pending
+        sender.send({**chunk_message("d"), "message": {}}, "conn")
+        sender.send({"message_type": StreamMessageType.END, "message_id": "ai_1"}, "conn")
+        self.assertTrue(sender.flush(timeout=5))
+        self.assertEqual(
+            [m["message_type"] for m in websocket.messages],
+            [StreamMessageType.CHUNK, StreamMessageType.END],
+        )
+        self.assertFalse(sender.is_failed("conn"))
+
+    def test_serialization_error(self):
+        websocket = FakeWebsocket(latency=0)
+        sender = WebsocketSender(post_fn=websocket.post)
+        with self.assertRaises(TypeError):
+            sender.send(chunk_message(object()), "conn")
+        sender.send({"message_type": StreamMessageType.END, "message_id": "ai_1"}, "conn")
+        self.assertTrue(sender.flush(timeout=5))
+        self.assertEqual(websocket.messages[-1]["message_type"], StreamMessageType.END)
+        self.assertFalse(sender.is_failed("conn"))
+
+    def test_flush_timeout(self):
+        sender = WebsocketSender(post_fn=FakeWebsocket(latency=0.5).post)
+        sender.send({"message_type": StreamMessageType.START}, "conn")
+        start = time.perf_counter()
+        self.assertFalse(sender.flush(timeout=0.05))
+        self.assertLess(time.perf_counter() - start, 0.3)
+        self.assertTrue(sender.flush(timeout=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,22 @@
 import json
+import os
+import queue
+import threading
+import time
 
 import boto3
+from common_logic.common_utils.constant import StreamMessageType
 from common_logic.common_utils.logger_utils import get_logger
+from common_logic.common_utils.python_utils import LRUCache
 
 logger = get_logger("websocket_utils")
 
+WS_COALESCE_WINDOW_MS = float(os.environ.get("WS_COALESCE_WINDOW_MS", 30))
+WS_COALESCE_MAX_BYTES = int(os.environ.get("WS_COALESCE_MAX_BYTES", 256))
+WS_SENDER_QUEUE_SIZE = int(os.environ.get("WS_SENDER_QUEUE_SIZE", 1000))
+WS_FLUSH_TIMEOUT = float(os.environ.get("WS_FLUSH_TIMEOUT", 10))
+WS_FAILED_CONNECTIONS_SIZE = int(os.environ.get("WS_FAILED_CONNECTIONS_SIZE", 1000))
+
 ws_client = None
 
 
@@ -36,8 +48,258 @@ def load_ws_client(websocket_url):
     return ws_client
 
 
-def send_to_ws_client(message: dict, ws_connection_id):
+def send_to_ws_client(data: str, ws_connection_id):
     ws_client.post_to_connection(
         ConnectionId=ws_connection_id,
-        Data=json.dumps(message).encode("utf-8"),
+        Data=data.encode("utf-8"),
     )
+
+
+def _add_chunk_id(data: str, chunk_id: int):
+    """Append chunk_id to a serialized message, without serializing it again"""
+    return f'{data[:-1]}, "chunk_id": {chunk_id}}}'
+
+
+class _PendingMessage:
+    def __init__(self, key, message, data, ws_connection_id, content, enqueue_time, window):
+        self.key = key
+        self.message = message
+        self.data = data
+        self.ws_connection_id = ws_connection_id
+        self.contents = [content]
+        self.size = len(content.encode("utf-8"))
+        self.enqueue_time = enqueue_time
+        self.deadline = enqueue_time + window
+        self.items = 1
+
+    def add(self, content):
+        self.contents.append(content)
+        self.size += len(content.encode("utf-8"))
+        self.items += 1
+
+
+class WebsocketSender:
+    """
+    Post messages to websocket clients from a background thread, so that
+    generation is not blocked by post_to_connection.
+
+    Consecutive CHUNK messages of an answer, and consecutive MONITOR
+    messages, are coalesced until window_ms has passed or max_bytes are
+    buffered. The first chunk of an answer is posted right away. chunk_id
+    is assigned when a chunk is posted, so it stays ordered.
+
+    Messages are serialized once by send(). Failed connections are
+    remembered in an LRU cache of failed_connections_size entries.
+
+    A message which fails to be processed is logged and dropped, the
+    thread keeps running.
+    """
+
+    _FLUSH = object()
+
+    def __init__(
+        self,
+        window_ms=WS_COALESCE_WINDOW_MS,
+        max_bytes=WS_COALESCE_MAX_BYTES,
+        queue_size=WS_SENDER_QUEUE_SIZE,
+        failed_connections_size=WS_FAILED_CONNECTIONS_SIZE,
+        post_fn=None,
+    ):
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self.post_fn = post_fn or send_to_ws_client
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._chunk_ids = {}
+        self._failed_connections = LRUCache(failed_connections_size)
+        # messages taken from the queue and not marked as done
+        self._undone = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            "messages": 0,
+            "posts": 0,
+            "post_time": 0.0,
+            "max_post_time": 0.0,
+            "max_queue_time": 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="ws_sender", daemon=True)
+                self._thread.start()
+
+    def send(self, message: dict, ws_connection_id):
+        """
+        Queue a message, blocking while the queue is full. Raises a
+        TypeError for messages which can not be serialized.
+        """
+        error = self._failed_connections.get(ws_connection_id)
+        if error is not None:
+            raise WebsocketClientError(
+                f"websocket connection {ws_connection_id} failed: {error}")
+        # serialization errors are raised here rather than in the thread
+        data = json.dumps(message)
+        self._ensure_started()
+        self._queue.put((message, data, ws_connection_id, time.perf_counter()))
+
+    def flush(self, timeout=WS_FLUSH_TIMEOUT):
+        """
+        Wait until all queued messages are posted, at most timeout seconds.
+        Returns False on timeout.
+        """
+        if self._thread is None:
+            return True
+        deadline = time.perf_counter() + timeout
+        try:
+            self._queue.put(self._FLUSH, timeout=timeout)
+        except queue.Full:
+            logger.warning(f"websocket sender flush timed out after {timeout}s")
+            return False
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    logger.warning(
+                        f"websocket sender flush timed out after {timeout}s, "
+                        f"{self._queue.unfinished_tasks} messages not posted")
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def is_failed(self, ws_connection_id):
+        return self._failed_connections.get(ws_connection_id) is not None
+
+    @staticmethod
+    def _coalesce_key(message, ws_connection_id):
+        message_type = message.get("message_type")
+        if message_type == StreamMessageType.CHUNK:
+            return (message_type, ws_connection_id, message.get("message_id"),
+                    message.get("custom_message_id"))
+        if message_type == StreamMessageType.MONITOR:
+            return (message_type, ws_connection_id)
+        return None
+
+    @staticmethod
+    def _get_content(message):
+        if message.get("message_type") == StreamMessageType.CHUNK:
+            return message["message"]["content"]
+        return message["message"]
+
+    def _post(self, message, data, ws_connection_id, enqueue_time):
+        if self.is_failed(ws_connection_id):
+            return
+        if message.get("message_type") == StreamMessageType.CHUNK:
+            chunk_key = (ws_connection_id, message.get("message_id"))
+            chunk_id = self._chunk_ids.get(chunk_key, 0)
+            self._chunk_ids[chunk_key] = chunk_id + 1
+            data = _add_chunk_id(data, chunk_id)
+        elif message.get("message_type") in (StreamMessageType.END, StreamMessageType.ERROR):
+            self._chunk_ids.pop(
+                (ws_connection_id, message.get("message_id")), None)
+
+        start = time.perf_counter()
+        try:
+            self.post_fn(data=data, ws_connection_id=ws_connection_id)
+        except Exception as e:
+            self._failed_connections.put(ws_connection_id, str(e))
+            logger.error(f"post to websocket {ws_connection_id} failed: {e}")
+            return
+        post_time = time.perf_counter() - start
+        self.stats["posts"] += 1
+        self.stats["post_time"] += post_time
+        self.stats["max_post_time"] = max(self.stats["max_post_time"], post_time)
+        self.stats["max_queue_time"] = max(
+            self.stats["max_queue_time"], start - enqueue_time)
+
+    def _post_pending(self, pending: _PendingMessage):
+        message = pending.message
+        data = pending.data
+        if pending.items > 1:
+            # only coalesced messages are serialized again
+            content = "".join(pending.contents)
+            if message.get("message_type") == StreamMessageType.CHUNK:
+                message = {**message, "message": {**message["message"], "content": content}}
+            else:
+                message = {**message, "message": content}
+            data = json.dumps(message)
+        self._post(message, data, pending.ws_connection_id, pending.enqueue_time)
+
+    def _run(self):
+        pending = None
+        while True:
+            timeout = None
+            if pending is not None:
+                timeout = max(pending.deadline - time.perf_counter(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            else:
+                self._undone += 1
+            try:
+                if item is None:
+                    self._post_pending(pending)
+                    pending = None
+                else:
+                    pending = self._process(item, pending)
+            except Exception:
+                # the buffered messages are dropped with the failed one
+                pending = None
+                try:
+                    logger.exception("websocket sender failed to process a message")
+                except Exception:
+                    pass
+            finally:
+                # every message taken from the queue is done, except the
+                # ones still buffered
+                buffered = pending.items if pending is not None else 0
+                while self._undone > buffered:
+                    self._undone -= 1
+                    self._queue.task_done()
+
+    def _process(self, item, pending):
+        """Post or buffer a message taken from the queue, returns the pending message"""
+        if item is self._FLUSH:
+            if pending is not None:
+                self._post_pending(pending)
+            return None
+
+        message, data, ws_connection_id, enqueue_time = item
+        self.stats["messages"] += 1
+        key = self._coalesce_key(message, ws_connection_id)
+        if pending is not None and key == pending.key:
+            pending.add(self._get_content(message))
+            if pending.size >= self.max_bytes:
+                self._post_pending(pending)
+                return None
+            return pending
+
+        if pending is not None:
+            self._post_pending(pending)
+
+        is_first_chunk = (
+            message.get("message_type") == StreamMessageType.CHUNK
+            and (ws_connection_id, message.get("message_id")) not in self._chunk_ids
+        )
+        if key is None or is_first_chunk or self.window <= 0:
+            self._post(message, data, ws_connection_id, enqueue_time)
+            return None
+
+        pending = _PendingMessage(
+            key, message, data, ws_connection_id, self._get_content(message),
+            enqueue_time, self.window
+        )
+        if pending.size >= self.max_bytes:
+            self._post_pending(pending)
+            return None
+        return pending
+
+
+ws_sender = WebsocketSender()
@@ -1,7 +1,27 @@
+import os
 from typing import Any
 from common_logic.common_utils.constant import LLMTaskType
+from common_logic.common_utils.logger_utils import get_logger
+from common_logic.common_utils.python_utils import LRUCache, make_cache_key
+from common_logic.common_utils.time_utils import get_china_now
 from ..model_config import MODEL_CONFIGS
 
+logger = get_logger("llm_chain")
+
+# chains built in the warm container, reused across invocations
+LLM_CHAIN_CACHE_SIZE = int(os.environ.get("LLM_CHAIN_CACHE_SIZE", 64))
+chain_cache = LRUCache(LLM_CHAIN_CACHE_SIZE)
+
+
+def _cache_key_default(obj):
+    """Convert tools and pydantic objects in chain kwargs for make_cache_key"""
+    # tools are keyed by signature, as bound to the llm
+    if hasattr(obj, "name") and hasattr(obj, "description") and hasattr(obj, "args"):
+        return {"tool": obj.name, "description": obj.description, "args": obj.args}
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"{type(obj).__name__} can not be used in a cache key")
+
 
 class LLMChainMeta(type):
     def __new__(cls, name, bases, attrs):
@@ -23,13 +43,37 @@ class LLMChain(metaclass=LLMChainMeta):
     def _get_chain_id(model_id, intent_type):
         return f"{model_id}__{intent_type}"
 
+    @classmethod
+    def get_chain_cache_key(cls, model_kwargs=None, **kwargs):
+        """Key of the chain built from these arguments, None if it can not
+        be cached. Prompts and tools are part of kwargs, the date is added
+        as system prompts may contain it.
+        """
+        return make_cache_key(
+            cls.get_chain_id(),
+            model_kwargs or {},
+            kwargs,
+            str(get_china_now()),
+            default=_cache_key_default
+        )
+
     @classmethod
     def get_chain(cls, model_id, intent_type, model_kwargs=None, **kwargs):
         # dynamic import
         _load_module(intent_type)
-        return cls.model_map[cls._get_chain_id(model_id, intent_type)].create_chain(
-            model_kwargs=model_kwargs, **kwargs
-        )
+        chain_cls = cls.model_map[cls._get_chain_id(model_id, intent_type)]
+        cache_key = chain_cls.get_chain_cache_key(
+            model_kwargs=model_kwargs, **kwargs)
+        if cache_key is not None:
+            chain = chain_cache.get(cache_key)
+            if chain is not None:
+                return chain
+        chain = chain_cls.create_chain(model_kwargs=model_kwargs, **kwargs)
+        if cache_key is not None:
+            chain_cache.put(cache_key, chain)
+            logger.info(
+                f"chain {chain_cls.get_chain_id()} created, cache stats: {chain_cache.stats()}")
+        return chain
 
     @classmethod
     def model_id_to_class_name(cls, model_id: str, intent_type: str) -> str:
@@ -210,10 +254,16 @@ def _import_auto_evaluation_chain():
     )
 
 
+_loaded_intent_types = set()
+
+
 def _load_module(intent_type):
+    if intent_type in _loaded_intent_types:
+        return
     assert intent_type in CHAIN_MODULE_LOAD_FN_MAP, (
         intent_type, CHAIN_MODULE_LOAD_FN_MAP)
     CHAIN_MODULE_LOAD_FN_MAP[intent_type]()
+    _loaded_intent_types.add(intent_type)
 
 
 CHAIN_MODULE_LOAD_FN_MAP = {
@@ -0,0 +1,106 @@
+import time
+import unittest
+from unittest import mock
+
+from common_logic.langchain_integration import chains
+from common_logic.langchain_integration import chat_models
+from common_logic.langchain_integration.chains import LLMChain
+from common_logic.langchain_integration.chat_models import Model
+
+FAKE_MODEL_ID = "fake-model"
+FAKE_INTENT_TYPE = "fake_intent"
+# time spent building a ChatBedrockConverse and its boto3 client
+MODEL_CONSTRUCTION_TIME = 0.02
+
+
+class FakeTool:
+    def __init__(self, name):
+        self.name = name
+        self.description = f"{name} tool"
+        self.args = {"query": {"type": "string"}}
+
+
+class FakeModel(Model):
+    model_id = FAKE_MODEL_ID
+    created = 0
+
+    @classmethod
+    def create_model(cls, model_kwargs=None, **kwargs):
+        cls.created += 1
+        time.sleep(MODEL_CONSTRUCTION_TIME)
+        return object()
+
+
+class FakeChain(LLMChain):
+    model_id = FAKE_MODEL_ID
+    intent_type = FAKE_INTENT_TYPE
+    created = 0
+
+    @classmethod
+    def create_chain(cls, model_kwargs=None, **kwargs):
+        cls.created += 1
+        return (kwargs, Model.get_model(cls.model_id, model_kwargs=model_kwargs))
+
+
+class TestChainCache(unittest.TestCase):
+    def setUp(self):
+        patchers = [
+            mock.patch.dict(
+                chains.CHAIN_MODULE_LOAD_FN_MAP, {FAKE_INTENT_TYPE: lambda: None}),
+            mock.patch.dict(
+                chat_models.MODEL_MODULE_LOAD_FN_MAP, {FAKE_MODEL_ID: lambda: None}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        chains.chain_cache.clear()
+        chat_models.model_cache.clear()
+        FakeChain.created = 0
+        FakeModel.created = 0
+
+    def get_chain(self, **kwargs):
+        return LLMChain.get_chain(
+            model_id=FAKE_MODEL_ID,
+            intent_type=FAKE_INTENT_TYPE,
+            model_kwargs={"temperature": 0.1},
+            **kwargs
+        )
+
+    def test_cold_vs_warm(self):
+        kwargs = {
+            "tools": [FakeTool("search"), FakeTool("weather")],
+            "system_prompt": "You are a helpful assistant",
+        }
+        start = time.perf_counter()
+        cold_chain = self.get_chain(**kwargs)
+        cold = time.perf_counter() - start
+
+        # agent loop iterations of the following invocations
+        iterations = 10
+        start = time.perf_counter()
+        for _ in range(iterations):
+            warm_chain = self.get_chain(**kwargs)
+        warm = (time.perf_counter() - start) / iterations
+
+        print(f"get_chain cold: {cold * 1000:.2f}ms, warm: {warm * 1000:.3f}ms")
+        self.assertIs(warm_chain, cold_chain)
+        self.assertEqual(FakeChain.created, 1)
+        self.assertEqual(FakeModel.created, 1)
+        self.assertLess(warm, cold)
+
+    def test_key_changes(self):
+        self.get_chain(tools=[FakeTool("search")], system_prompt="a")
+        self.get_chain(tools=[FakeTool("weather")], system_prompt="a")
+        self.get_chain(tools=[FakeTool("search")], system_prompt="b")
+        self.assertEqual(FakeChain.created, 3)
+        # the model is shared by chains with different prompts and tools
+        self.assertEqual(FakeModel.created, 1)
+
+    def test_uncacheable_kwargs(self):
+        self.get_chain(callback=lambda x: x)
+        self.get_chain(callback=lambda x: x)
+        self.assertEqual(FakeChain.created, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,16 @@
 """
 chat models build in command pattern
 """
+import os
+
 from common_logic.common_utils.constant import LLMModelType,ModelProvider
+from common_logic.common_utils.python_utils import LRUCache, make_cache_key
 from ..model_config import MODEL_CONFIGS
 
+# model instances shared by the chains of the warm container
+LLM_MODEL_CACHE_SIZE = int(os.environ.get("LLM_MODEL_CACHE_SIZE", 32))
+model_cache = LRUCache(LLM_MODEL_CACHE_SIZE)
+
 
 class ModeMixins:
     @staticmethod
@@ -51,7 +58,17 @@ class Model(ModeMixins, metaclass=ModelMeta):
     def get_model(cls, model_id, model_kwargs=None, **kwargs):
         # dynamic load module
         _load_module(model_id)
-        return cls.model_map[model_id].create_model(model_kwargs=model_kwargs, **kwargs)
+        # kwargs which can not be serialized, e.g. a client, skip the cache
+        cache_key = make_cache_key(model_id, model_kwargs or {}, kwargs)
+        if cache_key is not None:
+            model = model_cache.get(cache_key)
+            if model is not None:
+                return model
+        model = cls.model_map[model_id].create_model(
+            model_kwargs=model_kwargs, **kwargs)
+        if cache_key is not None:
+            model_cache.put(cache_key, model)
+        return model
 
     @classmethod
     def model_id_to_class_name(cls, model_id: str) -> str:
@@ -125,10 +142,16 @@ def _import_dmaa_models():
         
 
 
+_loaded_model_ids = set()
+
+
 def _load_module(model_id):
+    if model_id in _loaded_model_ids:
+        return
     assert model_id in MODEL_MODULE_LOAD_FN_MAP, (
         model_id, MODEL_MODULE_LOAD_FN_MAP)
     MODEL_MODULE_LOAD_FN_MAP[model_id]()
+    _loaded_model_ids.add(model_id)
 
 
 MODEL_MODULE_LOAD_FN_MAP = {
@@ -1,16 +1,65 @@
+import hashlib
 import os
+import threading
+
 import boto3
+from botocore.config import Config
 from langchain_aws.chat_models import ChatBedrockConverse as _ChatBedrockConverse
 from common_logic.common_utils.constant import (
     MessageType,
     LLMModelType
 )
 from common_logic.common_utils.logger_utils import get_logger, llm_messages_print_decorator
+from common_logic.common_utils.python_utils import LRUCache
 from . import Model
 from ..model_config import MODEL_CONFIGS
 
 logger = get_logger("bedrock_model")
 
+BEDROCK_CLIENT_POOL_SIZE = int(os.environ.get("BEDROCK_CLIENT_POOL_SIZE", 8))
+BEDROCK_MAX_POOL_CONNECTIONS = int(
+    os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", 50))
+# bedrock-runtime clients keyed by region and credential set
+bedrock_client_pool = LRUCache(BEDROCK_CLIENT_POOL_SIZE)
+bedrock_client_pool_lock = threading.Lock()
+
+
+def get_bedrock_client(
+    region_name=None,
+    credentials_profile_name=None,
+    aws_access_key_id=None,
+    aws_secret_access_key=None
+):
+    """Get the pooled bedrock-runtime client of the region and credential
+    set, creating it on first use"""
+    secret_hash = hashlib.sha256(
+        aws_secret_access_key.encode()).hexdigest() if aws_secret_access_key else None
+    pool_key = (region_name, credentials_profile_name,
+                aws_access_key_id, secret_hash)
+    client = bedrock_client_pool.get(pool_key)
+    if client is not None:
+        return client
+    with bedrock_client_pool_lock:
+        client = bedrock_client_pool.get(pool_key)
+        if client is not None:
+            return client
+        session = boto3.Session(
+            profile_name=credentials_profile_name,
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key
+        )
+        client = session.client(
+            "bedrock-runtime",
+            region_name=region_name,
+            config=Config(max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS)
+        )
+        # wrapped once here, the client is shared by all models
+        client.converse_stream = llm_messages_print_decorator(
+            client.converse_stream)
+        client.converse = llm_messages_print_decorator(client.converse)
+        bedrock_client_pool.put(pool_key, client)
+        return client
+
 
 class ChatBedrockConverse(_ChatBedrockConverse):
     enable_auto_tool_choice: bool = False
@@ -45,30 +94,25 @@ class BedrockBaseModel(Model):
         if br_aws_access_key_id != "" and br_aws_secret_access_key != "":
             logger.info(
                 f"Bedrock Using AWS AKSK from environment variables. Key ID: {br_aws_access_key_id}")
-
-            client = boto3.client("bedrock-runtime", region_name=region_name,
-                                  aws_access_key_id=br_aws_access_key_id, aws_secret_access_key=br_aws_secret_access_key)
-
-            llm = ChatBedrockConverse(
-                client=client,
+            client = get_bedrock_client(
                 region_name=region_name,
-                model=cls.model_id,
-                enable_auto_tool_choice=cls.enable_auto_tool_choice,
-                enable_prefill=cls.enable_prefill,
-                **model_kwargs,
+                aws_access_key_id=br_aws_access_key_id,
+                aws_secret_access_key=br_aws_secret_access_key
             )
         else:
-            llm = ChatBedrockConverse(
-                credentials_profile_name=credentials_profile_name,
+            client = get_bedrock_client(
                 region_name=region_name,
-                model=cls.model_id,
-                enable_auto_tool_choice=cls.enable_auto_tool_choice,
-                enable_prefill=cls.enable_prefill,
-                **model_kwargs,
+                credentials_profile_name=credentials_profile_name
             )
-        llm.client.converse_stream = llm_messages_print_decorator(
-            llm.client.converse_stream)
-        llm.client.converse = llm_messages_print_decorator(llm.client.converse)
+
+        llm = ChatBedrockConverse(
+            client=client,
+            region_name=region_name,
+            model=cls.model_id,
+            enable_auto_tool_choice=cls.enable_auto_tool_choice,
+            enable_prefill=cls.enable_prefill,
+            **model_kwargs,
+        )
         return llm
 
 
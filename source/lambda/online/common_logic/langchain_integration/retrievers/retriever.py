@@ -11,8 +11,12 @@ from common_logic.langchain_integration.retrievers.utils.reranker import (
 from common_logic.langchain_integration.retrievers.utils.context_utils import (
     retriever_results_format,
 )
+from common_logic.langchain_integration.retrievers.utils.concurrent_retriever import (
+    RETRIEVER_MAX_WORKERS,
+    ConcurrentMergerRetriever,
+)
 from common_logic.langchain_integration.retrievers.utils.aos_retrievers import (
-    QueryDocumentBM25Retriever,
+    QueryDocumentHybridRetriever,
     QueryDocumentKNNRetriever,
     QueryQuestionRetriever,
 )
@@ -61,18 +65,10 @@ def get_bedrock_kb_retrievers(knowledge_base_id_list, top_k: int):
 
 
 def get_custom_qd_retrievers(config: dict, using_bm25=False):
+    if using_bm25 or config.get("using_bm25", False):
+        # one msearch for knn and bm25, fused before reranking
+        return [QueryDocumentHybridRetriever(**config)]
     qd_retriever = QueryDocumentKNNRetriever(**config)
-
-    if using_bm25:
-        bm25_retrievert = QueryDocumentBM25Retriever(
-            **{
-                "index_name": config["index_name"],
-                "using_whole_doc": config.get("using_whole_doc", False),
-                "context_num": config["context_num"],
-                "enable_debug": config.get("enable_debug", False),
-            }
-        )
-        return [qd_retriever, bm25_retrievert]
     return [qd_retriever]
 
 
@@ -81,8 +77,13 @@ def get_custom_qq_retrievers(config: dict):
     return [qq_retriever]
 
 
-def get_whole_chain(retriever_list, reranker_config):
-    lotr = MergerRetriever(retrievers=retriever_list)
+def get_whole_chain(retriever_list, reranker_config, retriever_timeouts=None):
+    if len(retriever_list) > 1 and RETRIEVER_MAX_WORKERS > 1:
+        lotr = ConcurrentMergerRetriever(
+            retrievers=retriever_list, timeouts=retriever_timeouts or []
+        )
+    else:
+        lotr = MergerRetriever(retrievers=retriever_list)
     if len(reranker_config):
         default_reranker_config = {
             "enable_debug": False,
@@ -119,12 +120,16 @@ def lambda_handler(event, context=None):
     logger.info(f"Retrieval event: {event}")
     event_body = event
     retriever_list = []
+    retriever_timeouts = []
     for retriever in event_body["retrievers"]:
         if not kb_enabled:
             retriever["vector_field"] = "sentence_vector"
             retriever["source_field"] = "source"
             retriever["text_field"] = "paragraph"
-        retriever_list.extend(get_custom_retrievers(retriever))
+        custom_retrievers = get_custom_retrievers(retriever)
+        retriever_list.extend(custom_retrievers)
+        retriever_timeouts.extend(
+            [retriever.get("timeout")] * len(custom_retrievers))
     rerankers = event_body.get("rerankers", None)
     if rerankers:
         reranker_config = rerankers[0]["config"]
@@ -132,7 +137,8 @@ def lambda_handler(event, context=None):
         reranker_config = {}
 
     if len(retriever_list) > 0:
-        whole_chain = get_whole_chain(retriever_list, reranker_config)
+        whole_chain = get_whole_chain(
+            retriever_list, reranker_config, retriever_timeouts)
     else:
         whole_chain = RunnablePassthrough.assign(docs=lambda x: [])
     docs = whole_chain.invoke({"query": event_body["query"], "debug_info": {}})
@@ -0,0 +1,94 @@
+import time
+import unittest
+
+from opensearchpy.exceptions import NotFoundError
+
+from common_logic.langchain_integration.retrievers.utils.aos_utils import (
+    IndexMetadataCache,
+    LLMBotOpenSearchClient,
+)
+
+
+class FakeIndices:
+    def __init__(self, client):
+        self.client = client
+        self.exists_calls = 0
+
+    def exists(self, index):
+        self.exists_calls += 1
+        return index in self.client.index_names
+
+
+class FakeOpenSearch:
+    """Indices without documents, counting the existence probes."""
+
+    def __init__(self, index_names):
+        self.index_names = set(index_names)
+        self.indices = FakeIndices(self)
+        self.search_calls = 0
+
+    def _check(self, index):
+        if index not in self.index_names:
+            raise NotFoundError(404, "index_not_found_exception", {})
+
+    def search(self, body, index):
+        self.search_calls += 1
+        self._check(index)
+        return {"hits": {"hits": []}}
+
+    def msearch(self, body, index):
+        self.search_calls += 1
+        self._check(index)
+        return {"responses": [{"hits": {"hits": []}} for _ in body[::2]]}
+
+
+def make_client(index_names, **cache_kwargs):
+    client = LLMBotOpenSearchClient("https://aos.example.com")
+    client.client = FakeOpenSearch(index_names)
+    client.index_cache = IndexMetadataCache(**cache_kwargs)
+    return client
+
+
+class TestIndexMetadataCache(unittest.TestCase):
+    def test_exists_probed_once(self):
+        client = make_client(["chunks"])
+        for _ in range(10):
+            self.assertEqual(
+                client.search("chunks", "basic", "$a-1", "metadata.chunk_id"),
+                {"hits": {"hits": []}},
+            )
+            client.msearch("chunks", "basic", ["$a-1", "$a-2"], "metadata.chunk_id")
+        self.assertEqual(client.client.indices.exists_calls, 1)
+        self.assertEqual(client.client.search_calls, 20)
+        self.assertEqual(client.index_cache.stats(), {"hits": 19, "misses": 1})
+
+    def test_missing_index(self):
+        client = make_client([])
+        for _ in range(5):
+            self.assertEqual(client.search("chunks", "basic", "$a-1"), [])
+            self.assertEqual(client.msearch("chunks", "basic", ["$a-1"]), [[]])
+        self.assertEqual(client.client.indices.exists_calls, 1)
+        # missing indices are not searched
+        self.assertEqual(client.client.search_calls, 0)
+
+    def test_refresh_after_not_found(self):
+        client = make_client(["chunks"], negative_ttl=0.1)
+        client.search("chunks", "basic", "$a-1")
+
+        # the index is deleted while cached as existing
+        client.client.index_names.clear()
+        self.assertEqual(client.search("chunks", "basic", "$a-1"), [])
+        self.assertEqual(client.client.search_calls, 2)
+        self.assertFalse(client.index_exists("chunks"))
+        self.assertEqual(client.client.indices.exists_calls, 1)
+
+        # created again, picked up once the negative entry expired
+        client.client.index_names.add("chunks")
+        time.sleep(0.15)
+        self.assertEqual(
+            client.search("chunks", "basic", "$a-1"), {"hits": {"hits": []}})
+        self.assertEqual(client.client.indices.exists_calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
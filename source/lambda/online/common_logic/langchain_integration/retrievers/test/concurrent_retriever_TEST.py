@@ -0,0 +1,90 @@
+import time
+import unittest
+from typing import List
+
+from langchain.docstore.document import Document
+from langchain.schema.retriever import BaseRetriever
+
+from common_logic.langchain_integration.retrievers.utils.concurrent_retriever import (
+    ConcurrentMergerRetriever,
+)
+
+
+class SleepRetriever(BaseRetriever):
+    """Return fixed documents after `latency` seconds"""
+
+    name: str
+    doc_count: int = 2
+    latency: float = 0.1
+    error: bool = False
+
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        time.sleep(self.latency)
+        if self.error:
+            raise RuntimeError(f"{self.name} failed")
+        return [
+            Document(page_content=f"{self.name}-{i}", metadata={"query": query})
+            for i in range(self.doc_count)
+        ]
+
+
+def contents(documents):
+    return [document.page_content for document in documents]
+
+
+class TestConcurrentMergerRetriever(unittest.TestCase):
+    def test_concurrent_dispatch(self):
+        retrievers = [SleepRetriever(name=f"r{i}", latency=0.1) for i in range(4)]
+        retriever = ConcurrentMergerRetriever(retrievers=retrievers)
+        start = time.perf_counter()
+        documents = retriever.invoke({"query": "password"})
+        elapsed = time.perf_counter() - start
+
+        # sequential retrievers would take 0.4s
+        self.assertLess(elapsed, 0.25)
+        self.assertEqual(len(documents), 8)
+        self.assertEqual(documents[0].metadata["query"], {"query": "password"})
+
+    def test_merge_order(self):
+        # the slowest retriever finishes last but keeps its position
+        retriever = ConcurrentMergerRetriever(retrievers=[
+            SleepRetriever(name="a", doc_count=3, latency=0.1),
+            SleepRetriever(name="b", doc_count=1, latency=0),
+            SleepRetriever(name="c", doc_count=2, latency=0.05),
+        ])
+        self.assertEqual(
+            contents(retriever.invoke("password")),
+            ["a-0", "b-0", "c-0", "a-1", "c-1", "a-2"],
+        )
+
+    def test_timeout(self):
+        retriever = ConcurrentMergerRetriever(
+            retrievers=[
+                SleepRetriever(name="slow", latency=0.5),
+                SleepRetriever(name="fast", latency=0),
+            ],
+            timeouts=[0.1],
+        )
+        start = time.perf_counter()
+        documents = retriever.invoke("password")
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual(contents(documents), ["fast-0", "fast-1"])
+
+    def test_failures(self):
+        retriever = ConcurrentMergerRetriever(retrievers=[
+            SleepRetriever(name="a", latency=0, error=True),
+            SleepRetriever(name="b", latency=0),
+        ])
+        self.assertEqual(contents(retriever.invoke("password")), ["b-0", "b-1"])
+
+        retriever = ConcurrentMergerRetriever(retrievers=[
+            SleepRetriever(name="a", latency=0, error=True),
+        ])
+        with self.assertRaises(RuntimeError):
+            retriever.invoke("password")
+
+
+if __name__ == "__main__":
+    unittest.main()
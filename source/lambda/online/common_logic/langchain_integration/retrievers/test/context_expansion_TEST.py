@@ -0,0 +1,108 @@
+import unittest
+
+from common_logic.langchain_integration.retrievers.utils.context_expansion import (
+    ContextExpander,
+)
+
+
+class FakeOpenSearchClient:
+    """Serve chunk lookups from memory and count round trips."""
+
+    def __init__(self, chunks):
+        self.chunks = {chunk["metadata"]["chunk_id"]: chunk for chunk in chunks}
+        self.round_trips = 0
+
+    def _lookup(self, chunk_id):
+        if chunk_id in self.chunks:
+            return {"hits": {"hits": [{"_source": self.chunks[chunk_id]}]}}
+        return {"hits": {"hits": []}}
+
+    def search(self, index_name, query_type, query_term, field="text", size=10, filter=None):
+        self.round_trips += 1
+        return self._lookup(query_term)
+
+    def msearch(self, index_name, query_type, query_terms, field="text", size=10, filter=None):
+        self.round_trips += 1
+        return [self._lookup(query_term) for query_term in query_terms]
+
+
+def make_chunk(chunk_id, previous=None, next=None):
+    # the ingestion writes missing links as None
+    return {
+        "text": chunk_id,
+        "metadata": {
+            "chunk_id": chunk_id,
+            "heading_hierarchy": {"previous": previous, "next": next},
+        },
+    }
+
+
+def make_hit(chunk):
+    return {"_source": chunk, "_score": 1.0}
+
+
+class TestContextExpander(unittest.TestCase):
+    def test_sibling_context_in_one_round_trip(self):
+        # 10 documents with 5 sections each, every section is a hit
+        chunks = [
+            make_chunk(f"$doc{d}-{s}") for d in range(10) for s in range(1, 6)
+        ]
+        client = FakeOpenSearchClient(chunks)
+        hits = [make_hit(chunk) for chunk in chunks if chunk["text"].endswith("-3")]
+        contexts = ContextExpander(client, "index", 2).expand(hits)
+
+        self.assertEqual(client.round_trips, 1)
+        self.assertEqual(contexts[0], [["$doc0-1", "$doc0-2"], ["$doc0-5", "$doc0-4"]])
+
+    def test_heading_chain_batched_per_hop(self):
+        # Sections are not numbered contiguously, so the heading chain has
+        # to be followed: $a-1 <- $b-1 <- $c-1 -> $d-1 -> $e-1
+        chunks = [
+            make_chunk("$a-1", next="$b-1"),
+            make_chunk("$b-1", previous="$a-1", next="$c-1"),
+            make_chunk("$c-1", previous="$b-1", next="$d-1"),
+            make_chunk("$d-1", previous="$c-1", next="$e-1"),
+            make_chunk("$e-1", previous="$d-1"),
+            make_chunk("$x-1", next="$y-1"),
+            make_chunk("$y-1", previous="$x-1"),
+        ]
+        client = FakeOpenSearchClient(chunks)
+        hits = [make_hit(chunks[2]), make_hit(chunks[5])]
+        contexts = ContextExpander(client, "index", 2).expand(hits)
+
+        self.assertEqual(contexts[0], [["$a-1", "$b-1"], ["$d-1", "$e-1"]])
+        self.assertEqual(contexts[1], [[], ["$y-1"]])
+        # One round trip for the predictable ids, one for the second hop.
+        self.assertEqual(client.round_trips, 2)
+
+    def test_chain_ends(self):
+        # single section documents, both links are None
+        chunks = [make_chunk(f"$doc{d}-1") for d in range(5)]
+        client = FakeOpenSearchClient(chunks)
+        contexts = ContextExpander(client, "index", 2).expand(
+            [make_hit(chunk) for chunk in chunks]
+        )
+
+        self.assertEqual(contexts, [[[], []]] * 5)
+        self.assertEqual(client.round_trips, 1)
+
+    def test_hit_without_chunk_id(self):
+        client = FakeOpenSearchClient([])
+        hits = [make_hit({"text": "faq", "metadata": {}})]
+        contexts = ContextExpander(client, "index", 2).expand(hits)
+
+        self.assertEqual(contexts, [[[], []]])
+        self.assertEqual(client.round_trips, 0)
+
+    def test_zero_window(self):
+        client = FakeOpenSearchClient([make_chunk("$a-1")])
+        contexts = ContextExpander(client, "index", 0).expand(
+            [make_hit(make_chunk("$a-2"))]
+        )
+
+        self.assertEqual(contexts, [[[], []]])
+        self.assertEqual(client.round_trips, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
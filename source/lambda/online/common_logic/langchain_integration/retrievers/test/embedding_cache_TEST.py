@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+
+from common_logic.langchain_integration.retrievers.utils.embedding_cache import (
+    EmbeddingCache,
+    LocalFileEmbeddingCacheBackend,
+)
+
+
+class FakeEmbeddingEndpoint:
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, prompt):
+        self.calls += 1
+        return [float(len(prompt)), 1.0]
+
+
+# Embedding lookups made by one common_entry invocation: QQ match and
+# intention detection use the similarity embedding, each private knowledge
+# index and the all_knowledge_rag_tool use the relevance embedding.
+REQUEST_LOOKUPS = [
+    ("bedrock", "amazon.titan-embed-text-v2:0", "", "", True),
+    ("bedrock", "amazon.titan-embed-text-v2:0", "", "", True),
+    ("bedrock", "amazon.titan-embed-text-v2:0", "", "", False),
+    ("bedrock", "amazon.titan-embed-text-v2:0", "", "", False),
+    ("bedrock", "amazon.titan-embed-text-v2:0", "", "", False),
+    ("bedrock", "amazon.titan-embed-text-v2:0", "", "", False),
+]
+
+
+def run_request(query, endpoint, cache=None):
+    for model_type, model_id, target_model, prompt_prefix, normalize in REQUEST_LOOKUPS:
+        if cache is None:
+            endpoint.embed(prompt_prefix + query)
+            continue
+        key = EmbeddingCache.make_key(
+            model_type, model_id, target_model, prompt_prefix, query, normalize
+        )
+        cache.get_or_compute(key, lambda: endpoint.embed(prompt_prefix + query))
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_endpoint_calls_per_request(self):
+        queries = ["what is s3", "how to create an ec2 instance", "what is s3"]
+
+        uncached_endpoint = FakeEmbeddingEndpoint()
+        for query in queries:
+            run_request(query, uncached_endpoint)
+
+        cached_endpoint = FakeEmbeddingEndpoint()
+        cache = EmbeddingCache(max_size=16)
+        for query in queries:
+            run_request(query, cached_endpoint, cache)
+
+        print(
+            f"endpoint calls for {len(queries)} requests: "
+            f"{uncached_endpoint.calls} without cache, "
+            f"{cached_endpoint.calls} with cache"
+        )
+        self.assertEqual(uncached_endpoint.calls, 18)
+        # Similarity and relevance embeddings of the two distinct queries.
+        self.assertEqual(cached_endpoint.calls, 4)
+
+    def test_lru_eviction(self):
+        endpoint = FakeEmbeddingEndpoint()
+        cache = EmbeddingCache(max_size=2)
+        for text in ["a", "b", "a", "c", "b"]:
+            key = EmbeddingCache.make_key("vector", "endpoint", "model", "", text)
+            cache.get_or_compute(key, lambda: endpoint.embed(text))
+
+        # "b" was evicted by "c" because "a" was used more recently.
+        self.assertEqual(endpoint.calls, 4)
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_compute_failure(self):
+        cache = EmbeddingCache()
+        key = EmbeddingCache.make_key("vector", "endpoint", "model", "", "hello")
+
+        def throttled():
+            raise RuntimeError("ThrottlingException")
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_compute(key, throttled)
+        self.assertEqual(cache._key_locks, {})
+        self.assertEqual(cache.get_or_compute(key, lambda: [1.0]), [1.0])
+
+    def test_local_file_backend_across_containers(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            endpoint = FakeEmbeddingEndpoint()
+            key = EmbeddingCache.make_key("m3", "endpoint", "model", "", "hello")
+            for _ in range(2):
+                cache = EmbeddingCache(
+                    backend=LocalFileEmbeddingCacheBackend(cache_dir)
+                )
+                embedding = cache.get_or_compute(key, lambda: endpoint.embed("hello"))
+
+            self.assertEqual(endpoint.calls, 1)
+            self.assertEqual(embedding, [5.0, 1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+
+from common_logic.langchain_integration.retrievers.utils.context_expansion import (
+    ContextExpander,
+)
+from common_logic.langchain_integration.retrievers.utils.hybrid_search import (
+    HybridSearcher,
+    reciprocal_rank_fusion,
+)
+
+
+def make_hit(chunk_id, score):
+    return {
+        "_id": chunk_id,
+        "_score": score,
+        "_source": {
+            "text": chunk_id,
+            "metadata": {"chunk_id": chunk_id, "file_path": chunk_id.split("-")[0]},
+        },
+    }
+
+
+class FakeOpenSearchClient:
+    """Rank chunks by fixed knn and bm25 orders and count round trips."""
+
+    def __init__(self, knn_ids, bm25_ids, chunk_ids):
+        self.knn_ids = knn_ids
+        self.bm25_ids = bm25_ids
+        self.chunk_ids = set(chunk_ids)
+        self.round_trips = 0
+
+    def _search(self, query_type, query_term, size):
+        if query_type == "knn":
+            ids = self.knn_ids
+        elif query_type == "fuzzy":
+            ids = self.bm25_ids
+        else:
+            ids = [query_term] if query_term in self.chunk_ids else []
+        return {"hits": {"hits": [
+            make_hit(chunk_id, 1.0 / (rank + 1))
+            for rank, chunk_id in enumerate(ids[:size])
+        ]}}
+
+    def search(self, index_name, query_type, query_term, field="text", size=10, filter=None):
+        self.round_trips += 1
+        return self._search(query_type, query_term, size)
+
+    def msearch(self, index_name, query_type, query_terms, field="text", size=10, filter=None):
+        self.round_trips += 1
+        return [self._search(query_type, term, size) for term in query_terms]
+
+    def multi_search(self, index_name, searches):
+        self.round_trips += 1
+        return [
+            self._search(s["query_type"], s["query_term"], s["size"]) for s in searches
+        ]
+
+
+def separate_retrievers(client, context_num, knn_size, bm25_size):
+    """Knn and bm25 retrievers searching and expanding context on their own,
+    concatenated as MergerRetriever does"""
+    results = []
+    for query_type, size in (("knn", knn_size), ("fuzzy", bm25_size)):
+        hits = client.search("index", query_type, "query", size=size)["hits"]["hits"]
+        contexts = ContextExpander(client, "index", context_num).expand(hits)
+        results.extend(zip(hits, contexts))
+    return results
+
+
+class TestHybridSearch(unittest.TestCase):
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion({
+            "knn": [make_hit("a-1", 0.9), make_hit("b-1", 0.8), make_hit("c-1", 0.7)],
+            "bm25": [make_hit("c-1", 12.0), make_hit("d-1", 11.0)],
+        }, rrf_k=60)
+        self.assertEqual([hit["_id"] for hit, _, _ in fused], ["c-1", "a-1", "b-1", "d-1"])
+        _, rrf_score, scores = fused[0]
+        self.assertAlmostEqual(rrf_score, 1 / 63 + 1 / 61)
+        self.assertEqual(scores, {"knn": 0.7, "bm25": 12.0})
+
+    def test_round_trips_vs_separate_retrievers(self):
+        chunk_ids = [f"$doc{d}-{s}" for d in range(10) for s in range(1, 6)]
+        knn_ids = [f"$doc{d}-3" for d in range(10)]
+        # bm25 recalls half of the knn chunks
+        bm25_ids = [f"$doc{d}-3" for d in range(0, 10, 2)] + [f"$doc{d}-2" for d in range(5)]
+
+        client = FakeOpenSearchClient(knn_ids, bm25_ids, chunk_ids)
+        separate = separate_retrievers(client, 2, knn_size=10, bm25_size=10)
+        separate_round_trips = client.round_trips
+
+        client = FakeOpenSearchClient(knn_ids, bm25_ids, chunk_ids)
+        fused = HybridSearcher(client, "index", context_num=2).search(
+            "query", [0.1], knn_size=10, bm25_size=10, top_k=10)
+
+        print(
+            f"separate retrievers: {separate_round_trips} round trips, "
+            f"{len(separate)} candidates; hybrid: {client.round_trips} round trips, "
+            f"{len(fused)} candidates"
+        )
+        self.assertEqual(client.round_trips, 2)
+        self.assertLess(client.round_trips, separate_round_trips)
+        self.assertEqual(len(fused), 10)
+        # chunks recalled by both modes come first
+        self.assertEqual(
+            [r["hit"]["_id"] for r in fused[:5]],
+            [f"$doc{d}-3" for d in range(0, 10, 2)])
+        self.assertEqual(set(fused[0]["scores"]), {"knn", "bm25"})
+        separate_contexts = {hit["_id"]: context for hit, context in separate}
+        for result in fused:
+            self.assertEqual(result["context"], separate_contexts[result["hit"]["_id"]])
+
+    def test_no_expansion(self):
+        client = FakeOpenSearchClient(["$a-2"], [], ["$a-1", "$a-2"])
+        fused = HybridSearcher(client, "index", context_num=2).search(
+            "query", [0.1], expand_context=False)
+        self.assertEqual(client.round_trips, 1)
+        self.assertEqual(fused[0]["context"], ([], []))
+
+    def test_missing_index(self):
+        client = FakeOpenSearchClient([], [], [])
+        client.multi_search = lambda index_name, searches: [[] for _ in searches]
+        self.assertEqual(HybridSearcher(client, "index").search("query", [0.1]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import time
+import unittest
+
+import numpy as np
+
+from common_logic.langchain_integration.retrievers.utils.local_intention_index import (
+    AOS_MAX_RESULT_WINDOW,
+    INTENTION_VERSION_META_KEY,
+    LocalIntentionMatcher,
+)
+
+DIM = 1024
+# round trip of a knn search on the intention index from the lambda
+AOS_KNN_LATENCY = 0.015
+
+
+class FakeIndices:
+    def __init__(self, client):
+        self.client = client
+
+    def get_mapping(self, index):
+        self.client.round_trips += 1
+        return {
+            index: {
+                "mappings": {
+                    "_meta": {INTENTION_VERSION_META_KEY: self.client.version},
+                    "properties": {
+                        "sentence_vector": {
+                            "type": "knn_vector",
+                            "method": {"space_type": self.client.space_type},
+                        }
+                    },
+                }
+            }
+        }
+
+
+class FakeOpenSearch:
+    """Intention index with exact knn scoring as aos does for l2 and
+    cosinesimil spaces."""
+
+    def __init__(self, n_examples, space_type="l2", seed=0):
+        rng = np.random.default_rng(seed)
+        vectors = rng.standard_normal((n_examples, DIM))
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.space_type = space_type
+        self.version = "1"
+        self.round_trips = 0
+        self.indices = FakeIndices(self)
+
+    def source(self, i):
+        return {
+            "text": f"question {i}",
+            "metadata": {"answer": f"intent_{i % 7}", "source": "portal", "type": "Intent"},
+        }
+
+    def search(self, index, body):
+        self.round_trips += 1
+        if body["size"] > AOS_MAX_RESULT_WINDOW:
+            raise ValueError("Result window is too large")
+        if "knn" in body["query"]:
+            time.sleep(AOS_KNN_LATENCY)
+            query = np.asarray(body["query"]["knn"]["sentence_vector"]["vector"])
+            scores = self.scores(query)
+            top = np.argsort(-scores, kind="stable")[:body["size"]]
+            return {"hits": {"hits": [
+                {"_score": float(scores[i]), "_source": self.source(i)} for i in top
+            ]}}
+        return {"hits": {"hits": [
+            {"_score": 1.0, "_source": {**self.source(i), "sentence_vector": v.tolist()}}
+            for i, v in enumerate(self.vectors[:body["size"]])
+        ]}}
+
+    def scores(self, query):
+        if self.space_type == "cosinesimil":
+            return (1 + self.vectors @ query / np.linalg.norm(query)) / 2
+        return 1 / (1 + ((self.vectors - query) ** 2).sum(axis=1))
+
+    def remote_search(self, query_vector, top_k):
+        return self.search("intention", {
+            "size": top_k,
+            "query": {"knn": {"sentence_vector": {"vector": query_vector, "k": top_k}}},
+        })
+
+
+def queries(n, seed=1):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, DIM))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+
+
+class TestLocalIntentionMatcher(unittest.TestCase):
+    def assert_same_hits(self, local, remote):
+        self.assertEqual(
+            [h["_source"]["text"] for h in local["hits"]["hits"]],
+            [h["_source"]["text"] for h in remote["hits"]["hits"]],
+        )
+        np.testing.assert_allclose(
+            [h["_score"] for h in local["hits"]["hits"]],
+            [h["_score"] for h in remote["hits"]["hits"]],
+            rtol=1e-4,
+        )
+
+    def test_same_results_as_aos(self):
+        for space_type in ("l2", "cosinesimil"):
+            client = FakeOpenSearch(500, space_type=space_type)
+            matcher = LocalIntentionMatcher(client)
+            for query in queries(5):
+                local = matcher.search("intention", query, "sentence_vector", 5)
+                self.assert_same_hits(local, client.remote_search(query, 5))
+                self.assertNotIn("sentence_vector", local["hits"]["hits"][0]["_source"])
+
+    def test_version_refresh(self):
+        client = FakeOpenSearch(50)
+        matcher = LocalIntentionMatcher(client, version_check_interval=0)
+        query = queries(1)[0]
+        matcher.search("intention", query, "sentence_vector", 3)
+        self.assertEqual(client.round_trips, 2)
+
+        # unchanged version, only the mapping is read
+        matcher.search("intention", query, "sentence_vector", 3)
+        self.assertEqual(client.round_trips, 3)
+
+        # new examples ingested
+        client.vectors = client.vectors[::-1].copy()
+        client.version = "2"
+        local = matcher.search("intention", query, "sentence_vector", 3)
+        # version check, then mapping and documents of the reload
+        self.assertEqual(client.round_trips, 6)
+        self.assert_same_hits(local, client.remote_search(query, 3))
+
+    def test_large_index_searched_on_aos(self):
+        client = FakeOpenSearch(50)
+        matcher = LocalIntentionMatcher(client, max_size=10)
+        self.assertIsNone(matcher.search("intention", queries(1)[0], "sentence_vector", 3))
+
+    def test_default_max_size(self):
+        client = FakeOpenSearch(50)
+        for max_size in (None, 20000):
+            kwargs = {} if max_size is None else {"max_size": max_size}
+            matcher = LocalIntentionMatcher(client, **kwargs)
+            self.assertIsNotNone(matcher.get_index("intention", "sentence_vector"))
+
+    def test_load_failure_cached(self):
+        client = FakeOpenSearch(50)
+        matcher = LocalIntentionMatcher(client, ttl=0.2, version_check_interval=0)
+        real_search = client.search
+
+        def failing_search(index, body):
+            client.round_trips += 1
+            raise RuntimeError("down")
+
+        client.search = failing_search
+        query = queries(1)[0]
+        self.assertIsNone(matcher.search("intention", query, "sentence_vector", 3))
+        round_trips = client.round_trips
+        for _ in range(5):
+            self.assertIsNone(matcher.search("intention", query, "sentence_vector", 3))
+        self.assertEqual(client.round_trips, round_trips)
+
+        # loaded again once the TTL expired
+        client.search = real_search
+        time.sleep(0.25)
+        self.assertIsNotNone(matcher.search("intention", query, "sentence_vector", 3))
+
+    def test_benchmark(self):
+        n_queries = 20
+        for n_examples in (500, 3000):
+            client = FakeOpenSearch(n_examples)
+            matcher = LocalIntentionMatcher(client)
+            query_vectors = queries(n_queries)
+
+            start = time.perf_counter()
+            remote = [client.remote_search(q, 5) for q in query_vectors]
+            remote_time = (time.perf_counter() - start) / n_queries
+
+            start = time.perf_counter()
+            matcher.get_index("intention", "sentence_vector")
+            load_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            local = [
+                matcher.search("intention", q, "sentence_vector", 5) for q in query_vectors
+            ]
+            local_time = (time.perf_counter() - start) / n_queries
+
+            print(
+                f"{n_examples} intention examples: remote knn {remote_time * 1000:.2f}ms, "
+                f"local {local_time * 1000:.3f}ms per query, load {load_time * 1000:.1f}ms"
+            )
+            for local_response, remote_response in zip(local, remote):
+                self.assert_same_hits(local_response, remote_response)
+            self.assertLess(local_time, remote_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
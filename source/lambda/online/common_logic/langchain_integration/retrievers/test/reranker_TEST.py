@@ -0,0 +1,185 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+from langchain.schema import Document
+
+from common_logic.langchain_integration.retrievers.utils import reranker
+from common_logic.langchain_integration.retrievers.utils.reranker import (
+    BGEM3Reranker,
+    BGEReranker,
+)
+
+# bge-m3 colbert vectors
+DIM = 1024
+
+
+def reference_colbert_scores(query_colbert, doc_colbert_list):
+    """The per document task implementation used before the batched scorer"""
+
+    def colbert_score_np(q_reps, p_reps):
+        token_scores = np.einsum('nik,njk->nij', q_reps, p_reps)
+        scores = token_scores.max(-1)
+        return np.sum(scores) / q_reps.shape[0]
+
+    async def ainvoke(query_batch, doc_batch, loop):
+        return await loop.run_in_executor(
+            None, colbert_score_np, np.asarray(query_batch), np.asarray(doc_batch))
+
+    async def spawn_task():
+        loop = asyncio.get_event_loop()
+        task_list = [
+            asyncio.create_task(ainvoke([query_colbert], [doc], loop))
+            for doc in doc_colbert_list
+        ]
+        return await asyncio.gather(*task_list)
+
+    return asyncio.run(spawn_task())
+
+
+def random_colbert(rng, n_tokens):
+    vectors = rng.standard_normal((n_tokens, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # retrieval_data comes back from OpenSearch as lists
+    return vectors.tolist()
+
+
+def make_documents(rng, n_docs):
+    return [
+        Document(
+            page_content=f"doc {i}",
+            metadata={
+                "retrieval_data": {"colbert": random_colbert(rng, int(rng.integers(20, 200)))},
+                "retrieval_content": f"doc {i}",
+                "source": f"s3://bucket/doc_{i}.md",
+            },
+        )
+        for i in range(n_docs)
+    ]
+
+
+class TestBGEM3Reranker(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.query_colbert = random_colbert(self.rng, 16)
+
+    def test_same_scores_as_reference(self):
+        docs = make_documents(self.rng, 37)
+        doc_colbert_list = [d.metadata["retrieval_data"]["colbert"] for d in docs]
+        expected = reference_colbert_scores(self.query_colbert, doc_colbert_list)
+        for batch_size in (1, 5, 64):
+            scores = BGEM3Reranker(score_batch_size=batch_size)._colbert_scores(
+                self.query_colbert, doc_colbert_list)
+            np.testing.assert_allclose(scores, expected, rtol=1e-4)
+
+    def test_compress_documents(self):
+        docs = make_documents(self.rng, 10)
+        query = {"colbert": self.query_colbert, "debug_info": {}}
+        results = BGEM3Reranker().compress_documents(docs, query)
+        scores = [d.metadata["rerank_score"] for d in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(isinstance(score, float) for score in scores))
+
+    def test_benchmark(self):
+        reranker = BGEM3Reranker()
+        for n_docs in (50, 200):
+            docs = make_documents(self.rng, n_docs)
+            doc_colbert_list = [d.metadata["retrieval_data"]["colbert"] for d in docs]
+
+            start = time.perf_counter()
+            expected = reference_colbert_scores(self.query_colbert, doc_colbert_list)
+            reference_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scores = reranker._colbert_scores(self.query_colbert, doc_colbert_list)
+            batched_time = time.perf_counter() - start
+
+            print(
+                f"{n_docs} docs: per document tasks {reference_time * 1000:.1f}ms, "
+                f"batched {batched_time * 1000:.1f}ms"
+            )
+            np.testing.assert_allclose(scores, expected, rtol=1e-4)
+            self.assertLess(batched_time, reference_time)
+
+
+class FakeRerankEndpoint:
+    """Score a pair by the length of the doc and record the pairs sent."""
+
+    def __init__(self):
+        self.pairs = []
+
+    def __call__(self, prompt, endpoint_name, region_name, model_type, stop,
+                 target_model=None):
+        pairs = json.loads(prompt)
+        self.pairs.extend(pairs)
+        return json.dumps([float(len(doc)) for _, doc in pairs])
+
+
+def make_chunk(i, retriever):
+    return Document(
+        page_content=f"chunk {i}",
+        metadata={
+            "source": f"s3://bucket/doc_{i % 3}.md",
+            "retrieval_content": f"chunk {i} " * (i + 1),
+            "retrieval_score": 1.0,
+            "retriever": retriever,
+        },
+    )
+
+
+class TestBGEReranker(unittest.TestCase):
+    def setUp(self):
+        self.endpoint = FakeRerankEndpoint()
+        patcher = mock.patch.object(
+            reranker, "SagemakerEndpointVectorOrCross", self.endpoint)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reranker.rerank_score_cache.clear()
+        reranker.rerank_pair_metrics.reset()
+
+    def rerank(self, documents, query="what is lambda", top_k=10):
+        compressor = BGEReranker(
+            rerank_model_endpoint="rerank-endpoint",
+            target_model="bge_reranker_model.tar.gz",
+            top_k=top_k,
+        )
+        return compressor.compress_documents(
+            documents, {"query": query, "debug_info": {}})
+
+    def test_turn_with_overlapping_tools(self):
+        # knn and bm25 of one index recall overlapping chunks
+        knn = [make_chunk(i, "knn") for i in range(10)]
+        bm25 = [make_chunk(i, "bm25") for i in range(5, 15)]
+        # all_knowledge_rag_tool and the index rag tool rerank the same chunks
+        all_knowledge_results = self.rerank(knn + bm25)
+        index_results = self.rerank(bm25 + knn)
+
+        metrics = reranker.rerank_pair_metrics.to_dict()
+        print(f"rerank pairs in a turn: {metrics}")
+        self.assertEqual(metrics["requested"], 40)
+        self.assertEqual(metrics["sent"], 15)
+        self.assertEqual(len(self.endpoint.pairs), 15)
+        self.assertEqual(metrics["duplicated"], 10)
+        self.assertEqual(metrics["cached"], 15)
+
+        expected = [f"chunk {i}" for i in range(14, 4, -1)]
+        self.assertEqual([d.page_content for d in all_knowledge_results], expected)
+        self.assertEqual([d.page_content for d in index_results], expected)
+        self.assertEqual(
+            [d.metadata["rerank_score"] for d in index_results],
+            [float(len(d.metadata["retrieval_content"])) for d in index_results])
+
+    def test_cache_key(self):
+        chunks = [make_chunk(i, "knn") for i in range(3)]
+        self.rerank(chunks, query="what is lambda")
+        self.rerank(chunks, query="what is glue")
+        self.assertEqual(len(self.endpoint.pairs), 6)
+        self.rerank(chunks, query="what is glue")
+        self.assertEqual(len(self.endpoint.pairs), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import io
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import boto3
+import sm_utils
+from langchain_community.llms import SagemakerEndpoint
+from sm_invoker import SagemakerEndpointInvoker
+
+
+class FakeSagemakerRuntime:
+    """Answer rerank requests, each call takes `latency` seconds."""
+
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept, **kwargs):
+        with self._lock:
+            self.calls.append((EndpointName, kwargs))
+        time.sleep(self.latency)
+        pairs = json.loads(Body)["inputs"]
+        scores = [float(len(doc)) for _, doc in pairs]
+        return {"Body": io.BytesIO(json.dumps({"rerank_scores": scores}).encode("utf-8"))}
+
+
+def rerank_batch(i):
+    return json.dumps([["query", "doc" * (i % 5 + 1)]])
+
+
+class TestSagemakerEndpointInvoker(unittest.TestCase):
+    def setUp(self):
+        self.runtime = FakeSagemakerRuntime()
+        self.created_clients = []
+
+        def client_factory(region_name):
+            self.created_clients.append(region_name)
+            return self.runtime
+
+        self.invoker = SagemakerEndpointInvoker(client_factory=client_factory)
+        patcher = mock.patch.object(sm_utils, "sm_invoker", self.invoker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def invoke_rerank(self, batch):
+        return sm_utils.SagemakerEndpointVectorOrCross(
+            batch, "rerank-endpoint", "us-east-1", "rerank", None,
+            target_model="bge_reranker_model.tar.gz")
+
+    def test_pooled_client_and_metrics(self):
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(
+                self.invoke_rerank, [rerank_batch(i) for i in range(32)]))
+
+        self.assertEqual(json.loads(responses[0]), [3.0])
+        self.assertEqual(self.created_clients, ["us-east-1"])
+        self.assertEqual(
+            self.runtime.calls[0],
+            ("rerank-endpoint", {"TargetModel": "bge_reranker_model.tar.gz"}))
+        metrics = self.invoker.metrics()["rerank-endpoint"]
+        self.assertEqual(metrics["invocations"], 32)
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertGreater(metrics["max_in_flight"], 1)
+        self.assertGreaterEqual(metrics["avg_latency"], self.runtime.latency)
+
+    def test_errors_counted(self):
+        self.runtime.invoke_endpoint = mock.Mock(side_effect=RuntimeError("throttled"))
+        with self.assertRaises(ValueError):
+            self.invoke_rerank(rerank_batch(0))
+        metrics = self.invoker.metrics()["rerank-endpoint"]
+        self.assertEqual((metrics["errors"], metrics["in_flight"]), (1, 0))
+
+    def test_benchmark(self):
+        self.runtime.latency = 0
+        batches = [rerank_batch(i) for i in range(50)]
+
+        # a client and a langchain wrapper per call
+        start = time.perf_counter()
+        for batch in batches:
+            client = boto3.client("sagemaker-runtime", region_name="us-east-1")
+            client.invoke_endpoint = self.runtime.invoke_endpoint
+            expected = SagemakerEndpoint(
+                client=client,
+                endpoint_name="rerank-endpoint",
+                content_handler=sm_utils.rerankContentHandler(),
+                endpoint_kwargs={"TargetModel": "bge_reranker_model.tar.gz"},
+            ).invoke(batch)
+        per_call_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for batch in batches:
+            response = self.invoke_rerank(batch)
+        pooled_time = time.perf_counter() - start
+
+        print(
+            f"{len(batches)} rerank calls: client per call {per_call_time * 1000:.1f}ms, "
+            f"pooled invoker {pooled_time * 1000:.1f}ms"
+        )
+        self.assertEqual(response, expected)
+        self.assertLess(pooled_time, per_call_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
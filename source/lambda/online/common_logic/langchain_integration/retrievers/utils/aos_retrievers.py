@@ -1,4 +1,3 @@
-import asyncio
 import json
 import logging
 import os
@@ -14,6 +13,10 @@ from langchain_community.embeddings import BedrockEmbeddings
 from sm_utils import SagemakerEndpointVectorOrCross
 
 from .aos_utils import LLMBotOpenSearchClient
+from .context_expansion import ContextExpander
+from .embedding_cache import EmbeddingCache
+from .hybrid_search import HYBRID_RRF_K, HybridSearcher
+from .local_intention_index import LocalIntentionMatcher
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -54,6 +57,9 @@ except Exception as e:
     logger.error(f"Error retrieving secret '{aos_secret}': {str(e)}")
     raise
 
+embedding_cache = EmbeddingCache.from_environ()
+local_intention_matcher = LocalIntentionMatcher(aos_client.client)
+
 DEFAULT_TEXT_FIELD_NAME = "text"
 DEFAULT_VECTOR_FIELD_NAME = "vector_field"
 DEFAULT_SOURCE_FIELD_NAME = "source"
@@ -69,31 +75,72 @@ def remove_redundancy_debug_info(results):
     return filtered_results
 
 
-@timeit
-def get_similarity_embedding(
-    query: str,
+def _embed_query(
+    prompt: str,
     embedding_model_endpoint: str,
     target_model: str,
-    model_type: str = "vector",
-) -> List[List[float]]:
+    model_type: str,
+    normalize: bool = False,
+):
     if model_type.lower() == "bedrock":
         embeddings = BedrockEmbeddings(
             model_id=embedding_model_endpoint,
             region_name=bedrock_region,
-            normalize=True
+            normalize=normalize
         )
-        response = embeddings.embed_query(query)
-    else:
-        query_similarity_embedding_prompt = query
-        response = SagemakerEndpointVectorOrCross(
-            prompt=query_similarity_embedding_prompt,
-            endpoint_name=embedding_model_endpoint,
-            model_type=model_type,
-            stop=None,
-            region_name=None,
-            target_model=target_model,
-        )
-    return response
+        return embeddings.embed_query(prompt)
+    return SagemakerEndpointVectorOrCross(
+        prompt=prompt,
+        endpoint_name=embedding_model_endpoint,
+        model_type=model_type,
+        stop=None,
+        region_name=None,
+        target_model=target_model,
+    )
+
+
+def get_cached_embedding(
+    query: str,
+    embedding_model_endpoint: str,
+    target_model: str,
+    model_type: str,
+    prompt_prefix: str = "",
+    normalize: bool = False,
+):
+    cache_key = EmbeddingCache.make_key(
+        model_type.lower(),
+        embedding_model_endpoint,
+        target_model,
+        prompt_prefix,
+        query,
+        normalize=normalize,
+    )
+    return embedding_cache.get_or_compute(
+        cache_key,
+        lambda: _embed_query(
+            prompt_prefix + query,
+            embedding_model_endpoint,
+            target_model,
+            model_type,
+            normalize=normalize,
+        ),
+    )
+
+
+@timeit
+def get_similarity_embedding(
+    query: str,
+    embedding_model_endpoint: str,
+    target_model: str,
+    model_type: str = "vector",
+) -> List[List[float]]:
+    return get_cached_embedding(
+        query,
+        embedding_model_endpoint,
+        target_model,
+        model_type,
+        normalize=model_type.lower() == "bedrock",
+    )
 
 
 @timeit
@@ -104,36 +151,26 @@ def get_relevance_embedding(
     target_model: str,
     model_type: str = "vector",
 ):
-    if model_type == "bedrock":
-        embeddings = BedrockEmbeddings(
-            model_id=embedding_model_endpoint, region_name=bedrock_region)
-        response = embeddings.embed_query(query)
-    else:
-        if model_type == "vector":
-            if query_lang == "zh":
-                query_relevance_embedding_prompt = (
-                    "为这个句子生成表示以用于检索相关文章：" + query
-                )
-            elif query_lang == "en":
-                query_relevance_embedding_prompt = (
-                    "Represent this sentence for searching relevant passages: " + query
-                )
-            else:
-                query_relevance_embedding_prompt = query
-        elif model_type == "m3" or model_type == "bce":
-            query_relevance_embedding_prompt = query
+    if model_type == "bedrock" or model_type == "m3" or model_type == "bce":
+        query_relevance_embedding_prompt_prefix = ""
+    elif model_type == "vector":
+        if query_lang == "zh":
+            query_relevance_embedding_prompt_prefix = "为这个句子生成表示以用于检索相关文章："
+        elif query_lang == "en":
+            query_relevance_embedding_prompt_prefix = (
+                "Represent this sentence for searching relevant passages: "
+            )
         else:
-            raise ValueError(f"invalid embedding model type: {model_type}")
-        response = SagemakerEndpointVectorOrCross(
-            prompt=query_relevance_embedding_prompt,
-            endpoint_name=embedding_model_endpoint,
-            model_type=model_type,
-            region_name=None,
-            stop=None,
-            target_model=target_model,
-        )
-
-    return response
+            query_relevance_embedding_prompt_prefix = ""
+    else:
+        raise ValueError(f"invalid embedding model type: {model_type}")
+    return get_cached_embedding(
+        query,
+        embedding_model_endpoint,
+        target_model,
+        model_type,
+        prompt_prefix=query_relevance_embedding_prompt_prefix,
+    )
 
 
 def get_filter_list(parsed_query: dict):
@@ -307,70 +344,7 @@ def get_sibling_context(chunk_id, index_name, window_size):
 
 
 def get_context(aos_hit, index_name, window_size):
-    previous_content_list = []
-    next_content_list = []
-    if "chunk_id" not in aos_hit["_source"]["metadata"]:
-        return previous_content_list, next_content_list
-    chunk_id = aos_hit["_source"]["metadata"]["chunk_id"]
-    inner_previous_content_list, inner_next_content_list = get_sibling_context(
-        chunk_id, index_name, window_size
-    )
-    if (
-        len(inner_previous_content_list) == window_size
-        and len(inner_next_content_list) == window_size
-    ):
-        return inner_previous_content_list, inner_next_content_list
-
-    if "heading_hierarchy" not in aos_hit["_source"]["metadata"]:
-        return [previous_content_list, next_content_list]
-    if "previous" in aos_hit["_source"]["metadata"]["heading_hierarchy"]:
-        previous_chunk_id = aos_hit["_source"]["metadata"]["heading_hierarchy"][
-            "previous"
-        ]
-        previous_pos = 0
-        while (
-            previous_chunk_id
-            and previous_chunk_id.startswith("$")
-            and previous_pos < window_size
-        ):
-            opensearch_query_response = aos_client.search(
-                index_name=index_name,
-                query_type="basic",
-                query_term=previous_chunk_id,
-                field="metadata.chunk_id",
-                size=1,
-            )
-            if len(opensearch_query_response["hits"]["hits"]) > 0:
-                r = opensearch_query_response["hits"]["hits"][0]
-                previous_chunk_id = r["_source"]["metadata"]["heading_hierarchy"][
-                    "previous"
-                ]
-                previous_content_list.insert(0, r["_source"]["text"])
-                previous_pos += 1
-            else:
-                break
-    if "next" in aos_hit["_source"]["metadata"]["heading_hierarchy"]:
-        next_chunk_id = aos_hit["_source"]["metadata"]["heading_hierarchy"]["next"]
-        next_pos = 0
-        while (
-            next_chunk_id and next_chunk_id.startswith(
-                "$") and next_pos < window_size
-        ):
-            opensearch_query_response = aos_client.search(
-                index_name=index_name,
-                query_type="basic",
-                query_term=next_chunk_id,
-                field="metadata.chunk_id",
-                size=1,
-            )
-            if len(opensearch_query_response["hits"]["hits"]) > 0:
-                r = opensearch_query_response["hits"]["hits"][0]
-                next_chunk_id = r["_source"]["metadata"]["heading_hierarchy"]["next"]
-                next_content_list.append(r["_source"]["text"])
-                next_pos += 1
-            else:
-                break
-    return [previous_content_list, next_content_list]
+    return ContextExpander(aos_client, index_name, window_size).expand([aos_hit])[0]
 
 
 def get_parent_content(previous_chunk_id, next_chunk_id, index_name):
@@ -478,6 +452,8 @@ class QueryQuestionRetriever(BaseRetriever):
     target_model: str
     model_type: str = "vector"
     enable_debug: bool = False
+    # search a copy of the index held in memory, see LocalIntentionMatcher
+    use_local_index: bool = False
 
     @timeit
     def _get_relevant_documents(
@@ -489,13 +465,19 @@ class QueryQuestionRetriever(BaseRetriever):
         query_repr = get_similarity_embedding(
             query, self.embedding_model_endpoint, self.target_model, self.model_type
         )
-        opensearch_knn_response = aos_client.search(
-            index_name=self.index_name,
-            query_type="knn",
-            query_term=query_repr,
-            field=self.vector_field,
-            size=self.top_k,
-        )
+        opensearch_knn_response = None
+        if self.use_local_index:
+            opensearch_knn_response = local_intention_matcher.search(
+                self.index_name, query_repr, self.vector_field, self.top_k
+            )
+        if opensearch_knn_response is None:
+            opensearch_knn_response = aos_client.search(
+                index_name=self.index_name,
+                query_type="knn",
+                query_term=query_repr,
+                field=self.vector_field,
+                size=self.top_k,
+            )
         opensearch_knn_results.extend(
             organize_faq_results(
                 opensearch_knn_response, self.index_name, self.source_field
@@ -538,22 +520,6 @@ class QueryDocumentKNNRetriever(BaseRetriever):
     enable_debug: bool = False
     lang: str = "zh"
 
-    async def __ainvoke_get_context(self, aos_hit, window_size, loop):
-        return await loop.run_in_executor(
-            None, get_context, aos_hit, self.index_name, window_size
-
-        )
-    async def __spawn_task(self, aos_hits, context_size):
-        loop = asyncio.get_event_loop()
-        task_list = []
-        for aos_hit in aos_hits:
-            if context_size:
-                task = asyncio.create_task(
-                    self.__ainvoke_get_context(aos_hit, context_size, loop)
-                )
-                task_list.append(task)
-        return await asyncio.gather(*task_list)
-
     @timeit
     def organize_results(
         self,
@@ -592,8 +558,9 @@ class QueryDocumentKNNRetriever(BaseRetriever):
                     if doc:
                         result["doc"] = doc
             else:
-                response_list = asyncio.run(
-                    self.__spawn_task(aos_hits, context_size))
+                response_list = ContextExpander(
+                    aos_client, self.index_name, context_size
+                ).expand(aos_hits)
                 for context, result in zip(response_list, results):
                     result["doc"] = "\n".join(
                         context[0] + [result["content"]] + context[1])
@@ -682,22 +649,6 @@ class QueryDocumentBM25Retriever(BaseRetriever):
     enable_debug: Any
     config: Dict = {"run_name": "BM25"}
 
-    async def __ainvoke_get_context(self, aos_hit, window_size, loop):
-        return await loop.run_in_executor(
-            None, get_context, aos_hit, self.index_name, window_size
-        )
-
-    async def __spawn_task(self, aos_hits, context_size):
-        loop = asyncio.get_event_loop()
-        task_list = []
-        for aos_hit in aos_hits:
-            if context_size:
-                task = asyncio.create_task(
-                    self.__ainvoke_get_context(aos_hit, context_size, loop)
-                )
-                task_list.append(task)
-        return await asyncio.gather(*task_list)
-
     @timeit
     def organize_results(
         self,
@@ -755,8 +706,9 @@ class QueryDocumentBM25Retriever(BaseRetriever):
                 if doc:
                     result["doc"] = doc
         else:
-            response_list = asyncio.run(
-                self.__spawn_task(aos_hits, context_size))
+            response_list = ContextExpander(
+                aos_client, self.index_name, context_size
+            ).expand(aos_hits)
             for context, result in zip(response_list, results):
                 result["doc"] = "\n".join(
                     context[0] + [result["doc"]] + context[1])
@@ -831,6 +783,101 @@ class QueryDocumentBM25Retriever(BaseRetriever):
         return doc_list
 
 
+class QueryDocumentHybridRetriever(BaseRetriever):
+    """
+    KNN and BM25 recall of a query document index in one msearch, fused with
+    reciprocal rank fusion before reranking.
+    """
+
+    index_name: str
+    vector_field: str = "vector_field"
+    source_field: str = "file_path"
+    text_field: str = "text"
+    using_whole_doc: bool = False
+    context_num: int = 2
+    top_k: int = 10
+    bm25_top_k: int = 5
+    rrf_k: int = HYBRID_RRF_K
+    model_type: str = "vector"
+    embedding_model_endpoint: Any
+    target_model: Any
+    enable_debug: bool = False
+    lang: str = "zh"
+    config: Dict = {"run_name": "Hybrid"}
+
+    @timeit
+    def _get_relevant_documents(
+        self, question: Dict, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query = question["query"]
+        debug_info = question["debug_info"]
+        query_repr = get_relevance_embedding(
+            query,
+            self.lang,
+            self.embedding_model_endpoint,
+            self.target_model,
+            self.model_type,
+        )
+        filter = get_filter_list(question)
+        expand_context = kb_enabled and not self.using_whole_doc
+        fused_results = HybridSearcher(
+            aos_client, self.index_name, self.context_num, self.rrf_k
+        ).search(
+            query,
+            query_repr,
+            vector_field=self.vector_field,
+            text_field=self.text_field,
+            knn_size=self.top_k,
+            bm25_size=self.bm25_top_k,
+            top_k=self.top_k,
+            filter=filter,
+            expand_context=expand_context,
+        )
+        doc_list = []
+        debug_results = []
+        content_set = set()
+        for fused_result in fused_results:
+            aos_hit = fused_result["hit"]
+            content = aos_hit["_source"][self.text_field]
+            if content in content_set:
+                continue
+            content_set.add(content)
+            source = aos_hit["_source"]["metadata"][self.source_field]
+            doc = content
+            if kb_enabled and self.using_whole_doc:
+                doc = get_doc(source, self.index_name) or content
+            elif expand_context:
+                previous_context, next_context = fused_result["context"]
+                doc = "\n".join(previous_context + [content] + next_context)
+            # knn and bm25 scores are not comparable, keep the score of the
+            # mode the threshold of the score is set for when recalled by both
+            score = fused_result["scores"].get("knn", fused_result["scores"].get("bm25"))
+            result_metadata = {
+                "source": source,
+                "retrieval_content": content,
+                "retrieval_data": {},
+                "retrieval_score": score,
+                "rrf_score": fused_result["rrf_score"],
+                # Set common score for llm.
+                "score": score,
+            }
+            metadata = aos_hit["_source"]["metadata"]
+            if "figure" in metadata:
+                result_metadata["figure"] = metadata["figure"]
+            if "content_type" in metadata:
+                result_metadata["content_type"] = metadata["content_type"]
+            doc_list.append(Document(page_content=doc, metadata=result_metadata))
+            debug_results.append({
+                "source": source,
+                "content": content,
+                "rrf_score": fused_result["rrf_score"],
+                "scores": fused_result["scores"],
+            })
+        if self.enable_debug:
+            debug_info[f"qd-hybrid-recall-{self.index_name}"] = debug_results
+        return doc_list
+
+
 def index_results_format(docs: list, threshold=-1):
     results = []
     for doc in docs:
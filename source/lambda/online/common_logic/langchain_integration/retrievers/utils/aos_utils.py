@@ -1,12 +1,22 @@
+import logging
 import os
 import threading
+import time
 
 import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 
+logger = logging.getLogger("aos_utils")
+logger.setLevel(logging.INFO)
+
 open_search_client_lock = threading.Lock()
 
+INDEX_METADATA_CACHE_TTL = int(os.environ.get("AOS_INDEX_CACHE_TTL", 300))
+INDEX_METADATA_CACHE_NEGATIVE_TTL = int(
+    os.environ.get("AOS_INDEX_CACHE_NEGATIVE_TTL", 30)
+)
+
 credentials = boto3.Session().get_credentials()
 
 region = boto3.Session().region_name
@@ -32,6 +42,58 @@ def _import_not_found_error():
     return NotFoundError
 
 
+class IndexMetadataCache:
+    """
+    Per-process cache of index existence.
+
+    Existing indices are remembered for ``ttl`` seconds, missing ones for
+    ``negative_ttl`` seconds so that newly created indices are picked up
+    quickly.
+    """
+
+    def __init__(
+        self,
+        ttl=INDEX_METADATA_CACHE_TTL,
+        negative_ttl=INDEX_METADATA_CACHE_NEGATIVE_TTL,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, index_name):
+        """
+        :return: (found, exists) for the index
+        """
+        with self._lock:
+            entry = self._entries.get(index_name)
+            if entry is None or entry["expire_at"] < time.monotonic():
+                self.misses += 1
+                return False, False
+            self.hits += 1
+            return True, entry["exists"]
+
+    def put(self, index_name, exists):
+        ttl = self.ttl if exists else self.negative_ttl
+        with self._lock:
+            self._entries[index_name] = {
+                "exists": exists,
+                "expire_at": time.monotonic() + ttl,
+            }
+
+    def invalidate(self, index_name=None):
+        with self._lock:
+            if index_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(index_name, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
 class LLMBotOpenSearchClient:
     instance = None
 
@@ -60,6 +122,7 @@ class LLMBotOpenSearchClient:
             verify_certs=True,
             connection_class=RequestsHttpConnection,
         )
+        self.index_cache = IndexMetadataCache()
         self.query_match = {
             "knn": self._build_knn_search_query,
             "exact": self._build_exactly_match_query,
@@ -67,6 +130,30 @@ class LLMBotOpenSearchClient:
             "basic": self._build_basic_search_query,
         }
 
+    def index_exists(self, index_name):
+        """
+        Check whether the index exists, probing aos only on a cache miss
+
+        :param index_name: Target Index Name
+
+        :return: True if the index exists
+        """
+        found, exists = self.index_cache.get(index_name)
+        if found:
+            return exists
+        exists = self.client.indices.exists(index=index_name)
+        self.index_cache.put(index_name, exists)
+        logger.info(
+            f"Index metadata cache miss for {index_name}, "
+            f"cache stats: {self.index_cache.stats()}"
+        )
+        return exists
+
+    def _mark_index_missing(self, index_name):
+        logger.info(
+            f"Index {index_name} not found during search, invalidating cache")
+        self.index_cache.put(index_name, False)
+
     def _build_basic_search_query(
         self, index_name, query_term, field, size, filter=None
     ):
@@ -109,7 +196,7 @@ class LLMBotOpenSearchClient:
         """
         query = {
             "size": size,
-            "query": {"match": {"text": query_term}},
+            "query": {"bool": {"must": [{"match": {"text": query_term}}]}},
             "_source": {"excludes": ["*.additional_vecs", "vector_field"]},
         }
         if filter:
@@ -205,13 +292,86 @@ class LLMBotOpenSearchClient:
 
         :return: aos response json
         """
-        not_found_error = _import_not_found_error()
-        try:
-            self.client.indices.get(index=index_name)
-        except not_found_error:
+        if not self.index_exists(index_name):
             return []
         query = self.query_match[query_type](
             index_name, query_term, field, size, filter
         )
-        response = self.client.search(body=query, index=index_name)
+        not_found_error = _import_not_found_error()
+        try:
+            response = self.client.search(body=query, index=index_name)
+        except not_found_error:
+            self._mark_index_missing(index_name)
+            return []
         return response
+
+    def msearch(
+        self,
+        index_name,
+        query_type,
+        query_terms,
+        field: str = "text",
+        size: int = 10,
+        filter=None,
+    ):
+        """
+        Perform several searches of the same type on aos in one round trip
+
+        :param index_name: Target Index Name
+        :param query_type: query type
+        :param query_terms: list of query terms, one search per term
+        :param field: search field
+        :param size: number of results to return from aos for each term
+        :param filter: filter query
+
+        :return: list of aos response json, aligned with query_terms
+        """
+        return self.multi_search(
+            index_name,
+            [
+                {
+                    "query_type": query_type,
+                    "query_term": query_term,
+                    "field": field,
+                    "size": size,
+                    "filter": filter,
+                }
+                for query_term in query_terms
+            ],
+        )
+
+    def multi_search(self, index_name, searches):
+        """
+        Perform searches of any type on aos in one round trip
+
+        :param index_name: Target Index Name
+        :param searches: list of dicts with the query_type, query_term, field,
+            size and filter arguments of search
+
+        :return: list of aos response json, aligned with searches
+        """
+        if not searches:
+            return []
+        if not self.index_exists(index_name):
+            return [[] for _ in searches]
+        body = []
+        for search in searches:
+            body.append({})
+            body.append(
+                self.query_match[search["query_type"]](
+                    index_name,
+                    search["query_term"],
+                    search.get("field", "text"),
+                    search.get("size", 10),
+                    search.get("filter"),
+                )
+            )
+        not_found_error = _import_not_found_error()
+        try:
+            response = self.client.msearch(body=body, index=index_name)
+        except not_found_error:
+            self._mark_index_missing(index_name)
+            return [[] for _ in searches]
+        return [
+            [] if "error" in r else r for r in response["responses"]
+        ]
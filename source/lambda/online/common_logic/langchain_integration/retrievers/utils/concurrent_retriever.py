@@ -0,0 +1,90 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Dict, List
+
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.docstore.document import Document
+from langchain.schema.retriever import BaseRetriever
+
+logger = logging.getLogger("concurrent_retriever")
+logger.setLevel(logging.INFO)
+
+RETRIEVER_MAX_WORKERS = int(os.environ.get("RETRIEVER_MAX_WORKERS", 8))
+RETRIEVER_TIMEOUT = float(os.environ.get("RETRIEVER_TIMEOUT", 10))
+
+# Shared by all invocations in a warm container so that threads are reused.
+retriever_executor = ThreadPoolExecutor(
+    max_workers=max(RETRIEVER_MAX_WORKERS, 1),
+    thread_name_prefix="retriever",
+)
+
+
+class ConcurrentMergerRetriever(BaseRetriever):
+    """
+    Drop-in replacement of MergerRetriever that dispatches all retrievers at
+    once on a bounded thread pool. Each retriever has its own timeout; a
+    retriever that fails or times out is skipped and the results of the
+    others are merged in the same interleaved order as MergerRetriever.
+
+    A timed out retriever can not be interrupted: it keeps its pool worker
+    busy until it returns, so RETRIEVER_MAX_WORKERS bounds the number of
+    slow retrievers that can pile up in a warm container.
+    """
+
+    retrievers: List[BaseRetriever]
+    timeouts: List[float] = []
+
+    def _get_timeout(self, i):
+        if i < len(self.timeouts) and self.timeouts[i]:
+            return self.timeouts[i]
+        return RETRIEVER_TIMEOUT
+
+    def _get_relevant_documents(
+        self, query: Dict, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        start_time = time.perf_counter()
+        futures = [
+            retriever_executor.submit(
+                retriever.invoke,
+                query,
+                config={
+                    "callbacks": run_manager.get_child(f"retriever_{i + 1}")
+                },
+            )
+            for i, retriever in enumerate(self.retrievers)
+        ]
+
+        retriever_docs = []
+        errors = []
+        for i, future in enumerate(futures):
+            retriever_name = self.retrievers[i].__class__.__name__
+            remaining = self._get_timeout(i) - (time.perf_counter() - start_time)
+            try:
+                retriever_docs.append(future.result(timeout=max(remaining, 0)))
+            except TimeoutError as e:
+                # only drops a retriever that has not started yet, a running
+                # one holds its worker until it returns
+                future.cancel()
+                logger.warning(
+                    f"{retriever_name} timed out after {self._get_timeout(i)}s, skipped"
+                )
+                errors.append(e)
+            except Exception as e:
+                logger.error(f"{retriever_name} failed, skipped: {e}")
+                errors.append(e)
+        logger.info(
+            f"{len(self.retrievers)} retrievers finished in "
+            f"{time.perf_counter() - start_time:.4f}s, {len(errors)} skipped"
+        )
+        if errors and not retriever_docs:
+            raise errors[0]
+
+        merged_documents = []
+        max_docs = max(map(len, retriever_docs), default=0)
+        for i in range(max_docs):
+            for docs in retriever_docs:
+                if i < len(docs):
+                    merged_documents.append(docs[i])
+        return merged_documents
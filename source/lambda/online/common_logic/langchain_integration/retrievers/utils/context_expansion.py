@@ -0,0 +1,170 @@
+import logging
+
+logger = logging.getLogger("context_expansion")
+logger.setLevel(logging.INFO)
+
+CHUNK_ID_FIELD = "metadata.chunk_id"
+
+
+class ContextExpander:
+    """
+    Expand retrieved chunks with their neighbouring chunks.
+
+    All neighbour chunk ids that can be derived from the hits themselves
+    (the ``-N`` section suffix and the first ``heading_hierarchy`` link on
+    each side) are resolved together in one msearch round trip. Heading
+    chain links that are only known after a chunk has been fetched are
+    resolved hop by hop, still batched across all hits.
+    """
+
+    def __init__(self, aos_client, index_name, window_size):
+        self.aos_client = aos_client
+        self.index_name = index_name
+        self.window_size = window_size
+        self.round_trips = 0
+        self._chunks = {}
+
+    def _fetch(self, chunk_ids):
+        chunk_ids = [
+            chunk_id for chunk_id in dict.fromkeys(chunk_ids)
+            if chunk_id not in self._chunks
+        ]
+        if not chunk_ids:
+            return
+        responses = self.aos_client.msearch(
+            index_name=self.index_name,
+            query_type="basic",
+            query_terms=chunk_ids,
+            field=CHUNK_ID_FIELD,
+            size=1,
+        )
+        self.round_trips += 1
+        for chunk_id, response in zip(chunk_ids, responses):
+            hits = response["hits"]["hits"] if response else []
+            self._chunks[chunk_id] = hits[0] if hits else None
+
+    def _sibling_ids(self, chunk_id):
+        chunk_id_prefix = "-".join(chunk_id.split("-")[:-1])
+        section_id = int(chunk_id.split("-")[-1])
+        previous_ids = [
+            f"{chunk_id_prefix}-{i}"
+            for i in range(section_id - 1, max(section_id - self.window_size, 1) - 1, -1)
+        ]
+        next_ids = [
+            f"{chunk_id_prefix}-{i}"
+            for i in range(section_id + 1, section_id + self.window_size + 1)
+        ]
+        return previous_ids, next_ids
+
+    def _walk_siblings(self, chunk_ids):
+        content_list = []
+        for chunk_id in chunk_ids:
+            hit = self._chunks.get(chunk_id)
+            if hit is None:
+                break
+            content_list.insert(0, hit["_source"]["text"])
+        return content_list
+
+    @staticmethod
+    def _is_chain_link(chunk_id):
+        return bool(chunk_id) and chunk_id.startswith("$")
+
+    def _walk_heading_chains(self, chains):
+        """
+        Follow heading_hierarchy links for every chain until each one is
+        exhausted or reaches the window size. A chain is a dict holding the
+        next chunk id to visit, the link direction and the content list.
+        """
+        pending = chains
+        while pending:
+            self._fetch(
+                chain["chunk_id"] for chain in pending
+                if self._is_chain_link(chain["chunk_id"])
+                and chain["chunk_id"] not in self._chunks
+            )
+            next_pending = []
+            for chain in pending:
+                while (
+                    self._is_chain_link(chain["chunk_id"])
+                    and len(chain["content_list"]) < self.window_size
+                ):
+                    if chain["chunk_id"] not in self._chunks:
+                        next_pending.append(chain)
+                        break
+                    hit = self._chunks[chain["chunk_id"]]
+                    if hit is None:
+                        break
+                    chain["chunk_id"] = (
+                        hit["_source"]["metadata"]
+                        .get("heading_hierarchy", {})
+                        .get(chain["direction"])
+                    )
+                    if chain["direction"] == "previous":
+                        chain["content_list"].insert(0, hit["_source"]["text"])
+                    else:
+                        chain["content_list"].append(hit["_source"]["text"])
+            pending = next_pending
+
+    def expand(self, aos_hits):
+        """
+        Get the previous and next context of each hit
+
+        :param aos_hits: hits from an aos search response
+
+        :return: list of [previous_content_list, next_content_list], aligned
+            with aos_hits
+        """
+        contexts = [[[], []] for _ in aos_hits]
+        if not self.window_size:
+            return contexts
+
+        plans = []
+        candidate_ids = []
+        for aos_hit in aos_hits:
+            metadata = aos_hit["_source"]["metadata"]
+            if "chunk_id" not in metadata:
+                plans.append(None)
+                continue
+            previous_ids, next_ids = self._sibling_ids(metadata["chunk_id"])
+            heading_hierarchy = metadata.get("heading_hierarchy")
+            candidate_ids.extend(previous_ids)
+            candidate_ids.extend(next_ids)
+            if heading_hierarchy:
+                for direction in ("previous", "next"):
+                    if self._is_chain_link(heading_hierarchy.get(direction)):
+                        candidate_ids.append(heading_hierarchy[direction])
+            plans.append((previous_ids, next_ids, heading_hierarchy))
+        self._fetch(candidate_ids)
+
+        chains = []
+        for context, plan in zip(contexts, plans):
+            if plan is None:
+                continue
+            previous_ids, next_ids, heading_hierarchy = plan
+            previous_content_list = self._walk_siblings(previous_ids)
+            next_content_list = self._walk_siblings(next_ids)
+            if (
+                len(previous_content_list) == self.window_size
+                and len(next_content_list) == self.window_size
+            ):
+                context[0] = previous_content_list
+                context[1] = next_content_list
+                continue
+            if heading_hierarchy is None:
+                continue
+            for pos, direction in enumerate(("previous", "next")):
+                # the first and last chunks of a document link to None
+                if self._is_chain_link(heading_hierarchy.get(direction)):
+                    chains.append(
+                        {
+                            "chunk_id": heading_hierarchy[direction],
+                            "direction": direction,
+                            "content_list": context[pos],
+                        }
+                    )
+        self._walk_heading_chains(chains)
+        logger.info(
+            f"Expanded context of {len(aos_hits)} hits from {self.index_name} "
+            f"in {self.round_trips} round trips"
+        )
+        return contexts
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from common_logic.common_utils.python_utils import LRUCache
+
+logger = logging.getLogger("embedding_cache")
+logger.setLevel(logging.INFO)
+
+
+class EmbeddingCacheBackend(ABC):
+    """
+    Interface of the optional persistent layer behind EmbeddingCache, so
+    that embeddings can outlive a single Lambda container.
+    """
+
+    @abstractmethod
+    def get(self, key: str):
+        """Return the cached embedding, None on a miss"""
+
+    @abstractmethod
+    def put(self, key: str, embedding):
+        """Store the embedding under key"""
+
+
+class LocalFileEmbeddingCacheBackend(EmbeddingCacheBackend):
+    """Store each embedding as a json file under cache_dir."""
+
+    def __init__(self, cache_dir="/tmp/embedding_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, embedding):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(embedding, f)
+        os.replace(tmp_path, path)
+
+
+class DynamoDBEmbeddingCacheBackend(EmbeddingCacheBackend):
+    """
+    Store embeddings in a DynamoDB table whose partition key is
+    ``cacheKey``. Items expire through the table TTL on ``expireAt``.
+    """
+
+    def __init__(self, table_name, ttl=7 * 24 * 3600):
+        import boto3
+
+        self.table = boto3.resource("dynamodb").Table(table_name)
+        self.ttl = ttl
+
+    def get(self, key):
+        response = self.table.get_item(Key={"cacheKey": key})
+        item = response.get("Item")
+        if not item:
+            return None
+        return json.loads(item["embedding"])
+
+    def put(self, key, embedding):
+        self.table.put_item(
+            Item={
+                "cacheKey": key,
+                "embedding": json.dumps(embedding),
+                "expireAt": int(time.time()) + self.ttl,
+            }
+        )
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings kept in the warm container, with
+    an optional persistent backend consulted on local misses. Concurrent
+    lookups of the same key wait for a single endpoint call.
+    """
+
+    def __init__(self, max_size=256, backend: EmbeddingCacheBackend = None):
+        self.max_size = max_size
+        self.backend = backend
+        # hits of the backend count as hits, so they are counted here
+        self.hits = 0
+        self.misses = 0
+        self._entries = LRUCache(max_size)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @classmethod
+    def from_environ(cls):
+        backend_type = os.environ.get("EMBEDDING_CACHE_BACKEND", "").lower()
+        backend = None
+        try:
+            if backend_type == "local":
+                backend = LocalFileEmbeddingCacheBackend(
+                    os.environ.get("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache")
+                )
+            elif backend_type == "dynamodb":
+                backend = DynamoDBEmbeddingCacheBackend(
+                    os.environ["EMBEDDING_CACHE_TABLE"],
+                    int(os.environ.get("EMBEDDING_CACHE_TTL", 7 * 24 * 3600)),
+                )
+        except Exception as e:
+            logger.error(f"Failed to init {backend_type} embedding cache backend: {e}")
+        return cls(
+            max_size=int(os.environ.get("EMBEDDING_CACHE_SIZE", 256)),
+            backend=backend,
+        )
+
+    @staticmethod
+    def make_key(
+        model_type, model_id, target_model, prompt_prefix, text, normalize=False
+    ):
+        raw_key = json.dumps(
+            [model_type, model_id, target_model, prompt_prefix, normalize, text],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def _get_backend(self, key):
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Embedding cache backend get failed: {e}")
+            return None
+
+    def _put_backend(self, key, embedding):
+        if self.backend is None:
+            return
+        try:
+            self.backend.put(key, embedding)
+        except Exception as e:
+            logger.error(f"Embedding cache backend put failed: {e}")
+
+    def get_or_compute(self, key, compute_fn):
+        """
+        Return the cached embedding for key, calling compute_fn at most once
+        across concurrent callers on a miss.
+        """
+        embedding = self._entries.get(key)
+        if embedding is not None:
+            self.hits += 1
+            return embedding
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                embedding = self._entries.get(key)
+                if embedding is None:
+                    embedding = self._get_backend(key)
+                    if embedding is None:
+                        self.misses += 1
+                        embedding = compute_fn()
+                        self._put_backend(key, embedding)
+                    else:
+                        self.hits += 1
+                    self._entries.put(key, embedding)
+                else:
+                    self.hits += 1
+        finally:
+            # also when compute_fn failed, e.g. on endpoint throttling
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return embedding
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+
+from .context_expansion import ContextExpander
+
+logger = logging.getLogger("hybrid_search")
+logger.setLevel(logging.INFO)
+
+# rank constant of reciprocal rank fusion, 60 as in the original paper
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", 60))
+
+KNN = "knn"
+BM25 = "bm25"
+
+
+def _hit_key(aos_hit):
+    if "_id" in aos_hit:
+        return aos_hit["_id"]
+    return json.dumps(aos_hit["_source"].get("metadata", {}), sort_keys=True, default=str)
+
+
+def reciprocal_rank_fusion(ranked_hit_lists, rrf_k=HYBRID_RRF_K):
+    """
+    Fuse ranked lists of aos hits, a hit scores sum(1 / (rrf_k + rank)) over
+    the lists it appears in. Ties keep the order in which hits were first seen.
+
+    :param ranked_hit_lists: dict of mode name to hits, best first
+    :param rrf_k: rank constant
+
+    :return: list of (hit, rrf score, {mode: aos score}), best first
+    """
+    fused = {}
+    for mode, hits in ranked_hit_lists.items():
+        for rank, aos_hit in enumerate(hits, start=1):
+            key = _hit_key(aos_hit)
+            if key not in fused:
+                fused[key] = [aos_hit, 0.0, {}]
+            fused[key][1] += 1.0 / (rrf_k + rank)
+            fused[key][2][mode] = aos_hit["_score"]
+    return sorted(
+        (tuple(entry) for entry in fused.values()),
+        key=lambda entry: entry[1],
+        reverse=True,
+    )
+
+
+class HybridSearcher:
+    """
+    Run the knn and bm25 searches of a query in one msearch round trip and
+    fuse the results with reciprocal rank fusion. Context expansion is done
+    once, on the fused top k.
+    """
+
+    def __init__(self, aos_client, index_name, context_num=0, rrf_k=HYBRID_RRF_K):
+        self.aos_client = aos_client
+        self.index_name = index_name
+        self.context_num = context_num
+        self.rrf_k = rrf_k
+
+    def search(
+        self,
+        query,
+        query_vector,
+        vector_field="vector_field",
+        text_field="text",
+        knn_size=10,
+        bm25_size=5,
+        top_k=10,
+        filter=None,
+        expand_context=True,
+    ):
+        """
+        :return: list of dicts with the aos hit, its rrf score, its score in
+            each mode it was recalled by and its (previous, next) context
+        """
+        responses = self.aos_client.multi_search(
+            self.index_name,
+            [
+                {
+                    "query_type": "knn",
+                    "query_term": query_vector,
+                    "field": vector_field,
+                    "size": knn_size,
+                    "filter": filter,
+                },
+                {
+                    "query_type": "fuzzy",
+                    "query_term": query,
+                    "field": text_field,
+                    "size": bm25_size,
+                    "filter": filter,
+                },
+            ],
+        )
+        ranked_hit_lists = {
+            mode: response["hits"]["hits"] if response else []
+            for mode, response in zip([KNN, BM25], responses)
+        }
+        fused = reciprocal_rank_fusion(ranked_hit_lists, self.rrf_k)[:top_k]
+        logger.info(
+            f"hybrid search on {self.index_name}: "
+            f"{len(ranked_hit_lists[KNN])} knn hits, "
+            f"{len(ranked_hit_lists[BM25])} bm25 hits, {len(fused)} fused"
+        )
+
+        contexts = [([], [])] * len(fused)
+        if expand_context and fused:
+            contexts = ContextExpander(
+                self.aos_client, self.index_name, self.context_num
+            ).expand([aos_hit for aos_hit, _, _ in fused])
+        return [
+            {
+                "hit": aos_hit,
+                "rrf_score": rrf_score,
+                "scores": scores,
+                "context": context,
+            }
+            for (aos_hit, rrf_score, scores), context in zip(fused, contexts)
+        ]
@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger("local_intention_index")
+logger.setLevel(logging.INFO)
+
+INTENTION_LOCAL_INDEX_ENABLED = os.environ.get(
+    "INTENTION_LOCAL_INDEX_ENABLED", "false").lower() == "true"
+# index.max_result_window of aos, the most documents one search returns
+AOS_MAX_RESULT_WINDOW = 10000
+# larger indexes are searched on aos, at most AOS_MAX_RESULT_WINDOW - 1 as
+# one more document is read to detect them
+INTENTION_LOCAL_INDEX_MAX_SIZE = int(
+    os.environ.get("INTENTION_LOCAL_INDEX_MAX_SIZE", AOS_MAX_RESULT_WINDOW - 1))
+INTENTION_LOCAL_INDEX_TTL = int(os.environ.get("INTENTION_LOCAL_INDEX_TTL", 300))
+INTENTION_LOCAL_INDEX_VERSION_CHECK_INTERVAL = int(
+    os.environ.get("INTENTION_LOCAL_INDEX_VERSION_CHECK_INTERVAL", 10)
+)
+# key of the index mapping _meta the intention lambda bumps on every change
+INTENTION_VERSION_META_KEY = "intention_version"
+
+
+def knn_scores(space_type, dot_products, vector_norms, query_norm):
+    """Scores of the aos knn query for a space type, so thresholds tuned on
+    aos results still apply"""
+    if space_type == "innerproduct":
+        return np.where(dot_products >= 0, dot_products + 1, 1 / (1 - dot_products))
+    if space_type == "cosinesimil":
+        cosine = dot_products / np.maximum(vector_norms * query_norm, 1e-12)
+        return (1 + cosine) / 2
+    # l2
+    squared_distances = np.maximum(
+        vector_norms ** 2 + query_norm ** 2 - 2 * dot_products, 0)
+    return 1 / (1 + squared_distances)
+
+
+class LocalIntentionIndex:
+    """Vectors of an intention index held as one contiguous float32 matrix"""
+
+    def __init__(self, vectors, sources, space_type="l2", version=None):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.vector_norms = np.linalg.norm(self.vectors, axis=1)
+        self.sources = sources
+        self.space_type = space_type
+        self.version = version
+
+    def __len__(self):
+        return len(self.sources)
+
+    def search(self, query_vector, top_k):
+        """
+        :return: aos like search response, best hits first
+        """
+        if not self.sources:
+            return {"hits": {"hits": []}}
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = knn_scores(
+            self.space_type,
+            self.vectors @ query,
+            self.vector_norms,
+            np.linalg.norm(query),
+        )
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return {
+            "hits": {
+                "hits": [
+                    {"_score": float(scores[i]), "_source": self.sources[i]}
+                    for i in top
+                ]
+            }
+        }
+
+
+class LocalIntentionMatcher:
+    """
+    Search intention indexes in memory. An index is loaded once per
+    container, revalidated against the version in its mapping _meta every
+    INTENTION_LOCAL_INDEX_VERSION_CHECK_INTERVAL seconds and reloaded at the
+    latest after INTENTION_LOCAL_INDEX_TTL seconds. An index which failed
+    to load is searched on aos until the TTL expires.
+    """
+
+    def __init__(
+        self,
+        aos_client,
+        max_size=INTENTION_LOCAL_INDEX_MAX_SIZE,
+        ttl=INTENTION_LOCAL_INDEX_TTL,
+        version_check_interval=INTENTION_LOCAL_INDEX_VERSION_CHECK_INTERVAL,
+    ):
+        self.aos_client = aos_client
+        self.max_size = min(max_size, AOS_MAX_RESULT_WINDOW - 1)
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, index_name=None):
+        with self._lock:
+            if index_name is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(index_name, None)
+
+    def _get_mappings(self, index_name):
+        response = self.aos_client.indices.get_mapping(index=index_name)
+        # keyed by the concrete index name, which differs for an alias
+        index_info = response.get(index_name) or next(iter(response.values()), {})
+        return index_info.get("mappings", {})
+
+    def _get_version(self, index_name):
+        return self._get_mappings(index_name).get("_meta", {}).get(
+            INTENTION_VERSION_META_KEY)
+
+    def _load(self, index_name, vector_field):
+        mappings = self._get_mappings(index_name)
+        version = mappings.get("_meta", {}).get(INTENTION_VERSION_META_KEY)
+        vector_mapping = mappings.get("properties", {}).get(vector_field, {})
+        space_type = vector_mapping.get("method", {}).get("space_type", "l2")
+        response = self.aos_client.search(
+            index=index_name,
+            body={
+                "size": self.max_size + 1,
+                "query": {"match_all": {}},
+                "_source": {"excludes": ["*.additional_vecs"]},
+            },
+        )
+        hits = response["hits"]["hits"]
+        if len(hits) > self.max_size:
+            logger.info(
+                f"intention index {index_name} has more than {self.max_size} "
+                "documents, searching it on aos"
+            )
+            return None, version
+        vectors = []
+        sources = []
+        for hit in hits:
+            source = dict(hit["_source"])
+            vector = source.pop(vector_field, None)
+            if vector is None:
+                continue
+            vectors.append(vector)
+            sources.append(source)
+        dimension = len(vectors[0]) if vectors else 0
+        index = LocalIntentionIndex(
+            np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dimension),
+            sources,
+            space_type=space_type,
+            version=version,
+        )
+        logger.info(
+            f"loaded intention index {index_name}: {len(index)} vectors, "
+            f"version {version}"
+        )
+        return index, version
+
+    def get_index(self, index_name, vector_field):
+        """
+        :return: the local index, None if the index is too large to be
+            searched locally
+        """
+        now = time.monotonic()
+        entry = self._indexes.get(index_name)
+        if entry is not None and now < entry["expire_at"]:
+            if entry["failed"]:
+                return None
+            if now - entry["checked_at"] < self.version_check_interval:
+                return entry["index"]
+            if self._get_version(index_name) == entry["version"]:
+                entry["checked_at"] = now
+                return entry["index"]
+            logger.info(f"intention index {index_name} changed, reloading")
+
+        failed = False
+        try:
+            index, version = self._load(index_name, vector_field)
+        except Exception as e:
+            logger.warning(
+                f"failed to load intention index {index_name}, searching it "
+                f"on aos for {self.ttl}s: {e}"
+            )
+            index, version, failed = None, None, True
+        with self._lock:
+            self._indexes[index_name] = {
+                "index": index,
+                "version": version,
+                "failed": failed,
+                "checked_at": now,
+                "expire_at": now + self.ttl,
+            }
+        return index
+
+    def search(self, index_name, query_vector, vector_field, top_k):
+        """
+        :return: aos like knn search response, None if the index has to be
+            searched on aos
+        """
+        try:
+            index = self.get_index(index_name, vector_field)
+        except Exception as e:
+            logger.warning(f"local intention index {index_name} unavailable: {e}")
+            return None
+        if index is None:
+            return None
+        return index.search(query_vector, top_k)
@@ -1,10 +1,14 @@
+from sm_invoker import sm_invoker
 from sm_utils import SagemakerEndpointVectorOrCross
 from langchain.retrievers.document_compressors.base import BaseDocumentCompressor
 from langchain.schema import Document
 from langchain.callbacks.manager import Callbacks
 from typing import Dict, Optional, Sequence, Any
+from common_logic.common_utils.python_utils import LRUCache, make_cache_key
+import hashlib
 import json
 import os
+import threading
 import time
 import logging
 import asyncio
@@ -14,6 +18,51 @@ logger.setLevel(logging.INFO)
 
 
 rerank_model_endpoint = os.environ.get("RERANK_ENDPOINT", "")
+# documents scored together by BGEM3Reranker, caps the padded tensor size
+COLBERT_SCORE_BATCH_SIZE = int(os.environ.get("COLBERT_SCORE_BATCH_SIZE", 16))
+RERANK_SCORE_CACHE_SIZE = int(os.environ.get("RERANK_SCORE_CACHE_SIZE", 4096))
+
+# scores shared by the rerankers of all the tools in a turn and across warm
+# invocations, keyed by (endpoint, target model, query hash, doc hash)
+rerank_score_cache = LRUCache(RERANK_SCORE_CACHE_SIZE)
+
+
+class RerankPairMetrics:
+    """Pairs the rerankers were asked to score versus pairs sent to the endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requested = 0
+            self.duplicated = 0
+            self.cached = 0
+            self.sent = 0
+
+    def add(self, requested, duplicated, cached, sent):
+        with self._lock:
+            self.requested += requested
+            self.duplicated += duplicated
+            self.cached += cached
+            self.sent += sent
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "requested": self.requested,
+                "duplicated": self.duplicated,
+                "cached": self.cached,
+                "sent": self.sent,
+            }
+
+
+rerank_pair_metrics = RerankPairMetrics()
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 """Document compressor that uses BGE reranker model."""
 
@@ -22,28 +71,41 @@ class BGEM3Reranker(BaseDocumentCompressor):
 
     """Number of documents to return."""
 
-    def _colbert_score_np(self, q_reps, p_reps):
-        token_scores = np.einsum('nik,njk->nij', q_reps, p_reps)
-        scores = token_scores.max(-1)
-        scores = np.sum(scores) / q_reps.shape[0]
-        return scores
+    score_batch_size: int = COLBERT_SCORE_BATCH_SIZE
 
-    async def __ainvoke_rerank_model(self, query_batch, doc_batch, loop):
-        return await loop.run_in_executor(None,
-                                          self._colbert_score_np,
-                                          np.asarray(query_batch),
-                                          np.asarray(doc_batch))
+    def _colbert_scores(self, q_reps, p_reps_list):
+        """
+        Max-sim scores of a query against documents, documents are scored
+        score_batch_size at a time as one padded float32 tensor.
 
-    async def __spawn_task(self, query_colbert_list, doc_colbert_list):
-        batch_size = 1
-        task_list = []
-        loop = asyncio.get_event_loop()
-        for batch_start in range(0, len(query_colbert_list), batch_size):
-            task = asyncio.create_task(self.__ainvoke_rerank_model(
-                query_colbert_list[batch_start:batch_start + batch_size],
-                doc_colbert_list[batch_start:batch_start + batch_size], loop))
-            task_list.append(task)
-        return await asyncio.gather(*task_list)
+        Args:
+            q_reps: query token vectors
+            p_reps_list: token vectors of each document
+
+        Returns:
+            a list with the score of each document
+        """
+        q = np.asarray(q_reps, dtype=np.float32)
+        scores = [0.0] * len(p_reps_list)
+        # batch documents of similar length together to limit padding
+        order = sorted(range(len(p_reps_list)),
+                       key=lambda i: len(p_reps_list[i]))
+        order = [i for i in order if len(p_reps_list[i]) > 0]
+        for batch_start in range(0, len(order), self.score_batch_size):
+            batch = order[batch_start:batch_start + self.score_batch_size]
+            max_len = len(p_reps_list[batch[-1]])
+            p = np.zeros((len(batch), max_len, q.shape[-1]), dtype=np.float32)
+            mask = np.zeros((len(batch), max_len), dtype=bool)
+            for j, i in enumerate(batch):
+                p[j, :len(p_reps_list[i])] = p_reps_list[i]
+                mask[j, :len(p_reps_list[i])] = True
+            # (batch, doc tokens, query tokens)
+            token_scores = np.matmul(p, q.T)
+            token_scores[~mask] = -np.inf
+            batch_scores = token_scores.max(axis=1).sum(axis=-1)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+        return scores
 
     def compress_documents(
         self,
@@ -69,16 +131,11 @@ class BGEM3Reranker(BaseDocumentCompressor):
         _docs = [d.metadata["retrieval_data"]['colbert'] for d in doc_list]
 
         rerank_text_length = 1024 * 10
-        query_colbert_list = []
-        doc_colbert_list = []
-        for doc in _docs:
-            query_colbert_list.append(query["colbert"][:rerank_text_length])
-            doc_colbert_list.append(doc[:rerank_text_length])
-        score_list = []
+        doc_colbert_list = [doc[:rerank_text_length] for doc in _docs]
         logger.info(
-            f'rerank pair num {len(query_colbert_list)}, m3 method: colbert score')
-        score_list = asyncio.run(self.__spawn_task(
-            query_colbert_list, doc_colbert_list))
+            f'rerank pair num {len(doc_colbert_list)}, m3 method: colbert score')
+        score_list = self._colbert_scores(
+            query["colbert"][:rerank_text_length], doc_colbert_list)
         final_results = []
         debug_info = query["debug_info"]
         debug_info["knowledge_qa_rerank"] = []
@@ -106,8 +163,8 @@ class BGEReranker(BaseDocumentCompressor):
 
     """Number of documents to return."""
     config: Dict = {"run_name": "BGEReranker"}
-    enable_debug: Any
-    target_model: Any
+    enable_debug: Any = False
+    target_model: Any = None
     rerank_model_endpoint: str = rerank_model_endpoint
     top_k: int = 10
 
@@ -118,6 +175,10 @@ class BGEReranker(BaseDocumentCompressor):
         self.target_model = target_model
         self.top_k = top_k
 
+    def _score_cache_key(self, query_hash, doc_hash):
+        return make_cache_key(
+            self.rerank_model_endpoint, self.target_model, query_hash, doc_hash)
+
     async def __ainvoke_rerank_model(self, batch, loop):
         logging.info("invoke endpoint")
         return await loop.run_in_executor(None,
@@ -159,19 +220,57 @@ class BGEReranker(BaseDocumentCompressor):
         start = time.time()
         if len(documents) == 0:  # to avoid empty api call
             return []
-        doc_list = list(documents)
-        _docs = [d.metadata["retrieval_content"] for d in doc_list]
-
-        rerank_pair = []
         rerank_text_length = 1024 * 10
-        for doc in _docs:
-            rerank_pair.append([query["query"], doc[:rerank_text_length]])
-        score_list = []
+        # the same chunk is often recalled by several retrievers, e.g. knn and bm25
+        doc_list = []
+        doc_hashes = []
+        candidate_keys = set()
+        for doc in documents:
+            doc_hash = _text_hash(doc.metadata["retrieval_content"][:rerank_text_length])
+            candidate_key = (doc.metadata.get("source"), doc_hash)
+            if candidate_key in candidate_keys:
+                continue
+            candidate_keys.add(candidate_key)
+            doc_list.append(doc)
+            doc_hashes.append(doc_hash)
+
+        query_hash = _text_hash(query["query"])
+        scores = {}
+        rerank_pair = []
+        pair_hashes = []
+        pair_hashes_set = set()
+        for doc, doc_hash in zip(doc_list, doc_hashes):
+            if doc_hash in scores or doc_hash in pair_hashes_set:
+                continue
+            score = rerank_score_cache.get(self._score_cache_key(query_hash, doc_hash))
+            if score is not None:
+                scores[doc_hash] = score
+                continue
+            rerank_pair.append(
+                [query["query"], doc.metadata["retrieval_content"][:rerank_text_length]])
+            pair_hashes.append(doc_hash)
+            pair_hashes_set.add(doc_hash)
+        rerank_pair_metrics.add(
+            requested=len(documents),
+            duplicated=len(documents) - len(scores) - len(rerank_pair),
+            cached=len(scores),
+            sent=len(rerank_pair),
+        )
         logger.info(
-            f'rerank pair num {len(rerank_pair)}, endpoint_name: {self.rerank_model_endpoint}')
-        response_list = asyncio.run(self.__spawn_task(rerank_pair))
-        for response in response_list:
-            score_list.extend(json.loads(response))
+            f'rerank pair num {len(rerank_pair)} of {len(documents)} requested, '
+            f'endpoint_name: {self.rerank_model_endpoint}')
+        if rerank_pair:
+            response_list = asyncio.run(self.__spawn_task(rerank_pair))
+            logger.info(
+                f"rerank endpoint metrics: {sm_invoker.metrics().get(self.rerank_model_endpoint)}")
+            sent_scores = []
+            for response in response_list:
+                sent_scores.extend(json.loads(response))
+            for doc_hash, score in zip(pair_hashes, sent_scores):
+                scores[doc_hash] = score
+                rerank_score_cache.put(self._score_cache_key(query_hash, doc_hash), score)
+        logger.info(f"rerank pair metrics: {rerank_pair_metrics.to_dict()}")
+        score_list = [scores[doc_hash] for doc_hash in doc_hashes]
         final_results = []
         debug_info = query["debug_info"]
         debug_info["knowledge_qa_rerank"] = []
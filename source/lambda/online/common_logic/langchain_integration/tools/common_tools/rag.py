@@ -8,6 +8,7 @@ from common_logic.common_utils.lambda_invoke_utils import send_trace
 from common_logic.langchain_integration.retrievers.retriever import lambda_handler as retrieve_fn
 from common_logic.langchain_integration.chains import LLMChain
 from common_logic.common_utils.monitor_utils import format_rag_data
+from common_logic.common_utils.reference_utils import ReferenceTagParser
 from typing import Iterable
 import logging
 
@@ -25,40 +26,10 @@ def filter_response(res: Iterable, state: dict):
     Returns:
         Generator yielding filtered response
     """
-    buffer = ""
-    references = []
-    tag_start = "<reference>"
-    tag_end = "</reference>"
-
-    for char in res:
-        if not buffer and char not in ["<", "<reference"]:
-            yield char
-            continue
-
-        buffer += char
-
-        # Check the string starts with <reference>
-        if buffer == tag_start[:len(buffer)]:
-            continue
-        elif buffer.startswith(tag_start):
-            if buffer.endswith(tag_end):
-                # Get reference document number after finding </reference>
-                ref_content = buffer[len(tag_start):-len(tag_end)]
-                try:
-                    ref_num = int(ref_content)
-                    references.append(ref_num)
-                except ValueError:
-                    logger.error(f"Invalid reference number: {ref_content}")
-                buffer = ""
-            continue
-        else:
-            # Move next
-            yield buffer[0]
-            buffer = buffer[1:]
-
-    if buffer:
-        yield buffer
+    parser = ReferenceTagParser()
+    yield from parser.filter(res)
 
+    references = parser.references
     if references:
         state["extra_response"]["references"] = references
         all_docs = state["extra_response"]["docs"]
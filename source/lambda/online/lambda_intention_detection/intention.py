@@ -5,6 +5,9 @@ import os
 from common_logic.common_utils.logger_utils import get_logger
 from common_logic.common_utils.lambda_invoke_utils import chatbot_lambda_call_wrapper, invoke_lambda
 from common_logic.langchain_integration.retrievers.retriever import lambda_handler as retrieve_fn
+from common_logic.langchain_integration.retrievers.utils.local_intention_index import (
+    INTENTION_LOCAL_INDEX_ENABLED,
+)
 
 logger = get_logger("intention")
 kb_enabled = os.environ["KNOWLEDGE_BASE_ENABLED"].lower() == "true"
@@ -28,6 +31,12 @@ def get_intention_results(query: str, intention_config: dict, intent_threshold:
         "type": "qq",
         **intention_config
     }
+    if INTENTION_LOCAL_INDEX_ENABLED:
+        # intention examples are few and change rarely, match them in memory
+        event_body["retrievers"] = [
+            {**retriever, "use_local_index": True}
+            for retriever in intention_config.get("retrievers", [])
+        ]
 
     # call retriver
     # res:list[dict] = invoke_lambda(
@@ -67,6 +67,15 @@ def get_secret_value(secret_arn: str):
             raise Exception("Fail to retrieve the secret value")
 
 
+def get_max_rounds_in_memory(event_body: dict):
+    """Rounds of chat history kept by the entries, None to load all of it"""
+    max_rounds_in_memory = event_body.get(
+        "chatbot_config", {}).get("max_rounds_in_memory")
+    if max_rounds_in_memory is None:
+        return None
+    return int(max_rounds_in_memory)
+
+
 def create_ddb_history_obj(session_id: str, user_id: str, client_type: str, group_name: str, chatbot_id: str) -> DynamoDBChatMessageHistory:
     """Create a DynamoDBChatMessageHistory object
 
@@ -145,7 +154,8 @@ def compose_connect_body(event_body: dict, context: dict):
         group_name=group_name,
         chatbot_id=chatbot_id
     )
-    chat_history = ddb_history_obj.messages_as_langchain
+    chat_history = ddb_history_obj.load_messages_as_langchain(
+        max_rounds=get_max_rounds_in_memory(event_body))
 
     agent_flow_body = {}
     agent_flow_body["query"] = query
@@ -277,7 +287,8 @@ def restapi_event_handler(event_body: dict, context: dict, entry_executor):
 
     ddb_history_obj = create_ddb_history_obj(
         assembled_body["session_id"], assembled_body["user_id"], assembled_body["client_type"], assembled_body["group_name"], assembled_body["chatbot_id"])
-    chat_history = ddb_history_obj.messages_as_langchain
+    chat_history = ddb_history_obj.load_messages_as_langchain(
+        max_rounds=get_max_rounds_in_memory(event_body))
 
     standard_event_body = {
         "query": event_body["query"],
@@ -331,7 +342,8 @@ def default_event_handler(event_body: dict, context: dict, entry_executor):
 
     ddb_history_obj = create_ddb_history_obj(
         assembled_body["session_id"], assembled_body["user_id"], assembled_body["client_type"], assembled_body["group_name"], assembled_body["chatbot_id"])
-    chat_history = ddb_history_obj.messages_as_langchain
+    chat_history = ddb_history_obj.load_messages_as_langchain(
+        max_rounds=get_max_rounds_in_memory(event_body))
 
     event_body["stream"] = context["stream"]
     event_body["chat_history"] = chat_history
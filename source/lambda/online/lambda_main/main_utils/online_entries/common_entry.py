@@ -1,11 +1,16 @@
+import contextvars
 import traceback
 import json
+import math
+import threading
 import uuid
 import re
-from typing import Annotated, Any, TypedDict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Any, Optional, TypedDict, List, Union
 
 from common_logic.common_utils.chatbot_utils import ChatbotManager
 from common_logic.common_utils.constant import (
+    ChatbotMode,
     IndexType,
     LLMTaskType,
     SceneType,
@@ -13,14 +18,17 @@ from common_logic.common_utils.constant import (
     Threshold,
 )
 from common_logic.common_utils.lambda_invoke_utils import (
+    RequestContext,
     is_running_local,
     node_monitor_wrapper,
     send_trace,
+    timed_reducer,
 )
 from langchain_core.messages import ToolMessage, AIMessage
 from common_logic.common_utils.logger_utils import get_logger
 from common_logic.common_utils.prompt_utils import get_prompt_templates_from_ddb
-from common_logic.common_utils.python_utils import add_messages, update_nest_dict
+from common_logic.common_utils.langgraph_utils import AppendOnlyListChannel
+from common_logic.common_utils.python_utils import update_nest_dict
 from common_logic.common_utils.response_utils import process_response
 from common_logic.langchain_integration.tools import ToolManager
 from langchain_core.tools import BaseTool
@@ -33,6 +41,7 @@ from common_logic.common_utils.ddb_utils import custom_index_desc
 from lambda_main.main_utils.parse_config import CommonConfigParser
 from langgraph.graph import END, StateGraph
 from common_logic.langchain_integration.retrievers.retriever import lambda_handler as retrieve_fn
+from common_logic.langchain_integration.retrievers.utils.aos_retrievers import get_similarity_embedding
 from common_logic.common_utils.monitor_utils import (
     format_preprocess_output,
     format_qq_data,
@@ -46,16 +55,26 @@ from common_logic.common_utils.serialization_utils import JSONEncoder
 
 logger = get_logger("common_entry")
 
+# number of messages whose speculative lookups were used or discarded
+speculation_stats = {"used": 0, "discarded": 0}
+
+# Shared by all invocations in a warm container. Lookups abandoned after an
+# early exit keep running here without holding up the response.
+lookup_executor = ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="lookup"
+)
+
 
 class ChatbotState(TypedDict):
+    # The event body, with its ddb history object, the rag tools and the
+    # speculative lookups of intention_detection are kept in the
+    # RequestContext of the invocation, not in the state.
     ########### input/output states ###########
     # inputs
-    # origin event body
-    event_body: dict
     # origianl input question
     query: str
     # chat history between human and agent
-    chat_history: Annotated[list[dict], add_messages]
+    chat_history: Annotated[list[dict], AppendOnlyListChannel]
     # complete chatbot config, consumed by all the nodes
     chatbot_config: dict
     # websocket connection id for the agent
@@ -64,15 +83,16 @@ class ChatbotState(TypedDict):
     stream: bool
     # message id related to original input question
     message_id: str = None
-    # record running states of different nodes
-    trace_infos: Annotated[list[str], add_messages]
+    # record running states of different nodes, None unless
+    # chatbot_config["collect_trace_infos"] is set
+    trace_infos: Optional[list]
     # whether to enbale trace info update via streaming ouput
     enable_trace: bool
     # outputs
     # final answer generated by whole app graph
     answer: Any
     # information needed return to user, e.g. intention, context, figure and so on, anything you can get during execution
-    extra_response: Annotated[dict, update_nest_dict]
+    extra_response: Annotated[dict, timed_reducer(update_nest_dict)]
     # addition kwargs which need to save into ddb
     ddb_additional_kwargs: dict
     # response of entire app
@@ -103,7 +123,7 @@ class ChatbotState(TypedDict):
     # agent_current_output: dict
     # # record messages during agent tool choose and calling, including agent message, tool ouput and error messages
     agent_tool_history: Annotated[List[Union[AIMessage,
-                                             ToolMessage]], add_messages]
+                                             ToolMessage]], AppendOnlyListChannel]
     # # the maximum number that agent node can be called
     # agent_repeated_call_limit: int
     # # the current call time of agent
@@ -120,8 +140,6 @@ class ChatbotState(TypedDict):
     # current_agent_tools_def: list
     last_tool_messages: List[ToolMessage]
     tools: List[BaseTool]
-    # the global rag tool use all knowledge
-    all_knowledge_rag_tool: BaseTool
 
 
 ####################
@@ -129,6 +147,129 @@ class ChatbotState(TypedDict):
 ####################
 
 
+def _submit_lookup(fn, *args, **kwargs):
+    # run in a copy of the current context so that StateContext is visible
+    ctx = contextvars.copy_context()
+    return lookup_executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+def _retrieve_all_knowledge(
+    retriever_params: dict, group_name: str, chatbot_id: str, cancel_event
+):
+    custom_qd_index = custom_index_desc(group_name, chatbot_id)
+    if custom_qd_index or cancel_event.is_set():
+        return custom_qd_index, None
+    return custom_qd_index, retrieve_fn(retriever_params)
+
+
+def _get_lookup_query_keys(chatbot_config: dict):
+    config_names = ["qq_match_config"]
+    if not chatbot_config["agent_config"]["only_use_rag_tool"]:
+        config_names += ["intention_config", "private_knowledge_config"]
+    return {
+        chatbot_config[name].get("retriever_config", {}).get("query_key", "query")
+        for name in config_names
+    }
+
+
+def _dispatch_lookups(state: dict):
+    """Start QQ match, intention and all knowledge lookups together.
+
+    QQ match, intention retrieval and all knowledge retrieval are independent
+    of each other until the threshold decisions in intention_detection.
+    """
+    chatbot_config = state["chatbot_config"]
+    cancel_event = threading.Event()
+    lookups = {
+        "cancel_event": cancel_event,
+        "intention": None,
+        "all_knowledge": None,
+    }
+
+    qq_match_config = chatbot_config["qq_match_config"]
+    lookups["qq_match"] = _submit_lookup(
+        retrieve_fn,
+        {
+            **qq_match_config,
+            "query": state[
+                qq_match_config.get("retriever_config", {}).get("query_key", "query")
+            ],
+        },
+    )
+    if chatbot_config["agent_config"]["only_use_rag_tool"]:
+        return lookups
+
+    intention_config = chatbot_config.get("intention_config", {})
+    query_key = intention_config.get(
+        "retriever_config", {}).get("query_key", "query")
+    lookups["intention"] = _submit_lookup(
+        get_intention_results,
+        state[query_key],
+        {
+            **intention_config,
+        },
+        intent_threshold=intention_config['intent_threshold']
+    )
+
+    private_knowledge_config = chatbot_config["private_knowledge_config"]
+    lookups["all_knowledge"] = _submit_lookup(
+        _retrieve_all_knowledge,
+        {
+            **private_knowledge_config,
+            "query": state[
+                private_knowledge_config.get("retriever_config", {}).get(
+                    "query_key", "query")
+            ],
+        },
+        chatbot_config["group_name"],
+        chatbot_config["chatbot_id"],
+        cancel_event,
+    )
+    return lookups
+
+
+def _cancel_lookups(lookups: dict):
+    lookups["cancel_event"].set()
+    for name in ("qq_match", "intention", "all_knowledge"):
+        if lookups[name] is not None:
+            lookups[name].cancel()
+
+
+def _cosine_similarity(a: list, b: list):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _is_same_query(query: str, query_rewrite: str, chatbot_config: dict):
+    if query == query_rewrite:
+        return True
+    threshold = chatbot_config["query_process_config"][
+        "speculative_lookup_similarity_threshold"]
+    retrievers = chatbot_config["qq_match_config"]["retrievers"] or \
+        chatbot_config["intention_config"]["retrievers"]
+    if threshold is None or not retrievers:
+        return False
+    retriever = retrievers[0]
+    # The embedding of the original query was computed by the speculative
+    # lookups and is served from the embedding cache.
+    try:
+        query_embedding, query_rewrite_embedding = [
+            get_similarity_embedding(
+                q,
+                retriever["embedding_model_endpoint"],
+                retriever["target_model"],
+                retriever.get("model_type", "vector"),
+            )
+            for q in (query, query_rewrite)
+        ]
+    except Exception:
+        logger.error(
+            f"Failed to compare query embeddings:\n{traceback.format_exc()}")
+        return False
+    return _cosine_similarity(query_embedding, query_rewrite_embedding) >= threshold
+
+
 @node_monitor_wrapper
 def query_preprocess(state: ChatbotState):
 
@@ -139,6 +280,18 @@ def query_preprocess(state: ChatbotState):
     #     handler_name="lambda_handler",
     # )
 
+    chatbot_config = state["chatbot_config"]
+    # Start the lookups of intention_detection on the original query while
+    # the query is being rewritten. They are handed over in the
+    # RequestContext, as futures do not belong in the state.
+    speculative_lookups = None
+    if (
+        chatbot_config["query_process_config"]["speculative_lookup"]
+        and chatbot_config["chatbot_mode"] == ChatbotMode.agent
+    ):
+        speculative_lookups = _dispatch_lookups(
+            {**state, "query_rewrite": state["query"]})
+
     query_rewrite_llm_type = state.get(
         "query_rewrite_llm_type", None) or LLMTaskType.CONVERSATION_SUMMARY_TYPE
     output = conversation_query_rewrite(
@@ -152,17 +305,44 @@ def query_preprocess(state: ChatbotState):
 
     preprocess_md = format_preprocess_output(state["query"], output)
     send_trace(f"{preprocess_md}")
+
+    if speculative_lookups is None:
+        return {"query_rewrite": output}
+
+    speculation_used = (
+        "query_rewrite" not in _get_lookup_query_keys(chatbot_config)
+        or _is_same_query(state["query"], output, chatbot_config)
+    )
+    speculation_stats["used" if speculation_used else "discarded"] += 1
+    send_trace(
+        f"speculative lookups {'used' if speculation_used else 'discarded'}, "
+        f"used {speculation_stats['used']} of "
+        f"{speculation_stats['used'] + speculation_stats['discarded']} times "
+        f"in this container",
+        enable_trace=state["enable_trace"],
+    )
+    if not speculation_used:
+        _cancel_lookups(speculative_lookups)
+    else:
+        RequestContext.get_current_context()["speculative_lookups"] = speculative_lookups
     return {"query_rewrite": output}
 
 
 @node_monitor_wrapper
 def intention_detection(state: ChatbotState):
+    # QQ match, intention and all knowledge lookups run concurrently, the
+    # remaining lookups are abandoned once a similar query is found.
+    lookups = (
+        RequestContext.get_current_context().pop("speculative_lookups")
+        or _dispatch_lookups(state)
+    )
     retriever_params = state["chatbot_config"]["qq_match_config"]
-    retriever_params["query"] = state[
-        retriever_params.get("retriever_config", {}).get("query_key", "query")
-    ]
+    only_use_rag_tool = state["chatbot_config"]["agent_config"]["only_use_rag_tool"]
+    if not only_use_rag_tool:
+        intention_config = state["chatbot_config"].get("intention_config", {})
+        all_knowledge_in_agent_threshold = intention_config['all_knowledge_in_agent_threshold']
 
-    output = retrieve_fn(retriever_params)
+    output = lookups["qq_match"].result()
     context_list = []
     qq_match_contexts = []
     qq_match_threshold = retriever_params["qq_match_threshold"]
@@ -170,6 +350,7 @@ def intention_detection(state: ChatbotState):
 
     for doc in output["result"]["docs"]:
         if doc["retrieval_score"] > qq_match_threshold:
+            _cancel_lookups(lookups)
             doc_md = format_qq_data(doc)
             send_trace(
                 f"\n\n**similar query found**\n\n{doc_md}",
@@ -190,26 +371,21 @@ def intention_detection(state: ChatbotState):
             context_list.append(f"问题: {question}, \n答案：{answer}")
             qq_match_contexts.append(doc)
 
-    if state["chatbot_config"]["agent_config"]["only_use_rag_tool"]:
+    if only_use_rag_tool:
         return {
             "qq_match_results": context_list,
             "intent_type": "intention detected"
         }
 
     # get intention results from aos
-    intention_config = state["chatbot_config"].get("intention_config", {})
-    query_key = intention_config.get(
-        "retriever_config", {}).get("query_key", "query")
-    query = state[query_key]
-    intent_threshold = intention_config['intent_threshold']
-    all_knowledge_in_agent_threshold = intention_config['all_knowledge_in_agent_threshold']
-    intent_fewshot_examples, intention_ready = get_intention_results(
-        query,
-        {
-            **intention_config,
-        },
-        intent_threshold=intent_threshold
-    )
+    intent_fewshot_examples, intention_ready = lookups["intention"].result()
+    custom_qd_index = None
+    if intention_ready:
+        # all knowledge is not needed, do not wait for it
+        lookups["cancel_event"].set()
+        lookups["all_knowledge"].cancel()
+    else:
+        custom_qd_index, output = lookups["all_knowledge"].result()
 
     intent_fewshot_tools: list[str] = list(
         set([e["intent"] for e in intent_fewshot_examples])
@@ -217,21 +393,10 @@ def intention_detection(state: ChatbotState):
     all_knowledge_retrieved_list = []
     markdown_table = format_intention_output(intent_fewshot_examples)
 
-    group_name = state["chatbot_config"]["group_name"]
-    chatbot_id = state["chatbot_config"]["chatbot_id"]
-    custom_qd_index = custom_index_desc(group_name, chatbot_id)
-
     # TODO need to modify with new intent logic
     if not intention_ready and not custom_qd_index:
         # if not intention_ready:
         # retrieve all knowledge
-        retriever_params = state["chatbot_config"]["private_knowledge_config"]
-        retriever_params["query"] = state[
-            retriever_params.get("retriever_config", {}).get(
-                "query_key", "query")
-        ]
-        output = retrieve_fn(retriever_params)
-
         info_to_log = []
         all_knowledge_retrieved_list = []
         for doc in output["result"]["docs"]:
@@ -306,7 +471,8 @@ def agent(state: ChatbotState):
                 enable_trace=state["enable_trace"],
             )
 
-        all_knowledge_rag_tool = state["all_knowledge_rag_tool"]
+        all_knowledge_rag_tool = RequestContext.get_current_context()[
+            "all_knowledge_rag_tool"]
         agent_message = AIMessage(content="", tool_calls=[
             ToolCall(
                 id=uuid.uuid4().hex,
@@ -447,7 +613,8 @@ def final_results_preparation(state: ChatbotState):
         answer = re.sub("<thinking>.*?</thinking>",
                         "", answer, flags=re.S).strip()
         state['answer'] = answer
-    app_response = process_response(state["event_body"], state)
+    app_response = process_response(
+        RequestContext.get_current_context()["event_body"], state)
     return {"app_response": app_response}
 
 
@@ -677,7 +844,11 @@ def common_entry(event_body):
     query = event_body["query"]
     use_history = chatbot_config["use_history"]
     max_rounds_in_memory = event_body["chatbot_config"]["max_rounds_in_memory"]
-    chat_history = event_body["chat_history"][:max_rounds_in_memory] if use_history else []
+    # keep the latest rounds, each round is a user and an ai message
+    if use_history and max_rounds_in_memory > 0:
+        chat_history = event_body["chat_history"][-2 * max_rounds_in_memory:]
+    else:
+        chat_history = []
     stream = event_body["stream"]
     message_id = event_body["custom_message_id"]
     ws_connection_id = event_body["ws_connection_id"]
@@ -708,29 +879,36 @@ def common_entry(event_body):
         return_direct=True
     )
 
+    trace_infos = [] if chatbot_config["collect_trace_infos"] else None
+
     # invoke graph and get results
-    response = app.invoke(
-        {
-            "event_body": event_body,
-            "stream": stream,
-            "chatbot_config": chatbot_config,
-            "query": query,
-            "enable_trace": enable_trace,
-            "trace_infos": [],
-            "message_id": message_id,
-            "chat_history": chat_history,
-            "agent_tool_history": [],
-            "ws_connection_id": ws_connection_id,
-            "debug_infos": {},
-            "extra_response": {},
-            "qq_match_results": [],
-            "last_tool_messages": None,
-            "all_knowledge_rag_tool": all_knowledge_rag_tool,
-            "tools": None,
-            "ddb_additional_kwargs": {}
-        },
-        config={"recursion_limit": 20}
-    )
+    with RequestContext(
+        event_body=event_body,
+        all_knowledge_rag_tool=all_knowledge_rag_tool,
+    ) as request_context:
+        response = app.invoke(
+            {
+                "stream": stream,
+                "chatbot_config": chatbot_config,
+                "query": query,
+                "enable_trace": enable_trace,
+                "trace_infos": trace_infos,
+                "message_id": message_id,
+                "chat_history": chat_history,
+                "agent_tool_history": [],
+                "ws_connection_id": ws_connection_id,
+                "extra_response": {},
+                "qq_match_results": [],
+                "last_tool_messages": None,
+                "tools": None,
+                "ddb_additional_kwargs": {}
+            },
+            config={"recursion_limit": 20}
+        )
+    logger.info(
+        f"state merge time: {request_context.total_state_merge_time*1000:.3f} ms")
+    if trace_infos is not None:
+        logger.info(f"trace infos: {trace_infos}")
     # print('extra_response',response['extra_response'])
     return response["app_response"]
 
@@ -0,0 +1,338 @@
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+from common_logic.common_utils import lambda_invoke_utils
+from common_logic.common_utils.constant import ChatbotMode
+from common_logic.common_utils.lambda_invoke_utils import RequestContext, StateContext
+
+# the retriever modules connect to aos when imported, stub them while
+# common_entry is imported
+_retriever_modules = {}
+for _name, _attrs in (
+    ("common_logic.langchain_integration.retrievers.retriever", ["lambda_handler"]),
+    ("common_logic.langchain_integration.retrievers.utils.aos_retrievers",
+     ["get_similarity_embedding"]),
+):
+    _module = types.ModuleType(_name)
+    for _attr in _attrs:
+        setattr(_module, _attr, None)
+    _retriever_modules[_name] = _module
+_saved_modules = {name: sys.modules.get(name) for name in _retriever_modules}
+sys.modules.update(_retriever_modules)
+try:
+    from lambda_main.main_utils.online_entries import common_entry
+finally:
+    for _name, _module in _saved_modules.items():
+        if _module is None:
+            sys.modules.pop(_name, None)
+        else:
+            sys.modules[_name] = _module
+
+LOOKUP_LATENCY = 0.1
+REWRITE_LATENCY = 0.02
+DISPATCH_LOOKUPS = common_entry._dispatch_lookups
+
+
+def make_chatbot_config(only_use_rag_tool=False, query_key="query"):
+    retriever_config = {"query_key": query_key}
+    return {
+        "chatbot_mode": ChatbotMode.agent,
+        "group_name": "Admin",
+        "chatbot_id": "admin",
+        "agent_config": {"only_use_rag_tool": only_use_rag_tool},
+        "query_process_config": {
+            "speculative_lookup": True,
+            "speculative_lookup_similarity_threshold": 0.95,
+        },
+        "qq_match_config": {
+            "lookup": "qq_match",
+            "qq_match_threshold": 0.9,
+            "qq_in_rag_context_threshold": 0.5,
+            "retriever_config": retriever_config,
+            "retrievers": [{
+                "embedding_model_endpoint": "embedding",
+                "target_model": "bce",
+            }],
+        },
+        "intention_config": {
+            "intent_threshold": 0.8,
+            "all_knowledge_in_agent_threshold": 0.5,
+            "retriever_config": retriever_config,
+            "retrievers": [],
+        },
+        "private_knowledge_config": {
+            "lookup": "all_knowledge",
+            "retriever_config": retriever_config,
+        },
+    }
+
+
+def make_state(chatbot_config, query="how to reset the password", query_rewrite=None):
+    return {
+        "chatbot_config": chatbot_config,
+        "query": query,
+        "query_rewrite": query_rewrite or query,
+        "chat_history": [],
+        "message_id": "1",
+        "stream": False,
+        "ws_connection_id": None,
+        "enable_trace": True,
+        "trace_infos": None,
+    }
+
+
+class FakeLookups:
+    """Stub retrievers recording their calls, each takes `latency` seconds"""
+
+    def __init__(self, qq_score=0.6, intention_ready=False, latency=LOOKUP_LATENCY):
+        self.qq_score = qq_score
+        self.intention_ready = intention_ready
+        self.latency = {"qq_match": latency, "intention": latency, "all_knowledge": latency}
+        self.calls = []
+        self.states = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name, query):
+        with self._lock:
+            self.calls.append((name, query))
+        self.states[name] = StateContext.get_current_state()
+        time.sleep(self.latency[name])
+
+    def retrieve(self, params):
+        self._record(params["lookup"], params["query"])
+        if params["lookup"] == "qq_match":
+            return {"result": {"docs": [{
+                "retrieval_score": self.qq_score,
+                "question": "how to reset the password",
+                "answer": "click reset",
+                "source": "faq",
+            }]}}
+        return {"result": {"docs": [
+            {"score": 0.7, "page_content": "reset the password in the console"},
+        ]}}
+
+    def get_intention_results(self, query, intention_config, intent_threshold):
+        self._record("intention", query)
+        examples = [{
+            "query": query, "score": 0.9, "name": "reset-password",
+            "intent": "reset-password", "kwargs": {},
+        }]
+        return examples, self.intention_ready
+
+    def called(self, name):
+        return [query for lookup, query in self.calls if lookup == name]
+
+
+class CommonEntryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.lookups = FakeLookups()
+        self.custom_index_latency = 0
+        self.traces = []
+        for target, attribute, value in (
+            (common_entry, "retrieve_fn", self.lookups.retrieve),
+            (common_entry, "get_intention_results", self.lookups.get_intention_results),
+            (common_entry, "custom_index_desc", self.custom_index_desc),
+            (common_entry, "send_trace", self.send_trace),
+            (lambda_invoke_utils, "send_trace", self.send_trace),
+        ):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def custom_index_desc(self, group_name, chatbot_id):
+        # read from ddb before the all knowledge retrieval
+        time.sleep(self.custom_index_latency)
+        return None
+
+    def send_trace(self, trace_info, *args, **kwargs):
+        self.traces.append(trace_info)
+
+    def wait_for_lookups(self):
+        # abandoned lookups keep running in the shared executor
+        time.sleep(max(self.lookups.latency.values()) + 0.05)
+
+
+class TestIntentionDetection(CommonEntryTestCase):
+    def test_lookups_run_concurrently(self):
+        state = make_state(make_chatbot_config())
+        start = time.perf_counter()
+        with RequestContext():
+            output = common_entry.intention_detection(state)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 2 * LOOKUP_LATENCY)
+        self.assertEqual(output["intent_type"], "intention detected")
+        self.assertEqual(output["intent_fewshot_tools"], ["reset_password"])
+        self.assertEqual(
+            output["all_knowledge_retrieved_list"], ["reset the password in the console"])
+        self.assertEqual(len(output["qq_match_results"]), 1)
+        for name in ("qq_match", "intention", "all_knowledge"):
+            self.assertEqual(self.lookups.called(name), [state["query"]])
+            # the lookup threads see the state of the node
+            self.assertIs(self.lookups.states[name], state)
+
+    def test_only_rag_tool(self):
+        state = make_state(make_chatbot_config(only_use_rag_tool=True))
+        with RequestContext():
+            output = common_entry.intention_detection(state)
+        self.assertEqual(len(output["qq_match_results"]), 1)
+        self.assertEqual([name for name, _ in self.lookups.calls], ["qq_match"])
+
+    def test_similar_query_found(self):
+        self.lookups.qq_score = 0.95
+        self.lookups.latency.update(qq_match=0, intention=0.5)
+        self.custom_index_latency = 0.05
+        state = make_state(make_chatbot_config())
+        start = time.perf_counter()
+        with RequestContext():
+            output = common_entry.intention_detection(state)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(output["answer"], "click reset")
+        self.assertEqual(output["intent_type"], "similar query found")
+        # not held up by the intention lookup
+        self.assertLess(elapsed, 0.3)
+        self.wait_for_lookups()
+        # cancelled before the all knowledge retrieval
+        self.assertEqual(self.lookups.called("all_knowledge"), [])
+
+    def test_intention_ready(self):
+        self.lookups.intention_ready = True
+        self.lookups.latency.update(qq_match=0, intention=0, all_knowledge=0.5)
+        self.custom_index_latency = 0.05
+        state = make_state(make_chatbot_config())
+        start = time.perf_counter()
+        with RequestContext():
+            output = common_entry.intention_detection(state)
+        elapsed = time.perf_counter() - start
+
+        # the all knowledge retrieval is not waited for
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual(output["all_knowledge_retrieved_list"], [])
+        self.assertEqual(output["intent_fewshot_tools"], ["reset_password"])
+        self.wait_for_lookups()
+        self.assertEqual(self.lookups.called("all_knowledge"), [])
+
+
+class TestSpeculativeLookups(CommonEntryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rewrite = None
+        self.embeddings = {}
+        self.dispatched = []
+        for target, attribute, value in (
+            (common_entry, "conversation_query_rewrite", self.conversation_query_rewrite),
+            (common_entry, "get_similarity_embedding", self.get_similarity_embedding),
+            (common_entry, "_dispatch_lookups", self.dispatch_lookups),
+        ):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(common_entry.speculation_stats, used=0, discarded=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def conversation_query_rewrite(self, query, **kwargs):
+        # the speculative lookups start while the llm rewrites the query
+        time.sleep(REWRITE_LATENCY)
+        return self.rewrite or query
+
+    def get_similarity_embedding(self, query, embedding_model_endpoint, target_model, model_type):
+        return self.embeddings[query]
+
+    def dispatch_lookups(self, state):
+        lookups = DISPATCH_LOOKUPS(state)
+        self.dispatched.append((state["query_rewrite"], lookups))
+        return lookups
+
+    def run_nodes(self, query_key="query_rewrite"):
+        state = make_state(make_chatbot_config(query_key=query_key))
+        with RequestContext() as request_context:
+            output = common_entry.query_preprocess(state)
+            self.speculative_lookups = request_context.get("speculative_lookups")
+            state = {**state, **output}
+            output = common_entry.intention_detection(state)
+        self.wait_for_lookups()
+        return state, output
+
+    def assert_trace(self, text):
+        self.assertTrue(
+            any(text in trace for trace in self.traces if isinstance(trace, str)),
+            self.traces,
+        )
+
+    def test_exact_match(self):
+        state, output = self.run_nodes()
+
+        self.assertEqual(output["intent_type"], "intention detected")
+        self.assertIsNotNone(self.speculative_lookups)
+        # the lookups started on the original query are the only ones
+        self.assertEqual([query for query, _ in self.dispatched], [state["query"]])
+        for name in ("qq_match", "intention", "all_knowledge"):
+            self.assertEqual(self.lookups.called(name), [state["query"]])
+        self.assert_trace("speculative lookups used, used 1 of 1 times")
+
+    def test_similar_query_rewrite(self):
+        self.rewrite = "how can I reset the password"
+        self.embeddings = {
+            "how to reset the password": [1.0, 0.1],
+            "how can I reset the password": [1.0, 0.12],
+        }
+        state, output = self.run_nodes()
+
+        self.assertEqual(state["query_rewrite"], self.rewrite)
+        self.assertEqual(output["intent_type"], "intention detected")
+        self.assertEqual(len(self.dispatched), 1)
+        for name in ("qq_match", "intention", "all_knowledge"):
+            self.assertEqual(self.lookups.called(name), [state["query"]])
+        self.assert_trace("speculative lookups used, used 1 of 1 times")
+
+    def test_different_query_rewrite(self):
+        self.rewrite = "how to delete the account"
+        self.embeddings = {
+            "how to reset the password": [1.0, 0.0],
+            "how to delete the account": [0.0, 1.0],
+        }
+        self.custom_index_latency = 0.05
+        state, output = self.run_nodes()
+
+        self.assertIsNone(self.speculative_lookups)
+        self.assertEqual(
+            [query for query, _ in self.dispatched], [state["query"], self.rewrite])
+        speculative = self.dispatched[0][1]
+        self.assertTrue(speculative["cancel_event"].is_set())
+        # started before the rewrite finished, then done again on the
+        # rewritten query
+        for name in ("qq_match", "intention"):
+            self.assertEqual(self.lookups.called(name), [state["query"], self.rewrite])
+        # the speculative all knowledge retrieval was cancelled
+        self.assertEqual(self.lookups.called("all_knowledge"), [self.rewrite])
+        self.assertEqual(output["intent_type"], "intention detected")
+        self.assert_trace("speculative lookups discarded, used 0 of 1 times")
+
+    def test_lookups_on_the_original_query(self):
+        self.rewrite = "how to delete the account"
+        self.run_nodes(query_key="query")
+
+        # the rewritten query is not compared as no lookup uses it
+        self.assertEqual(len(self.dispatched), 1)
+        self.assert_trace("speculative lookups used, used 1 of 1 times")
+
+    def test_stats(self):
+        self.run_nodes()
+        self.rewrite = "how to delete the account"
+        self.embeddings = {
+            "how to reset the password": [1.0, 0.0],
+            "how to delete the account": [0.0, 1.0],
+        }
+        self.run_nodes()
+        self.assertEqual(common_entry.speculation_stats, {"used": 1, "discarded": 1})
+        self.assert_trace("speculative lookups discarded, used 1 of 2 times")
+
+
+if __name__ == "__main__":
+    unittest.main()
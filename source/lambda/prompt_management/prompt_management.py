@@ -58,6 +58,8 @@ def __put_prompt(event, group_name):
             "Prompt": body.get("Prompt"),
             # "LastModifiedBy": email,
             "LastModifiedTime": str(int(time.time())),
+            # version checked by the prompt cache of the online lambdas
+            "UpdateTime": str(time.time_ns()),
         }
     )
     return {"Message": "OK"}